@@ -0,0 +1,86 @@
+# Memory report and equivalence check for the compact penguin frame (common/compact_frame.py).
+#
+# For each size, prints the per-column memory of the frame as loaded and as compacted, checks that
+# the app stages give the same results on both (bitmap-index filtering, count-cube summaries for a
+# spread of selections, groupby summaries, table windows) and times the original isin + groupby path
+# on both frames.
+#
+# Usage (from the repo root):
+#   python python/benchmarks/bench_compact.py --rows 344 1000000 --repeat 5
+import argparse
+import itertools
+import sys
+import timeit
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+
+sys.path.append(str(Path(__file__).resolve().parents[1]))
+from common.bitmap_index import BitmapIndex
+from common.compact_frame import compact_penguins, memory_report
+from common.count_cube import CountCube
+from common.table_pager import TablePager
+from bench_bitmap_index import scaled_penguins, isin_filter
+from bench_count_cube import groupby_summary, subsets
+
+
+def assert_same_values(left, right):
+    '''Frames equal up to dtypes (compact columns hold the same values in narrower types)'''
+    pd.testing.assert_frame_equal(left.astype(object), right.astype(object), check_dtype=False, check_exact=False, rtol=1e-6)
+
+
+def check_equivalence(df, df_compact):
+    index, index_compact = BitmapIndex(df), BitmapIndex(df_compact)
+    cube, cube_compact = CountCube(df), CountCube(df_compact)
+    pager, pager_compact = TablePager(df), TablePager(df_compact)
+    checked = 0
+    for species, island, sex in itertools.product(
+            subsets(['Adelie', 'Gentoo', 'Chinstrap']),
+            subsets(['Torgersen', 'Biscoe', 'Dream']),
+            subsets(['male', 'female', np.nan])):
+        np.testing.assert_array_equal(
+            index.positions(species=species, island=island, sex=sex),
+            index_compact.positions(species=species, island=island, sex=sex))
+        for category in ['species', 'island', 'sex']:
+            assert_same_values(
+                cube.summarize(category, species=species, island=island, sex=sex),
+                cube_compact.summarize(category, species=species, island=island, sex=sex))
+        checked += 1
+    for category in ['species', 'island', 'sex']:
+        assert_same_values(
+            groupby_summary(df, category, ['Adelie', 'Gentoo'], ['Biscoe', 'Dream'], ['male', 'female']),
+            groupby_summary(df_compact, category, ['Adelie', 'Gentoo'], ['Biscoe', 'Dream'], ['male', 'female']))
+    subset = index.take(df, species=['Adelie', 'Gentoo'])
+    subset_compact = index_compact.take(df_compact, species=['Adelie', 'Gentoo'])
+    for sort_column in [None, *df.columns]:
+        for descending in (False, True):
+            assert str(pager.render(subset, sort_column, descending, 5)) == str(pager_compact.render(subset_compact, sort_column, descending, 5)), sort_column
+    return checked
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Memory and speed of the compact penguin frame')
+    parser.add_argument('--rows', type=int, nargs='+', default=[344, 1_000_000])
+    parser.add_argument('--repeat', type=int, default=5)
+    args = parser.parse_args()
+
+    df = scaled_penguins(344)
+    print(f'equivalence: {check_equivalence(df, compact_penguins(df))} selections identical on the compact frame')
+
+    species = ['Adelie', 'Gentoo']
+    island = ['Torgersen', 'Biscoe']
+    sex = ['male', 'female']
+    for n_rows in args.rows:
+        df = scaled_penguins(n_rows)
+        df_compact = compact_penguins(df)
+        print(f'\n{n_rows:,} rows')
+        print(memory_report(df, df_compact).to_string())
+        for name, frame in (('object/float64', df), ('compact', df_compact)):
+            t_isin = min(timeit.repeat(lambda: isin_filter(frame, species, island, sex), number=1, repeat=args.repeat))
+            t_groupby = min(timeit.repeat(lambda: groupby_summary(frame, 'species', species, island, sex), number=1, repeat=args.repeat))
+            print(f'{name:>15}: isin filter {t_isin*1e3:8.2f} ms, isin + groupby summary {t_groupby*1e3:8.2f} ms')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,66 @@
+# Benchmark: df_summarized from the CountCube vs. the original groupby over the filtered frame.
+# Also checks that both give identical frames for every category and a spread of filter selections.
+#
+# Usage (from the repo root):
+#   python python/benchmarks/bench_count_cube.py --rows 1000000 --repeat 5
+import argparse
+import itertools
+import sys
+import timeit
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+
+sys.path.append(str(Path(__file__).resolve().parents[1]))
+from common.count_cube import CountCube
+from bench_bitmap_index import scaled_penguins, isin_filter
+
+
+def groupby_summary(df, category, species, island, sex):
+    return isin_filter(df, species, island, sex).groupby(['year', category], as_index=False, observed=True).count().rename({'body_mass_g':"count"},axis=1)[['year', category, 'count']]
+
+
+def subsets(values):
+    return [list(subset) for r in range(len(values) + 1) for subset in itertools.combinations(values, r)]
+
+
+def check_equivalence(df, cube):
+    checked = 0
+    for category in ['species', 'island', 'sex']:
+        for species, island, sex in itertools.product(
+                subsets(['Adelie', 'Gentoo', 'Chinstrap']),
+                subsets(['Torgersen', 'Biscoe', 'Dream']),
+                subsets(['male', 'female', np.nan])):
+            pd.testing.assert_frame_equal(
+                groupby_summary(df, category, species, island, sex),
+                cube.summarize(category, species=species, island=island, sex=sex))
+            checked += 1
+    return checked
+
+
+def main():
+    parser = argparse.ArgumentParser(description='CountCube vs. groupby for df_summarized')
+    parser.add_argument('--rows', type=int, nargs='+', default=[10_000, 100_000, 1_000_000])
+    parser.add_argument('--repeat', type=int, default=5)
+    args = parser.parse_args()
+
+    df = scaled_penguins(344)
+    print(f'equivalence: {check_equivalence(df, CountCube(df))} selections identical to groupby')
+
+    species = ['Adelie', 'Gentoo']
+    island = ['Torgersen', 'Biscoe']
+    sex = ['male', 'female']
+
+    print(f"{'rows':>12} {'build (s)':>10} {'groupby (ms)':>13} {'cube (ms)':>10} {'speedup':>8}")
+    for n_rows in args.rows:
+        df = scaled_penguins(n_rows)
+        build = timeit.timeit(lambda: CountCube(df), number=1)
+        cube = CountCube(df)
+        t_groupby = min(timeit.repeat(lambda: groupby_summary(df, 'species', species, island, sex), number=1, repeat=args.repeat))
+        t_cube = min(timeit.repeat(lambda: cube.summarize('species', species=species, island=island, sex=sex), number=1, repeat=args.repeat))
+        print(f'{n_rows:>12,} {build:>10.3f} {t_groupby*1e3:>13.2f} {t_cube*1e3:>10.2f} {t_groupby/t_cube:>7.1f}x')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,142 @@
+# Benchmark and equivalence check of the crossfilter engine (common/crossfilter.py).
+#
+# First a random walk of filter changes (sidebar selections, bar chart cell selections, histogram
+# brushes) on the Palmer Penguins frame, scaled up: after every step the incrementally updated chart
+# counts, bar chart summary and passing rows are compared with the same results computed from scratch
+# with pandas.  Any difference fails the run.  Then, on scaled-up frames, a histogram brush is dragged
+# one bin at a time and each move is timed against recounting every chart from scratch.
+#
+# Usage (from the repo root):
+#   python python/benchmarks/bench_crossfilter.py --rows 100000 1000000 --steps 300
+import argparse
+import random
+import sys
+import timeit
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+
+sys.path.append(str(Path(__file__).resolve().parents[1]))
+from common.cell_selection import CellSelection
+from common.count_cube import CountCube
+from common.crossfilter import Crossfilter, CrossfilterIndex
+from common.startup import FILTER_COLUMNS
+from bench_bitmap_index import scaled_penguins
+
+CATEGORY = 'species'
+HISTOGRAM_COLUMNS = ('body_mass_g', 'flipper_length_mm', 'bill_length_mm') # as in the core app
+
+
+def session(index, category=CATEGORY):
+    '''A Crossfilter with the dimensions of the core app'''
+    crossfilter = Crossfilter(index)
+    for column, dimension in index.filters.items():
+        crossfilter.add(column, dimension)
+    for column, dimension in index.histograms.items():
+        crossfilter.add(column, dimension)
+    crossfilter.add('cells', index.cells(category))
+    return crossfilter
+
+
+def expected_masks(df, index, crossfilter, category):
+    '''Per dimension, the rows passing its current filter, computed from the frame'''
+    cube = index.cube
+    masks = {}
+    for column in FILTER_COLUMNS:
+        table = crossfilter.filter_value(column)
+        masks[column] = np.ones(len(df), dtype=bool) if table is None else table[cube.row_codes[column]]
+    for column in HISTOGRAM_COLUMNS:
+        value_range = crossfilter.filter_value(column)
+        values = df[column].to_numpy(dtype=np.float64, na_value=np.nan)
+        masks[column] = np.ones(len(df), dtype=bool) if value_range is None else (values >= value_range[0]) & (values < value_range[1])
+    table = crossfilter.filter_value('cells')
+    masks['cells'] = np.ones(len(df), dtype=bool) if table is None else table[cube.cell_codes(category)]
+    return masks
+
+
+def check_state(df, index, crossfilter, category):
+    masks = expected_masks(df, index, crossfilter, category)
+    everything = np.logical_and.reduce(list(masks.values()))
+    assert np.array_equal(crossfilter.positions(), np.flatnonzero(everything))
+    assert crossfilter.total == everything.sum()
+    for column in HISTOGRAM_COLUMNS:
+        others = np.logical_and.reduce([mask for name, mask in masks.items() if name != column])
+        codes = index.histograms[column].group_codes[others]
+        assert np.array_equal(crossfilter.counts(column), np.bincount(codes[codes >= 0], minlength=index.histograms[column].n_bins)), column
+    others = np.logical_and.reduce([mask for name, mask in masks.items() if name != 'cells'])
+    expected = df[others].groupby(['year', category], as_index=False).count().rename({'body_mass_g': 'count'}, axis=1)[['year', category, 'count']]
+    pd.testing.assert_frame_equal(crossfilter.summary('cells', category), expected)
+
+
+def random_walk(n_rows, steps, seed):
+    '''Random filter changes, every state checked against pandas; returns the number of states checked'''
+    rng = random.Random(seed)
+    df = scaled_penguins(n_rows)
+    cube = CountCube(df)
+    index = CrossfilterIndex(df, cube, HISTOGRAM_COLUMNS)
+    category = CATEGORY
+    crossfilter = session(index, category)
+    selection = CellSelection.for_cube(cube, category)
+    for _ in range(steps):
+        kind = rng.choice(['filter', 'cells', 'brush', 'brush', 'category'])
+        if kind == 'filter':
+            column = rng.choice(FILTER_COLUMNS)
+            levels = [level for level in cube.levels[column] if rng.random() < 0.7]
+            crossfilter.filter(column, cube.level_mask(column, levels))
+        elif kind == 'cells':
+            cells = [(rng.choice(list(selection.values)), rng.choice(list(selection.years))) for _ in range(rng.randrange(3))]
+            selection = selection.replace(cells)
+            crossfilter.filter('cells', selection.lookup() if selection else None)
+        elif kind == 'category':
+            category = rng.choice(FILTER_COLUMNS)
+            crossfilter.add('cells', index.cells(category)) # a new, unfiltered cells dimension
+            selection = CellSelection.for_cube(cube, category)
+        else:
+            column = rng.choice(HISTOGRAM_COLUMNS)
+            dimension = index.histograms[column]
+            if rng.random() < 0.2:
+                crossfilter.filter(column, None)
+            else:
+                first = rng.randrange(dimension.n_bins)
+                crossfilter.filter(column, dimension.bin_range(first, min(first + rng.randrange(8), dimension.n_bins - 1)))
+        check_state(df, index, crossfilter, category)
+    return steps
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Crossfilter: incremental counts vs recounting')
+    parser.add_argument('--rows', type=int, nargs='+', default=[10_000, 100_000, 1_000_000])
+    parser.add_argument('--steps', type=int, default=300, help='steps of the checked random walk')
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args()
+
+    print(f'equivalence: {random_walk(3_000, args.steps, args.seed)} random filter states identical to pandas')
+
+    print(f"{'rows':>12} {'index build (s)':>16} {'brush move (ms)':>16} {'recount (ms)':>13} {'rows moved':>11}")
+    for n_rows in args.rows:
+        df = scaled_penguins(n_rows)
+        start = timeit.default_timer()
+        index = CrossfilterIndex(df, CountCube(df), HISTOGRAM_COLUMNS)
+        build = timeit.default_timer() - start
+        crossfilter = session(index)
+        dimension = index.histograms['body_mass_g']
+        width = 5 # bins under the brush, dragged one bin at a time across the histogram
+        moves = [dimension.bin_range(first, first + width - 1) for first in range(dimension.n_bins - width + 1)]
+        crossfilter.filter('body_mass_g', moves[-1])
+
+        def drag():
+            for value_range in moves:
+                crossfilter.filter('body_mass_g', value_range)
+        t_move = min(timeit.repeat(drag, number=1, repeat=3)) / len(moves)
+
+        def recount():
+            for name in ['cells', *HISTOGRAM_COLUMNS]:
+                crossfilter._recount(name)
+        t_recount = min(timeit.repeat(recount, number=1, repeat=3))
+        moved = np.mean([sum(len(rows) for rows in dimension.changed_rows(old, new)) for old, new in zip(moves, moves[1:])])
+        print(f'{n_rows:>12,} {build:>16.3f} {t_move * 1e3:>16.3f} {t_recount * 1e3:>13.3f} {moved:>11,.0f}')
+
+
+if __name__ == '__main__':
+    main()
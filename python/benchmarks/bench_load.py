@@ -0,0 +1,399 @@
+# Concurrent-session load test of one app worker.
+#
+# Starts an app variant under uvicorn (a single worker process) and, for each session count N, opens N
+# simulated browser sessions over Shiny's websocket protocol.  Every session sends the init message a
+# browser would and then replays a script of user actions in a loop: filter toggles, category
+# switches, table sorts, range slider moves and, in the core app, clicks and box selections on the plot,
+# brushes on the linked histograms (sent as the plotly widgets' own point callbacks) and zooms on the
+# scatter plot (the widget's relayout message).  A session waits for each update to finish before sending the
+# next one (plus an optional random think time), like a user would.  An update has finished when the
+# server flushed its outputs: the first `values` message after the session's busy/idle cycle (Shiny
+# flushes every session whenever any of them ran, so other sessions' activity also sends this one
+# empty `values` messages).  Steps that wouldn't change an input (e.g. checking boxes that are already
+# checked, where the replay started) are skipped, as they cause no busy cycle.
+#
+# Reported per N: p50/p95/p99 update latency, updates per second over all sessions and errors
+# (timeouts, dropped connections, output errors).  Each N runs against a freshly started worker.
+# Everything runs on the local machine: no browser and no network access are needed.
+#
+# Usage (from the repo root):
+#   python python/benchmarks/bench_load.py --app core --sessions 1 10 25 50 --duration 20
+import argparse
+import asyncio
+import base64
+import json
+import os
+import random
+import signal
+import socket
+import statistics
+import subprocess
+import sys
+import time
+from pathlib import Path
+
+import numpy as np
+import websockets
+
+sys.path.append(str(Path(__file__).resolve().parents[1]))
+from common.startup import FILTER_COLUMNS, dataset_metadata
+from bench_startup import APPS
+
+CLICKABLE = {'core'} # apps whose plot handles clicks and selections, and that have the linked histograms
+HISTOGRAMS = ['histogram_body_mass_g', 'histogram_flipper_length_mm', 'histogram_bill_length_mm']
+OUTPUTS = ['chart_title', 'penguin_plot', 'total_rows', 'table_view', 'results', 'hover_info_output',
+           'hover_event_stats', 'click_info_output', 'selection_info_output', *HISTOGRAMS, 'scatter_plot', 'scatter_info', 'download_rows']
+
+
+def free_port():
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        return sock.getsockname()[1]
+
+
+class Server:
+    '''The app under uvicorn with one worker, in its own process group (stopped with everything it started)'''
+
+    def __init__(self, path, port, env=None):
+        self.path = Path(path)
+        self.port = port
+        self.env = env
+        self.proc = None
+
+    def __enter__(self):
+        self.proc = subprocess.Popen(
+            [sys.executable, '-m', 'uvicorn', f'{self.path.stem}:app', '--app-dir', str(self.path.parent),
+             '--host', '127.0.0.1', '--port', str(self.port), '--workers', '1', '--log-level', 'warning'],
+            env=self.env, start_new_session=True)
+        deadline = time.monotonic() + 60
+        while time.monotonic() < deadline:
+            if self.proc.poll() is not None:
+                raise RuntimeError(f'{self.path} exited with status {self.proc.returncode}')
+            try:
+                socket.create_connection(('127.0.0.1', self.port), timeout=1).close()
+                return self
+            except OSError:
+                time.sleep(0.2)
+        self.__exit__()
+        raise RuntimeError(f'{self.path} did not start listening on port {self.port}')
+
+    def __exit__(self, *exc):
+        # uvicorn first, so the app can shut down what it started (render pools), then any leftovers
+        self.proc.terminate()
+        try:
+            self.proc.wait(timeout=15)
+        except subprocess.TimeoutExpired:
+            self.proc.kill()
+            self.proc.wait()
+        try:
+            os.killpg(self.proc.pid, signal.SIGKILL)
+        except ProcessLookupError:
+            pass
+
+
+def initial_inputs(choices, ranges=None):
+    '''Input values of a freshly loaded page: every filter box checked, range sliders (the metadata's
+    [min, max] per column) at full extent, all outputs visible'''
+    inputs = {f'{column}_filter': list(choices[column]) for column in FILTER_COLUMNS}
+    inputs.update({f'{column}_range': list(bounds) for column, bounds in (ranges or {}).items()})
+    inputs.update({
+        'category': 'species',
+        'table_view_sort': '',
+        'table_view_descending': False,
+        'download_rows_format': 'csv',
+        '.clientdata_output_penguin_plot_width': 600,
+        '.clientdata_output_penguin_plot_height': 400,
+        '.clientdata_output_scatter_plot_width': 600,
+        '.clientdata_output_scatter_plot_height': 400,
+        '.clientdata_pixelratio': 1,
+        '.clientdata_url_search': '',
+    })
+    inputs.update({f'.clientdata_output_{output}_hidden': False for output in OUTPUTS})
+    return inputs
+
+
+def points_callback(event_type, points, point_indexes=None):
+    '''The plotly widget's _js2py_pointsCallback state for (trace index, x) points'''
+    return {
+        'event_type': event_type,
+        'points': {
+            'trace_indexes': [trace for trace, _ in points],
+            'point_indexes': point_indexes or [0] * len(points),
+            'xs': [x for _, x in points],
+            'ys': [0] * len(points),
+        },
+        'device_state': {'alt': False, 'ctrl': False, 'meta': False, 'shift': False, 'button': 0, 'buttons': 0},
+        'selector': {'type': 'box', 'selector_state': {'xrange': [0, 1], 'yrange': [0, 1]}} if event_type == 'plotly_selected' else None,
+    }
+
+
+def user_script(choices, clicks, ranges=None):
+    '''(step name, kind, payload) actions a session replays: kind 'input' updates inputs, kind 'plot' sends
+    a points callback of the plot widget, with x values filled in from the session's figure, kind 'brush'
+    a box selection of histogram bins first..last (None: clears the brush), kind 'relayout' a relayout
+    of a widget (zoom / autoscale)'''
+    steps = []
+    for column in FILTER_COLUMNS:
+        steps.append((f'uncheck {column}', 'input', {f'{column}_filter': list(choices[column][1:])}))
+    steps.append(('category island', 'input', {'category': 'island'}))
+    steps.append(('sort table', 'input', {'table_view_sort': 'body_mass_g'}))
+    for column, (low, high) in list((ranges or {}).items())[:2]:
+        steps.append((f'narrow {column}', 'input', {f'{column}_range': [low + (high - low) / 4, high - (high - low) / 4]}))
+    if clicks:
+        steps.append(('click bar', 'plot', ('plotly_click', [(0, 0)])))
+        steps.append(('select bars', 'plot', ('plotly_selected', [(0, 0), (0, 1), (1, 1)])))
+        steps.append(('deselect', 'plot', ('plotly_deselect', [])))
+        steps.append(('brush histogram', 'brush', (HISTOGRAMS[0], 8, 14)))
+        steps.append(('move brush', 'brush', (HISTOGRAMS[0], 10, 16)))
+        steps.append(('brush 2nd histogram', 'brush', (HISTOGRAMS[1], 5, 20)))
+        steps.append(('clear brushes', 'brush', (HISTOGRAMS[0], None, None)))
+        steps.append(('clear 2nd brush', 'brush', (HISTOGRAMS[1], None, None)))
+        if ranges and 'bill_length_mm' in ranges and 'bill_depth_mm' in ranges:
+            zoom = {}
+            for axis, column in (('xaxis', 'bill_length_mm'), ('yaxis', 'bill_depth_mm')):
+                low, high = ranges[column]
+                zoom.update({f'{axis}.range[0]': low + (high - low) * 0.4, f'{axis}.range[1]': low + (high - low) * 0.6})
+            steps.append(('zoom scatter', 'relayout', ('scatter_plot', zoom)))
+            steps.append(('reset scatter', 'relayout', ('scatter_plot', {'xaxis.autorange': True, 'yaxis.autorange': True})))
+    steps.append(('category species', 'input', {'category': 'species'}))
+    for column in FILTER_COLUMNS:
+        steps.append((f'check {column}', 'input', {f'{column}_filter': list(choices[column])}))
+    steps.append(('unsort table', 'input', {'table_view_sort': ''}))
+    for column, bounds in list((ranges or {}).items())[:2]:
+        steps.append((f'widen {column}', 'input', {f'{column}_range': list(bounds)}))
+    return steps
+
+
+def comm_state(comm_message):
+    '''State of a widget comm message, with the binary buffers (plotly's typed arrays) decoded to lists'''
+    data = comm_message['content']['data']
+    state = data.get('state') or {}
+    for path, buffer in zip(data.get('buffer_paths') or [], comm_message.get('buffers') or []):
+        parent = state
+        for key in path[:-2]:
+            parent = parent[key]
+        typed = parent[path[-2]] # {'dtype': ..., 'shape': ...}, the buffer itself was taken out
+        parent[path[-2]] = np.frombuffer(base64.b64decode(buffer), dtype=typed['dtype']).tolist()
+    return state
+
+
+class SessionError(Exception):
+    pass
+
+
+class Session:
+    '''One simulated browser tab'''
+
+    def __init__(self, url, inputs, steps, think, timeout, rng):
+        self.url = url
+        self.inputs = inputs
+        self.steps = steps
+        self.think = think
+        self.timeout = timeout
+        self.rng = rng
+        self.ws = None
+        self.values = dict(inputs) # current input values
+        self.model_id = None # comm id of the plot widget
+        self.model_ids = {} # output id -> comm id, of every widget
+        self.xs = [] # x values of the plot's first trace
+        self.bytes_received = 0 # size of all messages received
+        self.widget_bytes = 0 # size of the plot widget's messages in them
+
+    def _watch(self, message):
+        values = message.get('values') or {}
+        self.model_ids.update({output: value['model_id'] for output, value in values.items() if isinstance(value, dict) and 'model_id' in value})
+        self.model_id = self.model_ids.get('penguin_plot')
+        custom = message.get('custom') or {}
+        self.widget_bytes += sum(len(text) for name, text in custom.items() if name.startswith('shinywidgets_') and isinstance(text, str))
+        comm_message = custom.get('shinywidgets_comm_msg')
+        if comm_message and '_py2js_addTraces' in comm_message:
+            state = comm_state(json.loads(comm_message))
+            traces = (state.get('_py2js_addTraces') or {}).get('trace_data') or []
+            if traces:
+                self.xs = list(traces[0].get('x') or [])
+
+    async def flushed(self):
+        '''Wait for the server to flush the outputs of the last message sent'''
+        busy = idle = False
+        deadline = time.monotonic() + self.timeout
+        while True:
+            try:
+                raw = await asyncio.wait_for(self.ws.recv(), max(deadline - time.monotonic(), 0))
+            except asyncio.TimeoutError:
+                raise SessionError('timeout') from None
+            if not isinstance(raw, str):
+                continue
+            self.bytes_received += len(raw)
+            message = json.loads(raw)
+            self._watch(message)
+            busy |= message.get('busy') == 'busy'
+            idle |= busy and message.get('busy') == 'idle'
+            if message.get('errors'):
+                raise SessionError(f"output errors: {list(message['errors'])}")
+            if 'values' in message and idle:
+                return
+
+    def _update(self, kind, payload):
+        if kind == 'input':
+            if all(self.values.get(name) == value for name, value in payload.items()):
+                return None # nothing would change: skip the step
+            self.values.update(payload)
+            return {'method': 'update', 'data': payload}
+        if kind == 'relayout':
+            output, relayout_data = payload
+            model_id = self.model_ids.get(output)
+            if model_id is None:
+                return None # no widget yet: skip the step
+            comm_message = {'content': {'comm_id': model_id, 'data': {'method': 'update', 'state': {
+                '_js2py_relayout': {'relayout_data': relayout_data, 'source_view_id': 'bench'}}, 'buffer_paths': []}}, 'buffers': []}
+            return {'method': 'update', 'data': {'shinywidgets_comm_send': json.dumps(comm_message)}}
+        if kind == 'brush':
+            output, first, last = payload
+            model_id = self.model_ids.get(output)
+            if model_id is None:
+                return None # no histogram yet: skip the step
+            bins = [] if first is None else list(range(first, last + 1))
+            state = points_callback('plotly_deselect' if first is None else 'plotly_selected', [(0, 0)] * len(bins), bins)
+        else:
+            event_type, points = payload
+            if not self.model_id or len(self.xs) < 2:
+                return None # no plot yet: skip the step
+            model_id = self.model_id
+            state = points_callback(event_type, [(trace, self.xs[i]) for trace, i in points])
+        comm_message = {'content': {'comm_id': model_id, 'data': {'method': 'update', 'state': {'_js2py_pointsCallback': state}, 'buffer_paths': []}}, 'buffers': []}
+        return {'method': 'update', 'data': {'shinywidgets_comm_send': json.dumps(comm_message)}}
+
+    async def connect(self):
+        '''Open the websocket and load the page; returns the init latency'''
+        self.ws = await websockets.connect(self.url, max_size=None, open_timeout=self.timeout)
+        start = time.perf_counter()
+        await self.ws.send(json.dumps({'method': 'init', 'data': self.inputs}))
+        await self.flushed()
+        return time.perf_counter() - start
+
+    async def replay(self, stop_at, latencies):
+        '''Replay the script from a random step until stop_at, appending (step name, seconds) per update'''
+        position = self.rng.randrange(len(self.steps))
+        while time.monotonic() < stop_at:
+            name, kind, payload = self.steps[position % len(self.steps)]
+            position += 1
+            update = self._update(kind, payload)
+            if update is None:
+                continue
+            start = time.perf_counter()
+            await self.ws.send(json.dumps(update))
+            await self.flushed()
+            latencies.append((name, time.perf_counter() - start))
+            if self.think:
+                await asyncio.sleep(self.rng.expovariate(1 / self.think))
+
+    async def close(self):
+        if self.ws is not None:
+            await self.ws.close()
+
+
+def percentiles(seconds):
+    '''p50/p95/p99 and max in ms'''
+    if not seconds:
+        return {'p50_ms': None, 'p95_ms': None, 'p99_ms': None, 'max_ms': None}
+    if len(seconds) == 1:
+        seconds = seconds * 2
+    q = statistics.quantiles(seconds, n=100, method='inclusive')
+    return {'p50_ms': q[49] * 1e3, 'p95_ms': q[94] * 1e3, 'p99_ms': q[98] * 1e3, 'max_ms': max(seconds) * 1e3}
+
+
+async def run_level(url, n_sessions, steps, inputs, args):
+    rng = random.Random(args.seed)
+    sessions = [Session(url, inputs, steps, args.think, args.timeout, random.Random(rng.random())) for _ in range(n_sessions)]
+    errors = []
+
+    async def connect(session):
+        try:
+            return await session.connect()
+        except (SessionError, OSError, websockets.WebSocketException) as e:
+            errors.append(f'connect: {e}')
+
+    # all sessions load the page first (at most --connect-batch at a time), then the clock starts
+    init_latencies = []
+    for i in range(0, n_sessions, args.connect_batch):
+        init_latencies += await asyncio.gather(*(connect(session) for session in sessions[i:i + args.connect_batch]))
+    connected = [session for session, latency in zip(sessions, init_latencies) if latency is not None]
+
+    latencies = []
+    async def replay(session):
+        try:
+            await session.replay(stop_at, latencies)
+        except (SessionError, websockets.WebSocketException) as e:
+            errors.append(f'replay: {e}')
+
+    start = time.monotonic()
+    stop_at = start + args.duration
+    await asyncio.gather(*(replay(session) for session in connected))
+    elapsed = time.monotonic() - start
+    await asyncio.gather(*(session.close() for session in sessions), return_exceptions=True)
+
+    by_step = {}
+    for name, seconds in latencies:
+        by_step.setdefault(name, []).append(seconds)
+    return {
+        'sessions': n_sessions,
+        'connected': len(connected),
+        'updates': len(latencies),
+        'throughput': len(latencies) / elapsed,
+        'errors': len(errors),
+        'error_samples': sorted(set(errors))[:5],
+        'init': percentiles([latency for latency in init_latencies if latency is not None]),
+        **percentiles([seconds for _, seconds in latencies]),
+        'steps': {name: percentiles(seconds) for name, seconds in by_step.items()},
+    }
+
+
+def format_ms(value):
+    return f'{value:>8.1f}' if value is not None else f"{'-':>8}"
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Concurrent simulated sessions against one app worker')
+    parser.add_argument('--app', choices=list(APPS), default='core')
+    parser.add_argument('--sessions', type=int, nargs='+', default=[1, 5, 10, 25, 50])
+    parser.add_argument('--duration', type=float, default=15, help='seconds of replay per session count')
+    parser.add_argument('--think', type=float, default=0.5, help='mean think time between a session\'s updates, seconds (0: none)')
+    parser.add_argument('--timeout', type=float, default=30, help='seconds an update may take before it counts as an error')
+    parser.add_argument('--connect-batch', type=int, default=10, help='sessions loading the page at the same time')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--steps', action='store_true', help='also report the latency of every script step')
+    parser.add_argument('--json', action='store_true', help='print the report as JSON')
+    args = parser.parse_args()
+
+    metadata = dataset_metadata()
+    choices = metadata['choices']
+    ranges = metadata['ranges'] # every app has the range sliders
+    steps = user_script(choices, clicks=args.app in CLICKABLE, ranges=ranges)
+    inputs = initial_inputs(choices, ranges)
+    env = dict(os.environ, MPLBACKEND='Agg')
+    # one slider value per step: emitted at once, else its debounced emit would end the next step's wait
+    env.setdefault('PENGUIN_RANGE_THROTTLE', '0')
+
+    report = []
+    for n_sessions in args.sessions:
+        port = free_port()
+        with Server(APPS[args.app], port, env):
+            report.append(asyncio.run(run_level(f'ws://127.0.0.1:{port}/websocket/', n_sessions, steps, inputs, args)))
+        if not args.json:
+            entry = report[-1]
+            if len(report) == 1:
+                print(f"{'sessions':>8} {'updates':>8} {'upd/s':>8} {'p50 ms':>8} {'p95 ms':>8} {'p99 ms':>8} {'max ms':>8} {'init p95':>8} {'errors':>7}")
+            print(f"{n_sessions:>8} {entry['updates']:>8} {entry['throughput']:>8.1f} {format_ms(entry['p50_ms'])} {format_ms(entry['p95_ms'])} "
+                  f"{format_ms(entry['p99_ms'])} {format_ms(entry['max_ms'])} {format_ms(entry['init']['p95_ms'])} {entry['errors']:>7}")
+            for sample in entry['error_samples']:
+                print(f"{'':>8} {sample}")
+            if args.steps:
+                for name, step in entry['steps'].items():
+                    print(f"{'':>8} {name:>17} p50 {format_ms(step['p50_ms'])} p95 {format_ms(step['p95_ms'])}")
+
+    if args.json:
+        print(json.dumps({'app': args.app, 'duration': args.duration, 'think': args.think, 'results': report}, indent=2))
+
+
+if __name__ == '__main__':
+    main()
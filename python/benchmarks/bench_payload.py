@@ -0,0 +1,86 @@
+# Bytes sent to the browser per interaction, plotly payload modes compared (common/plotly_payload.py).
+#
+# Starts a plotly app variant once per PENGUIN_PLOTLY_PAYLOAD mode and replays the load test's user
+# script (bench_load.py) in one simulated session, in order.  For the page load and every step it
+# reports the size of the plot widget's messages (figure creation and updates) and of everything the
+# session received.  The figures are also checked to show the same bars in every mode.
+#
+# Usage (from the repo root):
+#   python python/benchmarks/bench_payload.py --app core express
+import argparse
+import asyncio
+import json
+import os
+import random
+import sys
+from pathlib import Path
+
+sys.path.append(str(Path(__file__).resolve().parents[1]))
+from common.plotly_payload import PAYLOAD_MODES
+from common.startup import dataset_metadata
+from bench_load import CLICKABLE, Server, Session, free_port, initial_inputs, user_script
+from bench_startup import APPS
+
+PLOTLY_APPS = [name for name in APPS if name != 'plotnine']
+
+
+async def step_sizes(url, inputs, steps, timeout):
+    '''[(step name, widget bytes, all bytes, x values of the first trace)] for page load and each step'''
+    session = Session(url, inputs, steps, think=0, timeout=timeout, rng=random.Random(0))
+    sizes = []
+
+    def measured(name):
+        sizes.append((name, session.widget_bytes, session.bytes_received, list(session.xs)))
+        session.widget_bytes = session.bytes_received = 0
+
+    await session.connect()
+    measured('page load')
+    for name, kind, payload in steps:
+        update = session._update(kind, payload)
+        if update is None:
+            continue
+        await session.ws.send(json.dumps(update))
+        await session.flushed()
+        measured(name)
+    await session.close()
+    return sizes
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Plot payload sizes per interaction, per PENGUIN_PLOTLY_PAYLOAD mode')
+    parser.add_argument('--app', nargs='+', choices=PLOTLY_APPS, default=PLOTLY_APPS)
+    parser.add_argument('--timeout', type=float, default=30)
+    args = parser.parse_args()
+
+    choices = dataset_metadata()['choices']
+    inputs = initial_inputs(choices)
+    for app in args.app:
+        steps = user_script(choices, clicks=app in CLICKABLE)
+        results = {}
+        for mode in PAYLOAD_MODES:
+            port = free_port()
+            env = dict(os.environ, PENGUIN_PLOTLY_PAYLOAD=mode)
+            with Server(APPS[app], port, env):
+                results[mode] = asyncio.run(step_sizes(f'ws://127.0.0.1:{port}/websocket/', inputs, steps, args.timeout))
+
+        reference = results[PAYLOAD_MODES[0]]
+        for mode, sizes in results.items():
+            if [(name, xs) for name, _, _, xs in sizes] != [(name, xs) for name, _, _, xs in reference]:
+                sys.exit(f'{app}: the {mode} figures differ from the {PAYLOAD_MODES[0]} ones')
+
+        print(f'{app}: plot widget bytes (all message bytes) per step')
+        print(f"{'step':>18} " + ' '.join(f'{mode:>18}' for mode in results))
+        totals = {mode: [0, 0] for mode in results}
+        for i, (name, *_) in enumerate(reference):
+            cells = []
+            for mode, sizes in results.items():
+                _, widget, received, _ = sizes[i]
+                totals[mode][0] += widget
+                totals[mode][1] += received
+                cells.append(f'{f"{widget:,} ({received:,})":>18}')
+            print(f'{name:>18} ' + ' '.join(cells))
+        print(f"{'total':>18} " + ' '.join(f'{f"{widget:,} ({received:,})":>18}' for widget, received in totals.values()))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,126 @@
+# Equivalence check and benchmark of the query backends (common/query_backend.py).
+#
+# This script is the backends' equivalence suite (the repo has no test runner): run it with --check
+# whenever a backend, the bitmap index, the count cube or the table pager changes, so the backends
+# can't drift apart.  The pandas backend (bitmap index + count cube) is the reference.  Every other
+# backend is checked against it on the Palmer Penguins frame, plain and compact, and on the same frame
+# after a live append: filtered rows, row counts, table windows for every sort column and direction,
+# segment selections and the summaries for every category and combination of filter selections.  Any
+# difference fails the run (exit status 1).  Without --check, the app's per-change work is then timed
+# on scaled-up frames: filter + row count + one table window, and one summary.
+#
+# Usage (from the repo root):
+#   python python/benchmarks/bench_query_backends.py --check
+#   python python/benchmarks/bench_query_backends.py --rows 100000 1000000 --repeat 5
+import argparse
+import itertools
+import sys
+import timeit
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+
+sys.path.append(str(Path(__file__).resolve().parents[1]))
+from common.bitmap_index import BitmapIndex
+from common.cell_selection import CellSelection
+from common.compact_frame import compact_penguins
+from common.count_cube import CountCube
+from common.live_ingest import conform
+from common.query_backend import BACKENDS, HAVE_DUCKDB, PandasBackend, query_backend
+from common.synthetic import generate_penguins
+from common.table_pager import TablePager
+from bench_bitmap_index import scaled_penguins
+from bench_count_cube import subsets
+
+SPECIES = ['Adelie', 'Gentoo', 'Chinstrap']
+ISLAND = ['Torgersen', 'Biscoe', 'Dream']
+SEX = ['male', 'female', np.nan]
+CELLS = [('Adelie', 2007), ('Gentoo', 2009), ('Chinstrap', 2008)]
+
+
+def reference(df):
+    return PandasBackend(df, BitmapIndex(df), CountCube(df)), TablePager(df, window_size=25)
+
+
+def check_backend(name, df, expected, pager):
+    '''Number of results of backend `name` over df compared with the reference backend'''
+    backend = query_backend(df, name=name)
+    checked = 0
+    for species, island, sex in itertools.product(subsets(SPECIES), subsets(ISLAND), subsets(SEX)):
+        selections = {'species': species, 'island': island, 'sex': sex}
+        for category in ['species', 'island', 'sex']:
+            pd.testing.assert_frame_equal(backend.summarize(category, **selections), expected.summarize(category, **selections))
+            checked += 1
+        expected_rows, rows = expected.filter(**selections), backend.filter(**selections)
+        pd.testing.assert_frame_equal(backend.materialize(rows), expected_rows)
+        assert len(rows) == len(expected_rows)
+        checked += 2
+        if len(species) == 2 and len(island) >= 2: # table windows and segment selections for a spread of filters
+            selection = CellSelection.for_cube(expected.cube, 'species').union(CELLS)
+            pd.testing.assert_frame_equal(backend.materialize(backend.select_cells(rows, selection)), expected.select_cells(expected_rows, selection))
+            checked += 1
+            for sort_column, descending, offset in itertools.product([None, *df.columns], [False, True], [0, 40]):
+                pd.testing.assert_frame_equal(pager.window(rows, offset, sort_column, descending), pager.window(expected_rows, offset, sort_column, descending))
+                checked += 1
+    return checked
+
+
+def check_equivalence(name):
+    df = scaled_penguins(344)
+    batch = generate_penguins(60, seed=3)
+    batch.loc[::7, 'species'] = 'Emperor' # a value the frame hasn't seen
+    checked = 0
+    for frame in (df, compact_penguins(df)):
+        expected, pager = reference(frame)
+        checked += check_backend(name, frame, expected, pager)
+
+        # live append: the appended backend against a reference built from scratch on the longer frame
+        frame, batch_rows = conform(batch, frame)
+        appended = pd.concat([frame, batch_rows], ignore_index=True)
+        backend = query_backend(frame, name=name).appended(batch_rows, appended)
+        expected, pager = reference(appended)
+        rows = backend.filter(species=SPECIES + ['Emperor'], island=ISLAND, sex=SEX)
+        pd.testing.assert_frame_equal(backend.materialize(rows), expected.filter(species=SPECIES + ['Emperor'], island=ISLAND, sex=SEX))
+        pd.testing.assert_frame_equal(backend.summarize('species', species=SPECIES + ['Emperor'], island=ISLAND, sex=SEX),
+                                      expected.summarize('species', species=SPECIES + ['Emperor'], island=ISLAND, sex=SEX))
+        checked += 2
+    return checked
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Query backends: equivalence with pandas and timings')
+    parser.add_argument('--backends', nargs='+', choices=[name for name in BACKENDS if name != 'pandas'], default=['duckdb'])
+    parser.add_argument('--rows', type=int, nargs='+', default=[10_000, 100_000, 1_000_000])
+    parser.add_argument('--repeat', type=int, default=5)
+    parser.add_argument('--check', action='store_true', help='only check the backends against pandas, no timings')
+    args = parser.parse_args()
+    if 'duckdb' in args.backends and not HAVE_DUCKDB:
+        sys.exit('duckdb is not installed (pip install duckdb)')
+
+    for name in args.backends:
+        print(f'equivalence: {check_equivalence(name)} {name} results identical to pandas')
+    if args.check:
+        return
+
+    # Same shape of selection the UI sends: everything but one species and one island checked
+    selections = {'species': ['Adelie', 'Gentoo'], 'island': ['Torgersen', 'Biscoe'], 'sex': ['male', 'female']}
+    print(f"{'rows':>12} {'backend':>8} {'build (s)':>10} {'filter+table (ms)':>18} {'summarize (ms)':>15}")
+    for n_rows in args.rows:
+        df = scaled_penguins(n_rows)
+        pager = TablePager(df)
+        for name in ['pandas', *args.backends]:
+            start = timeit.default_timer()
+            backend = query_backend(df, BitmapIndex(df), CountCube(df), name=name) if name == 'pandas' else query_backend(df, name=name)
+            build = timeit.default_timer() - start
+
+            def filter_and_table():
+                rows = backend.filter(**selections)
+                return len(rows), pager.window(rows, 1000, 'bill_length_mm')
+            t_filter = min(timeit.repeat(filter_and_table, number=1, repeat=args.repeat))
+            t_summarize = min(timeit.repeat(lambda: backend.summarize('species', **selections), number=1, repeat=args.repeat))
+            print(f'{n_rows:>12,} {name:>8} {build:>10.3f} {t_filter*1e3:>18.2f} {t_summarize*1e3:>15.2f}')
+
+
+if __name__ == '__main__':
+    main()
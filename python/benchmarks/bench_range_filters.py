@@ -0,0 +1,177 @@
+# Benchmark and equivalence check of the range slider filters (common/range_index.py).
+#
+# First random range filters (one to all range columns narrowed, combined with random sidebar
+# selections) on the Palmer Penguins frame, plain and compact, and after a live append: the pandas
+# backend's filtered rows and summaries are compared with boolean masks and groupby on the frame, and
+# so are the duckdb backend's when duckdb is installed.  The same ranges (bounds on a slider step, as
+# the table shows the values) must select the same rows on the plain and the compact frame, whose range columns are
+# float32, for both backends and the crossfilter's range dimensions.  Any difference fails the run.  Then, on
+# scaled-up frames, the filtered row positions are timed against masks (a full-column comparison per
+# range and the bitmap index's mask), for narrow ranges (answered from the presorted index) and wide
+# ones (where the index falls back to comparisons).
+#
+# Usage (from the repo root):
+#   python python/benchmarks/bench_range_filters.py --rows 100000 1000000 --states 200
+import argparse
+import random
+import sys
+import timeit
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+
+sys.path.append(str(Path(__file__).resolve().parents[1]))
+from common.bitmap_index import BitmapIndex
+from common.compact_frame import compact_penguins
+from common.count_cube import CountCube
+from common.crossfilter import Crossfilter, CrossfilterIndex
+from common.live_ingest import conform
+from common.query_backend import HAVE_DUCKDB, PandasBackend, query_backend
+from common.range_index import RangeIndex, value_type
+from common.startup import FILTER_COLUMNS, RANGE_COLUMNS
+from common.synthetic import generate_penguins
+from common.table_pager import TablePager
+from bench_bitmap_index import scaled_penguins
+
+
+def random_state(df, rng):
+    '''Random sidebar selections and {column: (lo, hi)} ranges, the bounds often on actual values'''
+    selections = {column: [value for value in df[column].unique() if rng.random() < 0.8] for column in FILTER_COLUMNS}
+    ranges = {}
+    for column in rng.sample(RANGE_COLUMNS, rng.randint(1, len(RANGE_COLUMNS))):
+        values = df[column].dropna().to_numpy(dtype=np.float64)
+        lo, hi = sorted(rng.choice(values) if rng.random() < 0.5 else rng.uniform(values.min(), values.max()) for _ in range(2))
+        ranges[column] = (float(lo), float(hi))
+    return selections, ranges
+
+
+def expected_mask(df, selections, ranges):
+    mask = np.logical_and.reduce([df[column].isin(values).to_numpy() for column, values in selections.items()])
+    for column, (lo, hi) in ranges.items():
+        to_type = value_type(df[column].dtype) # a compact frame's float32 compared with float32 bounds
+        values = df[column].to_numpy(dtype=to_type, na_value=np.nan)
+        mask &= (values >= to_type(lo)) & (values <= to_type(hi))
+    return mask
+
+
+def check_frame(df, backends, states, rng):
+    '''Number of filter and summary results of the backends compared with masks over df'''
+    checked = 0
+    for _ in range(states):
+        selections, ranges = random_state(df, rng)
+        expected = df[expected_mask(df, selections, ranges)]
+        for backend in backends:
+            pd.testing.assert_frame_equal(backend.materialize(backend.filter(ranges, **selections)), expected)
+            for category in FILTER_COLUMNS:
+                summary = expected.groupby(['year', category], as_index=False, observed=True).count().rename({'body_mass_g': 'count'}, axis=1)[['year', category, 'count']]
+                pd.testing.assert_frame_equal(backend.summarize(category, ranges, **selections), summary.reset_index(drop=True))
+            checked += 1 + len(FILTER_COLUMNS)
+    return checked
+
+
+def pandas_backend(df):
+    return PandasBackend(df, BitmapIndex(df), CountCube(df), RangeIndex(df, TablePager(df)))
+
+
+def crossfilter_positions(index, selections, ranges):
+    '''Rows passing the selections and ranges through the crossfilter, as the core app filters them'''
+    crossfilter = Crossfilter(index)
+    for column, dimension in [*index.filters.items(), *index.ranges.items()]:
+        crossfilter.add(column, dimension)
+    for column, values in selections.items():
+        crossfilter.filter(column, index.cube.level_mask(column, values))
+    for column, value_range in ranges.items():
+        crossfilter.filter(column, index.ranges[column].closed(value_range))
+    return crossfilter.positions()
+
+
+def check_compact(states, rng):
+    '''Number of range filters selecting the same rows on the plain and the compact frame'''
+    plain = scaled_penguins(344)
+    frames = (plain, compact_penguins(plain))
+    engines = []
+    for frame in frames:
+        engines.append(lambda selections, ranges, backend=pandas_backend(frame): backend.materialize(backend.filter(ranges, **selections)).index.to_numpy())
+        if HAVE_DUCKDB:
+            engines.append(lambda selections, ranges, backend=query_backend(frame, name='duckdb'): backend.materialize(backend.filter(ranges, **selections)).index.to_numpy())
+        index = CrossfilterIndex(frame, CountCube(frame), (), RANGE_COLUMNS)
+        engines.append(lambda selections, ranges, index=index: crossfilter_positions(index, selections, ranges))
+    checked = 0
+    for _ in range(states):
+        selections, ranges = random_state(plain, rng)
+        # bounds as a slider sends them: on its step, no finer than the data's 0.1 (as the table shows the values)
+        ranges = {column: (round(lo, 1), round(hi, 1)) for column, (lo, hi) in ranges.items()}
+        expected = np.flatnonzero(expected_mask(plain, selections, ranges))
+        for engine in engines:
+            assert np.array_equal(engine(selections, ranges), expected), ranges
+            checked += 1
+    return checked
+
+
+def check_equivalence(states, seed):
+    rng = random.Random(seed)
+    batch = generate_penguins(60, seed=3)
+    checked = 0
+    for frame in (scaled_penguins(344), compact_penguins(scaled_penguins(344))):
+        backends = [pandas_backend(frame)] + ([query_backend(frame, name='duckdb')] if HAVE_DUCKDB else [])
+        checked += check_frame(frame, backends, states, rng)
+
+        # live append: every structure appended, not rebuilt
+        frame, batch_rows = conform(batch, frame)
+        appended = pd.concat([frame, batch_rows], ignore_index=True)
+        index, cube, pager = BitmapIndex(frame).appended(batch_rows), CountCube(frame).appended(batch_rows), TablePager(frame).appended(appended)
+        ranges = RangeIndex(frame, TablePager(frame)).appended(appended, pager)
+        backends = [PandasBackend(frame).appended(batch_rows, appended, index, cube, ranges)]
+        if HAVE_DUCKDB:
+            backends.append(query_backend(frame, name='duckdb').appended(batch_rows, appended))
+        checked += check_frame(appended, backends, states // 4, rng)
+    return checked + check_compact(states, rng)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Range filters: presorted indexes vs masks')
+    parser.add_argument('--rows', type=int, nargs='+', default=[10_000, 100_000, 1_000_000])
+    parser.add_argument('--states', type=int, default=200, help='random filter states checked per frame')
+    parser.add_argument('--repeat', type=int, default=5)
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args()
+
+    backends = 'pandas and duckdb' if HAVE_DUCKDB else 'pandas (duckdb not installed)'
+    print(f'equivalence: {check_equivalence(args.states, args.seed)} {backends} results identical to masks over the frame')
+
+    # Ranges around the middle of each column, a share `width` of its extent; the sidebar filters as the UI sends them
+    selections = {'species': ['Adelie', 'Gentoo'], 'island': ['Torgersen', 'Biscoe'], 'sex': ['male', 'female']}
+    print(f"{'rows':>12} {'ranges':>7} {'width':>6} {'build (s)':>10} {'mask (ms)':>10} {'index (ms)':>11} {'rows out':>9}")
+    for n_rows in args.rows:
+        df = scaled_penguins(n_rows)
+        bitmap_index = BitmapIndex(df)
+        pager = TablePager(df)
+        start = timeit.default_timer()
+        range_index = RangeIndex(df, pager)
+        build = timeit.default_timer() - start
+        columns = {column: df[column].to_numpy(dtype=np.float64, na_value=np.nan) for column in RANGE_COLUMNS}
+        for n_ranges, width in ((1, 0.02), (len(RANGE_COLUMNS), 0.02), (1, 0.5), (len(RANGE_COLUMNS), 0.5)):
+            ranges = {}
+            for column in RANGE_COLUMNS[:n_ranges]:
+                low, high = np.nanmin(columns[column]), np.nanmax(columns[column])
+                middle = (low + high) / 2
+                ranges[column] = (middle - (high - low) * width / 2, middle + (high - low) * width / 2)
+
+            def with_masks():
+                mask = bitmap_index.mask(**selections)
+                for column, (lo, hi) in ranges.items():
+                    mask &= (columns[column] >= lo) & (columns[column] <= hi)
+                return np.flatnonzero(mask)
+
+            def with_index():
+                return range_index.positions(ranges, bitmap_index.packed(**selections))
+            positions = with_index()
+            assert np.array_equal(with_masks(), positions)
+            t_mask = min(timeit.repeat(with_masks, number=1, repeat=args.repeat))
+            t_index = min(timeit.repeat(with_index, number=1, repeat=args.repeat))
+            print(f'{n_rows:>12,} {n_ranges:>7} {width:>6.0%} {build:>10.3f} {t_mask * 1e3:>10.2f} {t_index * 1e3:>11.2f} {len(positions):>9,}')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,168 @@
+# Reactive-latency benchmark suite for the three app variants, without a browser.
+#
+# For each dataset size, writes a synthetic penguin dataset (common/synthetic.py), points the shared
+# data source at it and imports each app module.  It then times the module-level stage functions
+# behind the reactive calcs and render functions (filtering, segment selection, summarizing, figure
+# construction / rasterization, table window rendering) and writes the results as JSON so runs can be
+# compared over time.  shinywidgets only allows FigureWidgets inside a live session, so the plotly
+# figure stages time building the go.Figure plus its JSON serialization (what the widget sends).
+#
+# Usage (from the repo root):
+#   python python/benchmarks/bench_reactive.py --rows 10000 100000 1000000 --out bench.json
+import argparse
+import datetime
+import importlib.util
+import io
+import json
+import os
+import platform
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+os.environ.setdefault('MPLBACKEND', 'Agg')
+PYTHON_DIR = Path(__file__).resolve().parents[1]
+sys.path.append(str(PYTHON_DIR))
+from common import data_source
+from common.cell_selection import CellSelection
+from common.plot_render import penguin_ggplot
+from common.synthetic import write_penguins
+
+APPS = {
+    'core': PYTHON_DIR / 'plotly' / 'core' / 'app.py',
+    'express': PYTHON_DIR / 'plotly' / 'express' / 'app.py',
+    'plotnine': PYTHON_DIR / 'plotnine' / 'app.py',
+}
+
+# Same shape of selection the UI sends: everything but one species and one island checked
+SPECIES = ['Adelie', 'Gentoo']
+ISLAND = ['Torgersen', 'Biscoe']
+SEX = ['male', 'female']
+CATEGORY = 'species'
+# Three selected chart segments, (category value, year) cells of the core app's CellSelection
+SELECTED_CELLS = [('Adelie', 2007), ('Adelie', 2008), ('Gentoo', 2009)]
+
+
+def import_app(name, path):
+    spec = importlib.util.spec_from_file_location(f'bench_app_{name}', path)
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+
+def time_call(fn, repeat):
+    times = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn()
+        times.append(time.perf_counter() - start)
+    return {'min_ms': min(times) * 1e3, 'median_ms': statistics.median(times) * 1e3, 'repeat': repeat}
+
+
+def core_stages(app):
+    import plotly.graph_objects as go
+    df_filtered = app.filter_penguins(SPECIES, ISLAND, SEX)
+    df_plot = app.summarize_penguins(CATEGORY, SPECIES, ISLAND, SEX)
+    selection = CellSelection.for_cube(app.penguin_cube.get(), CATEGORY).union(SELECTED_CELLS)
+
+    def figure_build():
+        bar_columns, bar_values = app.bar_traces(df_plot, CATEGORY)
+        fig = go.Figure([go.Bar(name=segment, x=bar_columns, y=y, customdata=[CATEGORY]) for segment, y in bar_values.items()])
+        fig.to_json()
+        return fig
+
+    fig = figure_build()
+    def figure_patch():
+        bar_columns, bar_values = app.bar_traces(df_plot, CATEGORY)
+        with fig.batch_update():
+            for trace in fig.data:
+                trace.y = [value + 1 for value in bar_values[trace.name]] # force a real change
+
+    return {
+        'df_filtered_stage1': lambda: app.filter_penguins(SPECIES, ISLAND, SEX),
+        'df_filtered_stage2': lambda: app.select_segments(df_filtered, selection),
+        'df_summarized': lambda: app.summarize_penguins(CATEGORY, SPECIES, ISLAND, SEX),
+        'penguin_plot_build': figure_build,
+        'penguin_plot_patch': figure_patch,
+        'table_view': lambda: app.table_pager.render(df_filtered, sort_column='body_mass_g', offset=len(df_filtered) // 2),
+    }
+
+
+def express_stages(app):
+    df_filtered = app.filter_penguins(SPECIES, ISLAND, SEX)
+    df_plot = app.summarize_penguins(CATEGORY, SPECIES, ISLAND, SEX)
+    return {
+        'df_filtered_stage1': lambda: app.filter_penguins(SPECIES, ISLAND, SEX),
+        'df_summarized': lambda: app.summarize_penguins(CATEGORY, SPECIES, ISLAND, SEX),
+        'penguin_plot_build': lambda: app.penguin_figure(df_plot, CATEGORY).to_json(),
+        'table_view': lambda: app.table_pager.render(df_filtered, sort_column='body_mass_g', offset=len(df_filtered) // 2),
+    }
+
+
+def plotnine_stages(app):
+    app.plot_renderer.wait_ready() # the render pool starts with the app: not warming up while stages are timed
+    df_filtered = app.filter_penguins(SPECIES, ISLAND, SEX)
+
+    def figure_render():
+        fig = penguin_ggplot(df_filtered, CATEGORY).draw()
+        fig.savefig(io.BytesIO(), format='png')
+        import matplotlib.pyplot as plt
+        plt.close(fig)
+
+    return {
+        'df_filtered': lambda: app.filter_penguins(SPECIES, ISLAND, SEX),
+        'penguin_plot_render': figure_render,
+        'table_view': lambda: app.table_pager.render(df_filtered, sort_column='body_mass_g', offset=len(df_filtered) // 2),
+    }
+
+
+STAGES = {'core': core_stages, 'express': express_stages, 'plotnine': plotnine_stages}
+
+
+def git_commit():
+    try:
+        return subprocess.run(['git', 'rev-parse', 'HEAD'], cwd=PYTHON_DIR, capture_output=True, text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Time the reactive stages of every app variant on synthetic data')
+    parser.add_argument('--rows', type=int, nargs='+', default=[10_000, 100_000, 1_000_000])
+    parser.add_argument('--apps', nargs='+', choices=list(APPS), default=list(APPS))
+    parser.add_argument('--repeat', type=int, default=5)
+    parser.add_argument('--out', help='write the JSON report here instead of stdout')
+    args = parser.parse_args()
+
+    results = []
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        for n_rows in args.rows:
+            path = write_penguins(Path(tmp_dir) / f'penguins-{n_rows}.arrow', n_rows)
+            data_source.penguin_source = data_source.DataSource(path)
+            for name in args.apps:
+                start = time.perf_counter()
+                app = import_app(name, APPS[name]) # includes loading the data and building the indexes
+                import_ms = (time.perf_counter() - start) * 1e3
+                results.append({'app': name, 'stage': 'import', 'rows': n_rows, 'min_ms': import_ms, 'median_ms': import_ms, 'repeat': 1})
+                for stage, fn in STAGES[name](app).items():
+                    results.append({'app': name, 'stage': stage, 'rows': n_rows, **time_call(fn, args.repeat)})
+                    print(f"{name:>9} {stage:>20} {n_rows:>12,} {results[-1]['median_ms']:>10.2f} ms", file=sys.stderr)
+
+    report = {
+        'timestamp': datetime.datetime.now(datetime.timezone.utc).isoformat(),
+        'commit': git_commit(),
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'results': results,
+    }
+    if args.out:
+        Path(args.out).write_text(json.dumps(report, indent=2))
+    else:
+        print(json.dumps(report, indent=2))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,112 @@
+# Benchmark and equivalence check of the streamed row download (common/row_export.py).
+#
+# First the CSV and Parquet files of random selections (and an empty one) are read back and compared
+# with the selected rows of the frame, for the pandas and duckdb backends (when duckdb is installed),
+# on the plain and the compact Palmer Penguins frame.  Any difference fails the run.  Then, on synthetic
+# frames, the download of every row is timed to its first piece and to its end, and the growth of the
+# process's resident memory while it runs (sampled after every piece, Linux /proc) is compared with
+# encoding the whole file at once.
+#
+# Usage (from the repo root):
+#   python python/benchmarks/bench_row_export.py --rows 100000 1000000 --backend duckdb
+import argparse
+import io
+import os
+import random
+import sys
+import timeit
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+
+sys.path.append(str(Path(__file__).resolve().parents[1]))
+from common.bitmap_index import BitmapIndex
+from common.compact_frame import compact_penguins
+from common.count_cube import CountCube
+from common.query_backend import HAVE_DUCKDB, PandasBackend, query_backend
+from common.row_export import EXPORT_FORMATS, export_chunks
+from common.startup import FILTER_COLUMNS
+from common.synthetic import generate_penguins
+from bench_bitmap_index import scaled_penguins
+
+
+def rss():
+    '''Resident memory of the process, bytes'''
+    with open('/proc/self/statm') as statm:
+        return int(statm.read().split()[1]) * os.sysconf('SC_PAGE_SIZE')
+
+
+def read_back(pieces, file_format):
+    data = b''.join(piece.encode() if isinstance(piece, str) else piece for piece in pieces)
+    if file_format == 'csv':
+        return pd.read_csv(io.BytesIO(data))
+    return pd.read_parquet(io.BytesIO(data))
+
+
+def assert_same_rows(exported, expected):
+    '''The file's rows equal the selected rows, up to dtypes (CSV has no categoricals or float32)'''
+    expected = expected.reset_index(drop=True)
+    assert list(exported.columns) == list(expected.columns)
+    assert len(exported) == len(expected)
+    for column in expected.columns:
+        left, right = exported[column], expected[column]
+        if pd.api.types.is_numeric_dtype(right) and not isinstance(right.dtype, pd.CategoricalDtype):
+            assert np.allclose(left.to_numpy(dtype=np.float64), right.to_numpy(dtype=np.float64, na_value=np.nan), equal_nan=True, rtol=1e-6), column
+        else:
+            assert left.astype(object).where(left.notna(), None).tolist() == right.astype(object).where(right.notna(), None).tolist(), column
+
+
+def check_equivalence(states, chunk_rows, seed):
+    rng = random.Random(seed)
+    checked = 0
+    for frame in (scaled_penguins(3_000), compact_penguins(scaled_penguins(3_000))):
+        backends = [PandasBackend(frame, BitmapIndex(frame), CountCube(frame))] + ([query_backend(frame, name='duckdb')] if HAVE_DUCKDB else [])
+        for state in range(states):
+            selections = {column: [value for value in frame[column].unique() if rng.random() < 0.7] for column in FILTER_COLUMNS}
+            if state == 0:
+                selections['species'] = [] # nothing selected
+            expected = frame[np.logical_and.reduce([frame[column].isin(values).to_numpy() for column, values in selections.items()])]
+            for backend in backends:
+                rows = backend.filter(**selections)
+                for file_format in EXPORT_FORMATS:
+                    assert_same_rows(read_back(export_chunks(rows, file_format, chunk_rows), file_format), expected)
+                    checked += 1
+    return checked
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Row download: streamed chunks vs the whole file at once')
+    parser.add_argument('--rows', type=int, nargs='+', default=[100_000, 1_000_000])
+    parser.add_argument('--backend', default='pandas', choices=['pandas', 'duckdb'])
+    parser.add_argument('--chunk-rows', type=int, default=16384)
+    parser.add_argument('--states', type=int, default=20, help='random selections checked per frame')
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args()
+
+    backends = 'pandas and duckdb' if HAVE_DUCKDB else 'pandas (duckdb not installed)'
+    print(f'equivalence: {check_equivalence(args.states, 2048, args.seed)} {backends} files identical to the selected rows')
+
+    print(f"{'rows':>12} {'format':>8} {'first piece (ms)':>17} {'total (s)':>10} {'MB':>8} {'RSS +MB':>8} {'whole file RSS +MB':>19}")
+    for n_rows in args.rows:
+        df = generate_penguins(n_rows)
+        backend = query_backend(df, BitmapIndex(df), CountCube(df), name=args.backend)
+        rows = backend.filter() # every row
+        for file_format in EXPORT_FORMATS:
+            baseline = peak = rss()
+            start = timeit.default_timer()
+            first, size = None, 0
+            for piece in export_chunks(rows, file_format, args.chunk_rows):
+                first = timeit.default_timer() - start if first is None else first
+                size += len(piece)
+                peak = max(peak, rss())
+            total = timeit.default_timer() - start
+            baseline_whole = rss()
+            whole = (''.join if file_format == 'csv' else b''.join)(export_chunks(rows, file_format, n_rows))
+            whole_peak = rss()
+            del whole
+            print(f'{n_rows:>12,} {file_format:>8} {first * 1e3:>17.1f} {total:>10.2f} {size / 1e6:>8.1f} {(peak - baseline) / 1e6:>8.1f} {(whole_peak - baseline_whole) / 1e6:>19.1f}')
+
+
+if __name__ == '__main__':
+    main()
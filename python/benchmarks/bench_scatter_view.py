@@ -0,0 +1,68 @@
+# Benchmark of the scatter plot's downsampled view (common/scatter_view.py).
+#
+# On synthetic frames (common/synthetic.py, continuous values unlike the repeated rows of
+# scaled_penguins), the bill length vs depth scatter of all rows is built as the core app draws it
+# (raw points up to PENGUIN_SCATTER_POINTS rows in view, density cells past that) for the full extent
+# and for zoomed-in ranges, and its trace payload (plotly JSON of x, y and the counts) is compared with
+# drawing every row as a point.  The density cells' row counts are checked to add up to the rows in view.
+#
+# Usage (from the repo root):
+#   python python/benchmarks/bench_scatter_view.py --rows 100000 1000000 --width 600 --height 400 (the output's size)
+import argparse
+import sys
+import timeit
+from pathlib import Path
+
+import numpy as np
+import plotly.graph_objects as go
+
+sys.path.append(str(Path(__file__).resolve().parents[1]))
+from common.scatter_view import ScatterView, extent, plot_area
+from common.synthetic import generate_penguins
+
+X, Y = 'bill_length_mm', 'bill_depth_mm' # as in the core app
+
+
+def payload_kb(x, y, counts=None):
+    '''Size of the trace's plotly JSON'''
+    trace = go.Scattergl(x=x, y=y, customdata=counts) if counts is not None else go.Scattergl(x=x, y=y)
+    return len(go.Figure(trace).to_json()) / 1e3
+
+
+def zoomed(values_range, share):
+    '''A range of `share` of values_range around its middle'''
+    low, high = values_range
+    middle = (low + high) / 2
+    return middle - (high - low) * share / 2, middle + (high - low) * share / 2
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Scatter view: downsampled payload vs every row')
+    parser.add_argument('--rows', type=int, nargs='+', default=[10_000, 100_000, 1_000_000])
+    parser.add_argument('--width', type=int, default=600)
+    parser.add_argument('--height', type=int, default=400)
+    parser.add_argument('--repeat', type=int, default=3)
+    args = parser.parse_args()
+    area = plot_area(args.width, args.height) # as the core app sizes the density grid
+
+    print(f"{'rows':>12} {'zoom':>6} {'in view':>10} {'mode':>8} {'drawn':>8} {'build (ms)':>11} {'view kB':>9} {'all rows kB':>12}")
+    for n_rows in args.rows:
+        df = generate_penguins(n_rows)
+        x, y = (df[column].to_numpy(dtype=np.float64, na_value=np.nan) for column in (X, Y))
+        everything = payload_kb(x[np.isfinite(x) & np.isfinite(y)], y[np.isfinite(x) & np.isfinite(y)])
+        for share in (1, 0.3, 0.05, 0.005):
+            x_range, y_range = (None, None) if share == 1 else (zoomed(extent(x), share), zoomed(extent(y), share))
+
+            def build():
+                return ScatterView(x, y, x_range, y_range, *plot_area(args.width, args.height))
+            view = build()
+            if view.mode == 'density':
+                assert view.counts.sum() == view.n_rows
+                assert len(view.x) <= (area[0] // view.cell) * (area[1] // view.cell)
+            t_build = min(timeit.repeat(build, number=1, repeat=args.repeat))
+            kb = payload_kb(view.x, view.y, view.counts)
+            print(f'{n_rows:>12,} {share:>6.1%} {view.n_rows:>10,} {view.mode:>8} {len(view.x):>8,} {t_build * 1e3:>11.1f} {kb:>9.1f} {everything:>12.1f}')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,82 @@
+# Worker boot-time report for the three app variants.
+#
+# Imports each app module in a fresh interpreter (what a uvicorn worker does at boot) with
+# `python -X importtime`, once normally and once with PENGUIN_LAZY_STARTUP=1, and reports the total
+# boot time and the top-level imports that account for most of it.  The run fails (exit status 1) if
+# any boot takes longer than the budget, so it can run in CI as the apps grow.
+#
+# Each configuration is booted once first to warm the dataset snapshot and metadata caches, so the
+# reported times are those of a worker starting against a warm cache directory.
+#
+# Usage (from the repo root):
+#   python python/benchmarks/bench_startup.py --budget 1.5 --top 8
+import argparse
+import json
+import os
+import subprocess
+import sys
+from pathlib import Path
+
+PYTHON_DIR = Path(__file__).resolve().parents[1]
+
+APPS = {
+    'core': PYTHON_DIR / 'plotly' / 'core' / 'app.py',
+    'express': PYTHON_DIR / 'plotly' / 'express' / 'app.py',
+    'plotnine': PYTHON_DIR / 'plotnine' / 'app.py',
+}
+
+BOOT = '''
+import importlib.util, sys, time
+sys._xoptions.pop('importtime', None) # not passed on to processes the app starts (the plotnine render pool)
+start = time.perf_counter()
+spec = importlib.util.spec_from_file_location('app', sys.argv[1])
+spec.loader.exec_module(importlib.util.module_from_spec(spec))
+print(time.perf_counter() - start)
+'''
+
+
+def boot(path, lazy):
+    '''(boot seconds, {top-level module: cumulative import seconds}) of one fresh import of the app'''
+    env = dict(os.environ, PENGUIN_LAZY_STARTUP='1' if lazy else '0', MPLBACKEND='Agg')
+    proc = subprocess.run([sys.executable, '-X', 'importtime', '-c', BOOT, str(path)], env=env, capture_output=True, text=True, check=True)
+    imports = {}
+    for line in proc.stderr.splitlines():
+        # import time: self [us] | cumulative | imported package, nested imports indented by two spaces
+        if not line.startswith('import time:') or 'imported package' in line:
+            continue
+        _, cumulative, name = line[len('import time:'):].split('|')
+        if not name.startswith('  '): # top level: imported by the app module itself
+            imports[name.strip()] = int(cumulative) / 1e6
+    return float(proc.stdout.strip().splitlines()[-1]), imports
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Report app import times against a boot-time budget')
+    parser.add_argument('--apps', nargs='+', choices=list(APPS), default=list(APPS))
+    parser.add_argument('--budget', type=float, default=float(os.environ.get('PENGUIN_STARTUP_BUDGET', 2.0)), help='seconds')
+    parser.add_argument('--top', type=int, default=6, help='top-level imports to list per app')
+    parser.add_argument('--json', action='store_true', help='print the report as JSON')
+    args = parser.parse_args()
+
+    report = []
+    for name in args.apps:
+        for lazy in (False, True):
+            boot(APPS[name], lazy) # warm the snapshot / metadata cache
+            seconds, imports = boot(APPS[name], lazy)
+            top = sorted(imports.items(), key=lambda item: -item[1])[:args.top]
+            report.append({'app': name, 'lazy': lazy, 'seconds': seconds, 'over_budget': seconds > args.budget, 'top_imports': dict(top)})
+
+    if args.json:
+        print(json.dumps({'budget': args.budget, 'results': report}, indent=2))
+    else:
+        for entry in report:
+            flag = 'OVER BUDGET' if entry['over_budget'] else 'ok'
+            print(f"{entry['app']:>9} {'lazy' if entry['lazy'] else 'eager':>5} {entry['seconds']:>7.3f} s  {flag}")
+            for module, seconds in entry['top_imports'].items():
+                print(f"{'':>16} {seconds:>7.3f} s  {module}")
+        print(f'budget: {args.budget:.3f} s')
+    sys.exit(1 if any(entry['over_budget'] for entry in report) else 0)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,105 @@
+# Benchmark of the warm cache (common/warm_cache.py): precomputed views vs computing them.
+#
+# Builds the warm cache of the served dataset into a temporary cache directory and checks every entry
+# against a fresh computation.  Then reports the time to load the file and, per filter state, the time
+# to look up its row count and summaries against computing them from the bitmap index and count cube.
+# With --serve, it also starts an app worker with and without the warm cache (fresh worker each
+# time) and times the page load and first filter change of the first session, which is where a cold
+# worker pays for the computations.
+#
+# Usage (from the repo root):
+#   python python/benchmarks/bench_warm_cache.py --serve core --repeat 3
+import argparse
+import asyncio
+import json
+import os
+import random
+import statistics
+import sys
+import tempfile
+import timeit
+from pathlib import Path
+
+sys.path.append(str(Path(__file__).resolve().parents[1]))
+from common.bitmap_index import BitmapIndex
+from common.count_cube import CountCube
+from common.data_source import DataSource
+from common.startup import FILTER_COLUMNS
+from common.warm_cache import build, check, load_warm_cache
+from bench_load import Server, Session, free_port, initial_inputs
+from bench_startup import APPS
+
+
+def lookup_timings(source, repeat):
+    '''(seconds to load the warm cache, per state: seconds to compute, seconds to look up)'''
+    t_load = min(timeit.repeat(lambda: load_warm_cache(source), number=1, repeat=repeat))
+    warm_cache = load_warm_cache(source)
+    df = source.frame()
+    index, cube = BitmapIndex(df), CountCube(df)
+    states = [key[2] for key in warm_cache._entries if key[0] == 'count']
+
+    def compute():
+        for species, island, sex, _ in states:
+            selections = {'species': list(species), 'island': list(island), 'sex': list(sex)}
+            len(index.positions(**selections))
+            for category in FILTER_COLUMNS:
+                cube.summarize(category, **selections)
+
+    def lookup():
+        for key in states:
+            warm_cache.lookup(('count', 0, key))
+            for category in FILTER_COLUMNS:
+                warm_cache.lookup(('summarized', 0, key, category))
+
+    t_compute = min(timeit.repeat(compute, number=1, repeat=repeat)) / len(states)
+    t_lookup = min(timeit.repeat(lookup, number=1, repeat=repeat)) / len(states)
+    return t_load, t_compute, t_lookup, len(states)
+
+
+async def first_session(url, inputs):
+    '''Seconds of the page load and of the first filter change of a session'''
+    session = Session(url, inputs, [], think=0, timeout=60, rng=random.Random(0))
+    t_init = await session.connect()
+    update = session._update('input', {'species_filter': inputs['species_filter'][:1]})
+    start = timeit.default_timer()
+    await session.ws.send(json.dumps(update))
+    await session.flushed()
+    t_filter = timeit.default_timer() - start
+    await session.close()
+    return t_init, t_filter
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Warm cache of precomputed views: lookups vs computing')
+    parser.add_argument('--repeat', type=int, default=3)
+    parser.add_argument('--serve', nargs='*', choices=list(APPS), default=[], help='also time the first session of these apps')
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as cache_dir:
+        source = DataSource(path=os.environ.get('PENGUIN_DATA') or None, cache_dir=cache_dir)
+        start = timeit.default_timer()
+        path = build(source)
+        print(f'built {path.name} ({path.stat().st_size / 1024:.0f} kB) in {timeit.default_timer() - start:.2f}s, '
+              f'{check(source)} entries identical to the computed results')
+        t_load, t_compute, t_lookup, n_states = lookup_timings(source, args.repeat)
+        print(f'load: {t_load * 1e3:.1f} ms for {n_states} filter states')
+        print(f'per state, row count + {len(FILTER_COLUMNS)} summaries: compute {t_compute * 1e3:.3f} ms, lookup {t_lookup * 1e3:.3f} ms')
+
+        for app in args.serve:
+            from common.startup import dataset_metadata
+            inputs = initial_inputs(dataset_metadata(source)['choices'])
+            print(f"{app}: first session, median of {args.repeat} fresh workers")
+            print(f"{'warm cache':>12} {'page load (ms)':>15} {'first filter (ms)':>18}")
+            for warm in ('0', '1'):
+                timings = []
+                for _ in range(args.repeat):
+                    port = free_port()
+                    env = dict(os.environ, PENGUIN_CACHE_DIR=cache_dir, PENGUIN_WARM_CACHE=warm, MPLBACKEND='Agg')
+                    with Server(APPS[app], port, env):
+                        timings.append(asyncio.run(first_session(f'ws://127.0.0.1:{port}/websocket/', inputs)))
+                t_init, t_filter = (statistics.median(column) for column in zip(*timings))
+                print(f"{'on' if warm == '1' else 'off':>12} {t_init * 1e3:>15.1f} {t_filter * 1e3:>18.1f}")
+
+
+if __name__ == '__main__':
+    main()
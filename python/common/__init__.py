@@ -0,0 +1,2 @@
+# Shared building blocks for the python app variants (plotly/core, plotly/express, plotnine).
+# Each app puts the python/ folder on sys.path so these modules can be imported as `common.<module>`.
@@ -0,0 +1,106 @@
+# Precomputed bitmap index over the categorical filter columns of the penguin frame.
+#
+# The sidebar filters of every app are plain "value is one of the checked boxes" tests.  Instead of
+# running a full-column isin scan for each of them on every checkbox change, we build one packed
+# bitset per distinct value once at load time.  A filter then becomes an OR over the bitsets of the
+# checked values for each column, an AND across columns and a single take on the frame.
+import numpy as np
+import pandas as pd
+
+
+class _Missing:
+    '''Hashable stand-in for NaN/None so missing values get their own bitset (NaN != NaN as a dict key)'''
+    def __repr__(self):
+        return 'NA'
+
+    def __reduce__(self): # unpickles to the module's NA singleton (filter keys are sent to render workers)
+        return 'NA'
+
+NA = _Missing()
+
+
+def value_key(value):
+    '''Dictionary key for a column value, with every flavour of missing value mapped to NA'''
+    return NA if pd.isna(value) else value
+
+
+class BitmapIndex:
+    '''One packed bitset per (column, value) for the given columns of a frame.
+
+    Selections follow the semantics of Series.isin(): a row matches a column's selection if its value
+    equals one of the selected values, missing values only match a selected missing value and an
+    empty selection matches nothing.
+    '''
+
+    def __init__(self, df, columns=('species', 'island', 'sex', 'year')):
+        self.n_rows = len(df)
+        self.n_bytes = (self.n_rows + 7) // 8
+        self.bitsets = {column: self._build_column(df[column]) for column in columns}
+
+    @staticmethod
+    def _build_column(ser):
+        codes, uniques = pd.factorize(ser, use_na_sentinel=False)
+        return {value_key(value): np.packbits(codes == code) for code, value in enumerate(uniques)}
+
+    def values(self, column):
+        '''Distinct values of an indexed column, in order of first appearance'''
+        return [np.nan if value is NA else value for value in self.bitsets[column]]
+
+    def select(self, column, values):
+        '''Packed bitset of the rows whose `column` value is one of `values`'''
+        column_bitsets = self.bitsets[column]
+        result = np.zeros(self.n_bytes, dtype=np.uint8)
+        for value in values:
+            bitset = column_bitsets.get(value_key(value))
+            if bitset is not None:
+                np.bitwise_or(result, bitset, out=result)
+        return result
+
+    def packed(self, **selections):
+        '''Packed bitset of the AND of all given column selections, None if there are none'''
+        if not selections:
+            return None
+        bitsets = iter(self.select(column, values) for column, values in selections.items())
+        result = next(bitsets)
+        for bitset in bitsets:
+            np.bitwise_and(result, bitset, out=result)
+        return result
+
+    def mask(self, **selections):
+        '''Boolean row mask for the AND of all given column selections (unlisted columns are not filtered)'''
+        if not selections:
+            return np.ones(self.n_rows, dtype=bool)
+        return np.unpackbits(self.packed(**selections), count=self.n_rows).view(bool)
+
+    def positions(self, **selections):
+        '''Row positions (not index labels) matching all given column selections'''
+        return np.flatnonzero(self.mask(**selections))
+
+    def take(self, df, **selections):
+        '''Rows of `df` (the frame the index was built from) matching all given column selections'''
+        return df.take(self.positions(**selections))
+
+    def appended(self, batch):
+        '''A new index for the frame with `batch`'s rows appended: only the batch rows are encoded, the
+        existing bitsets are extended (a value first seen in the batch gets a bitset of its own)'''
+        index = object.__new__(BitmapIndex)
+        index.n_rows = self.n_rows + len(batch)
+        index.n_bytes = (index.n_rows + 7) // 8
+        index.bitsets = {}
+        for column, column_bitsets in self.bitsets.items():
+            codes, uniques = pd.factorize(batch[column], use_na_sentinel=False)
+            batch_bits = {value_key(value): codes == code for code, value in enumerate(uniques)}
+            keys = list(column_bitsets) + [key for key in batch_bits if key not in column_bitsets]
+            index.bitsets[column] = {key: self._extend_bitset(column_bitsets.get(key), batch_bits.get(key), len(batch)) for key in keys}
+        return index
+
+    def _extend_bitset(self, bitset, batch_bits, n_batch):
+        if bitset is None:
+            bitset = np.zeros(self.n_bytes, dtype=np.uint8)
+        if batch_bits is None:
+            batch_bits = np.zeros(n_batch, dtype=bool)
+        used_bits = self.n_rows % 8 # rows already packed into the last, partial byte
+        if not used_bits:
+            return np.concatenate([bitset, np.packbits(batch_bits)])
+        head = np.unpackbits(bitset[-1:])[:used_bits].view(bool)
+        return np.concatenate([bitset[:-1], np.packbits(np.concatenate([head, batch_bits]))])
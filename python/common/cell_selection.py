@@ -0,0 +1,111 @@
+# Selection state of the bar chart: the set of selected (category value, year) cells.
+#
+# Clicks and lasso/box selections on the chart both edit one CellSelection.  It is a bitmask (a Python
+# int) over the grid of category values x years of the count cube, laid out like the cube's cell codes
+# (bit i * n_years + j is value i in year j).  Plotly calls the click/selection handlers once per trace,
+# and each call replaces or (ctrl held) adds to the bits of that trace's row of the grid: a couple of
+# integer operations, with no dicts or lists copied.  The states are immutable, so an event that
+# changes nothing returns the same object and the reactive value holding it doesn't invalidate.
+#
+# The same state gives the row filter of the selected segments (lookup(), a boolean table over the
+# grid that CountCube.select_lookup() indexes with the rows' cell codes) and the marker opacity of
+# every bar (opacity()).
+import numpy as np
+
+from common.bitmap_index import value_key
+
+
+class CellSelection:
+    '''Immutable set of selected cells over a grid of category values x years'''
+
+    def __init__(self, category, values, years, mask=0):
+        self.category = category
+        self.values = list(values)
+        self.years = list(years)
+        self.mask = mask
+        self._value_codes = {value_key(value): i for i, value in enumerate(self.values)}
+        self._year_codes = {value_key(year): j for j, year in enumerate(self.years)}
+
+    @classmethod
+    def for_cube(cls, cube, category):
+        '''Empty selection over the cube's grid for `category`'''
+        return cls(category, cube.levels[category], cube.levels['year'])
+
+    def _with(self, mask):
+        if mask == self.mask:
+            return self
+        selection = object.__new__(CellSelection)
+        selection.__dict__.update(self.__dict__)
+        selection.mask = mask
+        return selection
+
+    def __bool__(self):
+        return self.mask != 0
+
+    def __len__(self):
+        return bin(self.mask).count('1')
+
+    def _row_bits(self, value, years):
+        '''Bits of `value`'s cells in the given years (values and years outside the grid are ignored)'''
+        i = self._value_codes.get(value_key(value))
+        if i is None:
+            return 0, 0
+        offset = i * len(self.years)
+        bits = 0
+        for year in years:
+            j = self._year_codes.get(value_key(year))
+            if j is not None:
+                bits |= 1 << (offset + j)
+        return bits, ((1 << len(self.years)) - 1) << offset
+
+    def replace_row(self, value, years):
+        '''Selection with `value`'s cells replaced by those in `years` (a trace's part of a new selection)'''
+        bits, row = self._row_bits(value, years)
+        return self._with(self.mask & ~row | bits)
+
+    def union_row(self, value, years):
+        '''Selection with `value`'s cells in `years` added (ctrl-select)'''
+        bits, _ = self._row_bits(value, years)
+        return self._with(self.mask | bits)
+
+    def replace(self, cells):
+        '''Selection of exactly the given (value, year) cells'''
+        return self.clear().union(cells)
+
+    def union(self, cells):
+        mask = self.mask
+        for value, year in cells:
+            mask |= self._row_bits(value, [year])[0]
+        return self._with(mask)
+
+    def clear(self):
+        return self._with(0)
+
+    def cells(self):
+        '''Selected (value, year) cells'''
+        n_years = len(self.years)
+        return [(self.values[bit // n_years], self.years[bit % n_years]) for bit in range(self.mask.bit_length()) if self.mask >> bit & 1]
+
+    def lookup(self):
+        '''Boolean table over the grid (values x years, flattened), True for the selected cells'''
+        size = len(self.values) * len(self.years)
+        packed = np.frombuffer(self.mask.to_bytes((size + 7) // 8, 'little'), dtype=np.uint8)
+        return np.unpackbits(packed, count=size, bitorder='little').astype(bool)
+
+    def lookup_for(self, cube):
+        '''lookup() for the cell codes of `cube`, which may have a different grid (live ingest added levels)'''
+        if [value_key(level) for level in cube.levels[self.category]] == list(self._value_codes) and \
+                [value_key(level) for level in cube.levels['year']] == list(self._year_codes):
+            return self.lookup()
+        return cube.cell_lookup(self.category, self.cells())
+
+    def opacity(self, values, years, selected=1.0, unselected=0.2):
+        '''Marker opacity of the bars of the given traces (rows) and x positions (columns), or None when
+        nothing is selected (every bar fully opaque)'''
+        if not self.mask:
+            return None
+        rows = np.array([self._value_codes.get(value_key(value), -1) for value in values], dtype=np.intp)[:, None]
+        columns = np.array([self._year_codes.get(value_key(year), -1) for year in years], dtype=np.intp)[None, :]
+        grid = self.lookup().reshape(len(self.values), len(self.years))
+        chosen = (rows >= 0) & (columns >= 0) & grid[rows.clip(0), columns.clip(0)]
+        return np.where(chosen, selected, unselected)
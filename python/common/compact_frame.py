@@ -0,0 +1,47 @@
+# Compact column types for the penguin frame.
+#
+# As parsed, species/island/sex are object columns (one Python string per row) and the measurements
+# are float64.  compact_penguins() normalizes them at load time: the filter columns become categoricals
+# with a fixed, sorted category order (one small integer code per row), integer columns get the
+# smallest integer type that holds them and float columns become float32.  Missing values of the
+# categoricals use the categorical missing code (-1), so `sex` keeps its NaN rows as NaN and every
+# calc downstream (isin semantics, the bitmap index, the count cube, groupby) sees the same values.
+#
+# Enabled with PENGUIN_COMPACT=1 (see common/data_source.py).  memory_report() compares two frames
+# column by column.
+import numpy as np
+import pandas as pd
+
+CATEGORICAL_COLUMNS = ('species', 'island', 'sex')
+
+
+def compact_penguins(df, categorical_columns=CATEGORICAL_COLUMNS):
+    '''A copy of df with compact column types (see the module comment)'''
+    columns = {}
+    for column in df.columns:
+        ser = df[column]
+        if column in categorical_columns:
+            categories = sorted(ser.dropna().unique())
+            columns[column] = pd.Categorical(ser, categories=categories)
+        elif ser.dtype.kind in 'iu':
+            columns[column] = pd.to_numeric(ser, downcast='integer')
+        elif ser.dtype.kind == 'f':
+            columns[column] = ser.astype(np.float32)
+        else:
+            columns[column] = ser
+    return pd.DataFrame(columns, index=df.index)
+
+
+def memory_report(before, after):
+    '''Per-column dtype and deep memory use of two versions of a frame, plus a total row'''
+    bytes_before = before.memory_usage(index=False, deep=True)
+    bytes_after = after.memory_usage(index=False, deep=True)
+    report = pd.DataFrame({
+        'dtype_before': before.dtypes.astype(str),
+        'dtype_after': after.dtypes.astype(str),
+        'bytes_before': bytes_before,
+        'bytes_after': bytes_after,
+    })
+    report.loc['total'] = ['', '', bytes_before.sum(), bytes_after.sum()]
+    report['ratio'] = report['bytes_after'] / report['bytes_before']
+    return report
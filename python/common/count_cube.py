@@ -0,0 +1,165 @@
+# Materialized count cube over year x species x island x sex.
+#
+# df_summarized only ever needs "how many penguins per (year, category value)" for the rows that pass
+# the sidebar filters.  All of those filters are on cube dimensions, so instead of a groupby over the
+# filtered frame on every change we count once at load time and answer each request by slicing the
+# cube along the filtered dimensions and summing away the ones that aren't displayed.
+import numpy as np
+import pandas as pd
+
+from common.bitmap_index import value_key
+
+
+class CountCube:
+    '''Row and measure counts for every combination of the dimension values of a frame.
+
+    `rows` counts all rows in a cell and `counts` only the rows with a non-null measure, which is what
+    groupby(...).count() reports for that column.  Missing dimension values (e.g. NaN sex) get their
+    own cell so that they still count towards the other dimensions.
+    '''
+
+    def __init__(self, df, dimensions=('year', 'species', 'island', 'sex'), measure='body_mass_g'):
+        self.dimensions = list(dimensions)
+        self.measure = measure
+        self.levels = {}
+        self.row_codes = {} # per-row level code of each dimension, in the frame's row order
+        for dimension in self.dimensions:
+            # sort=True gives the level order groupby uses for its output, with NaN as the last level
+            dim_codes, uniques = pd.factorize(df[dimension], sort=True, use_na_sentinel=False)
+            self.levels[dimension] = uniques
+            self.row_codes[dimension] = dim_codes.astype(np.min_scalar_type(max(len(uniques) - 1, 0)))
+        self.shape = tuple(len(self.levels[dimension]) for dimension in self.dimensions)
+        self._cell_codes = {}
+        codes = [self.row_codes[dimension] for dimension in self.dimensions]
+
+        flat_codes = np.ravel_multi_index(codes, self.shape) if len(df) else np.zeros(0, dtype=np.intp)
+        size = int(np.prod(self.shape))
+        self.rows = np.bincount(flat_codes, minlength=size).reshape(self.shape)
+        self.counts = np.bincount(flat_codes, weights=df[measure].notna().to_numpy(), minlength=size).astype(np.int64).reshape(self.shape)
+
+    def appended(self, batch):
+        '''A new cube for the frame with `batch`'s rows appended.  Only the batch rows are counted; a
+        dimension value first seen in the batch inserts a level (in sorted position) into the cube'''
+        cube = object.__new__(CountCube)
+        cube.dimensions = self.dimensions
+        cube.measure = self.measure
+        cube.levels = {}
+        cube.row_codes = {}
+        remaps = []
+        batch_codes = []
+        for dimension in self.dimensions:
+            # Factorizing the old levels together with the batch gives the merged, sorted levels, where
+            # the old levels moved to (remap) and the codes of the batch rows
+            old_levels = self.levels[dimension]
+            merged = pd.concat([pd.Series(old_levels).astype(batch[dimension].dtype), batch[dimension]], ignore_index=True)
+            codes, uniques = pd.factorize(merged, sort=True, use_na_sentinel=False)
+            remap, dim_codes = codes[:len(old_levels)], codes[len(old_levels):]
+            row_codes = self.row_codes[dimension]
+            if len(uniques) != len(old_levels): # new level(s): recode the existing rows
+                row_codes = remap[row_codes]
+            cube.levels[dimension] = uniques
+            code_type = np.min_scalar_type(max(len(uniques) - 1, 0))
+            cube.row_codes[dimension] = np.concatenate([row_codes, dim_codes]).astype(code_type)
+            remaps.append(remap)
+            batch_codes.append(dim_codes)
+        cube.shape = tuple(len(cube.levels[dimension]) for dimension in cube.dimensions)
+
+        size = int(np.prod(cube.shape))
+        flat_codes = np.ravel_multi_index(batch_codes, cube.shape) if len(batch) else np.zeros(0, dtype=np.intp)
+        cube.rows = np.bincount(flat_codes, minlength=size).reshape(cube.shape)
+        cube.counts = np.bincount(flat_codes, weights=batch[cube.measure].notna().to_numpy(), minlength=size).astype(np.int64).reshape(cube.shape)
+        cube.rows[np.ix_(*remaps)] += self.rows
+        cube.counts[np.ix_(*remaps)] += self.counts
+
+        if cube.shape == self.shape: # cell codes of the existing rows are still valid, extend them
+            n_years = cube.shape[cube.dimensions.index('year')]
+            cube._cell_codes = {
+                category: np.concatenate([codes, cube.row_codes[category][-len(batch):].astype(np.int32) * n_years + cube.row_codes['year'][-len(batch):]]) if len(batch) else codes
+                for category, codes in self._cell_codes.items()}
+        else:
+            cube._cell_codes = {}
+        return cube
+
+    def level_mask(self, dimension, values):
+        '''Boolean table over the levels of `dimension`, True for the given values (isin semantics)'''
+        keys = {value_key(value) for value in values}
+        return np.array([value_key(level) in keys for level in self.levels[dimension]], dtype=bool)
+
+    def _slice(self, cube, selections):
+        for dimension, values in selections.items():
+            cube = np.compress(self.level_mask(dimension, values), cube, axis=self.dimensions.index(dimension))
+        return cube
+
+    def summarize(self, category, **selections):
+        '''Same frame as
+        df[<selections as isin filters>].groupby(['year', category], as_index=False).count()
+          .rename({measure: 'count'}, axis=1)[['year', category, 'count']]
+        computed from the cube instead of the rows.
+        '''
+        axis_year = self.dimensions.index('year')
+        axis_category = self.dimensions.index(category)
+        summed_axes = tuple(axis for axis in range(len(self.dimensions)) if axis not in (axis_year, axis_category))
+
+        levels = {dimension: self.levels[dimension][self.level_mask(dimension, values)] for dimension, values in selections.items()}
+        rows = self._slice(self.rows, selections).sum(axis=summed_axes)
+        counts = self._slice(self.counts, selections).sum(axis=summed_axes)
+        if axis_year > axis_category:
+            rows, counts = rows.T, counts.T
+
+        return self.summary_frame(category, rows, counts, levels.get('year', self.levels['year']), levels.get(category, self.levels[category]))
+
+    def summarize_rows(self, category, positions, measured):
+        '''summarize() of an explicit set of rows (positions into the frame the cube was built from, e.g.
+        after a range filter the cube has no dimension for): one bincount over the rows' cells.
+        `measured` flags the rows whose measure is not missing'''
+        n_years = len(self.levels['year'])
+        size = len(self.levels[category]) * n_years
+        codes = self.cell_codes(category)[positions]
+        rows = np.bincount(codes, minlength=size).reshape(-1, n_years).T
+        counts = np.bincount(codes, weights=measured, minlength=size).astype(np.int64).reshape(-1, n_years).T
+        return self.summary_frame(category, rows, counts, self.levels['year'], self.levels[category])
+
+    @staticmethod
+    def summary_frame(category, rows, counts, year_levels, category_levels):
+        '''The summarize() frame of (year x category value) grids of row and measure counts'''
+        # groupby only reports groups that have rows, and drops groups keyed on a missing value
+        present = rows > 0
+        present &= ~pd.isna(np.asarray(year_levels, dtype=object))[:, None]
+        present &= ~pd.isna(np.asarray(category_levels, dtype=object))[None, :]
+        year_idx, category_idx = np.nonzero(present)
+        return pd.DataFrame({
+            'year': year_levels.take(year_idx),
+            category: category_levels.take(category_idx),
+            'count': counts[year_idx, category_idx],
+        })
+
+    def cell_codes(self, category):
+        '''Per-row code of the (category value, year) cell each row falls in, built once per category'''
+        if category not in self._cell_codes:
+            n_years = len(self.levels['year'])
+            self._cell_codes[category] = self.row_codes[category].astype(np.int32) * n_years + self.row_codes['year']
+        return self._cell_codes[category]
+
+    def cell_lookup(self, category, cells):
+        '''Boolean table over the (category value, year) grid, True for the given (value, year) cells'''
+        category_index = {value_key(level): i for i, level in enumerate(self.levels[category])}
+        year_index = {value_key(level): i for i, level in enumerate(self.levels['year'])}
+        lookup = np.zeros(len(category_index) * len(year_index), dtype=bool)
+        for value, year in cells:
+            i, j = category_index.get(value_key(value)), year_index.get(value_key(year))
+            if i is not None and j is not None:
+                lookup[i * len(year_index) + j] = True
+        return lookup
+
+    def select_cells(self, df, category, cells):
+        '''Rows of df that fall in any of the given (category value, year) cells.
+
+        df must be a row subset of the frame the cube was built from that kept its RangeIndex labels,
+        so the labels are row positions into the precomputed cell codes.
+        '''
+        return self.select_lookup(df, category, self.cell_lookup(category, cells))
+
+    def select_lookup(self, df, category, lookup):
+        '''Rows of df whose cell is True in `lookup`, a boolean table as from cell_lookup() (or
+        CellSelection.lookup()); same requirements on df as select_cells()'''
+        return df[lookup[self.cell_codes(category)[df.index.to_numpy()]]]
@@ -0,0 +1,227 @@
+# Crossfilter engine for linked charts.
+#
+# Several charts over the same rows, each filtering the others: a chart shows the rows that pass every
+# filter except its own (so brushing a histogram doesn't empty the histogram itself), and the table
+# shows the rows that pass all of them.
+#
+# The per-dataset part, CrossfilterIndex, is built once and shared by all sessions.  Every dimension
+# keeps its rows in sorted order (argsort of a numeric column, or rows grouped by level code for the
+# sidebar columns and the bar chart's (category value, year) cells), so the rows that enter or leave a
+# filter when it changes are a few contiguous slices of that order, found with searchsorted or the
+# level offsets.  A dimension with a chart also has a bin code per row.
+#
+# The per-session part, Crossfilter, holds one bitmask per row (bit d set: the row fails dimension d's
+# filter) and the bin counts of every chart.  Moving one filter only touches the rows that changed
+# state: their bits are flipped, and each other chart adds or subtracts those rows' bins (np.bincount
+# over the changed rows only).  A brush that moves by a few bins costs about as much as the rows in
+# those bins, not a pass over the whole frame.
+#
+# python/benchmarks/bench_crossfilter.py checks the incremental counts against recounting from
+# scratch and times both.
+import numpy as np
+
+from common.range_index import value_type
+from common.startup import FILTER_COLUMNS
+
+HISTOGRAM_BINS = 30
+
+
+class RangeDimension:
+    '''A numeric column sorted once, filtered by value ranges, with equal-width histogram bins (no chart
+    for bins=None).  `order` is the column's ascending row order if already known (missing values last).
+
+    Rows with a missing value pass while the dimension has no range and fail any range.  Values, bin
+    edges and range bounds are compared in the values' own type (see common/range_index.py's value_type).
+    '''
+
+    def __init__(self, values, bins=HISTOGRAM_BINS, order=None):
+        values = np.asarray(values)
+        self.type = value_type(values.dtype)
+        values = values.astype(self.type, copy=False)
+        self.n_rows = len(values)
+        self.order = np.argsort(values, kind='stable') if order is None else order # NaN sorts last
+        self.sorted_values = values[self.order]
+        self.n_valid = int(np.count_nonzero(~np.isnan(values)))
+        self.n_bins = bins
+        if bins is None:
+            self.edges = self.group_codes = None
+            return
+        valid = values[~np.isnan(values)]
+        self.edges = (np.histogram_bin_edges(valid, bins=bins) if len(valid) else np.linspace(0, 1, bins + 1)).astype(self.type)
+        codes = np.searchsorted(self.edges, values, side='right') - 1
+        codes[values == self.edges[-1]] = bins - 1 # the last bin includes its upper edge
+        codes[np.isnan(values)] = -1
+        self.group_codes = codes.astype(np.int32)
+
+    def span(self, value_range):
+        '''(start, stop) in sorted order of the rows with lo <= value < hi, all rows for None'''
+        if value_range is None:
+            return 0, self.n_rows
+        lo, hi = self.type(value_range[0]), self.type(value_range[1])
+        valid = self.sorted_values[:self.n_valid]
+        return int(np.searchsorted(valid, lo, side='left')), int(np.searchsorted(valid, hi, side='left'))
+
+    def closed(self, value_range):
+        '''The half-open range of the values in the closed range [lo, hi] (a range slider's), None for None'''
+        if value_range is None:
+            return None
+        lo, hi = self.type(value_range[0]), self.type(value_range[1])
+        return float(lo), float(np.nextafter(hi, self.type(np.inf)))
+
+    def bin_range(self, first, last):
+        '''Value range covering histogram bins first..last (the last bin up to and including the maximum)'''
+        return float(self.edges[first]), (np.inf if last >= self.n_bins - 1 else float(self.edges[last + 1]))
+
+    def changed_rows(self, old, new):
+        '''Rows leaving and rows entering the filter when its range goes from `old` to `new`'''
+        (s0, e0), (s1, e1) = self.span(old), self.span(new)
+        leaving = [self.order[s0:min(e0, s1)], self.order[max(s0, e1):e0]]
+        entering = [self.order[s1:min(e1, s0)], self.order[max(s1, e0):e1]]
+        return np.concatenate(leaving), np.concatenate(entering)
+
+
+class SetDimension:
+    '''A column of level codes with its rows grouped by level, filtered by a boolean table over the
+    levels (None: all levels).  `group_codes`/`n_bins` are the chart bins, if the dimension has a chart'''
+
+    def __init__(self, codes, n_levels, group_codes=None, n_bins=None):
+        codes = np.asarray(codes)
+        self.n_rows = len(codes)
+        self.n_levels = n_levels
+        self.order = np.argsort(codes, kind='stable')
+        self.offsets = np.concatenate([[0], np.cumsum(np.bincount(codes, minlength=n_levels))])
+        self.group_codes = group_codes
+        self.n_bins = n_bins
+
+    def _rows(self, levels):
+        return np.concatenate([self.order[self.offsets[level]:self.offsets[level + 1]] for level in np.flatnonzero(levels)] or [np.zeros(0, dtype=np.intp)])
+
+    def changed_rows(self, old, new):
+        '''Rows leaving and rows entering the filter when its level table goes from `old` to `new`'''
+        everything = np.ones(self.n_levels, dtype=bool)
+        old = everything if old is None else old
+        new = everything if new is None else new
+        return self._rows(old & ~new), self._rows(new & ~old)
+
+
+def _values(df, column):
+    return df[column].to_numpy(dtype=value_type(df[column].dtype), na_value=np.nan)
+
+
+class CrossfilterIndex:
+    '''The shared, per-dataset dimensions: the sidebar filter columns, the histogram columns, the
+    sidebar range slider columns and the bar chart's (category value, year) cells of each category.
+    `orders` maps columns to their ascending row order, where already computed (the table pager's)'''
+
+    def __init__(self, df, cube, histogram_columns, range_columns=(), bins=HISTOGRAM_BINS, orders=None):
+        orders = orders or {}
+        self.cube = cube
+        self.n_rows = len(df)
+        self.filters = {column: SetDimension(cube.row_codes[column], len(cube.levels[column])) for column in FILTER_COLUMNS}
+        self.histograms = {column: RangeDimension(_values(df, column), bins, orders.get(column)) for column in histogram_columns}
+        self.ranges = {column: RangeDimension(_values(df, column), None, orders.get(column)) for column in range_columns}
+        self._has_measure = df[cube.measure].notna().to_numpy()
+        self._cells = {}
+
+    def cells(self, category):
+        '''Dimension of the bar chart cells of `category`.  Its bins count each cell twice, rows without
+        and rows with a measure value, which is what the summary reports (see Crossfilter.summary)'''
+        if category not in self._cells:
+            codes = self.cube.cell_codes(category)
+            n_cells = len(self.cube.levels[category]) * len(self.cube.levels['year'])
+            self._cells[category] = SetDimension(codes, n_cells, group_codes=codes.astype(np.int32) * 2 + self._has_measure, n_bins=2 * n_cells)
+        return self._cells[category]
+
+
+class Crossfilter:
+    '''Filter state and chart bin counts of one session over a CrossfilterIndex.
+
+    Dimensions are added by name; filter(name, value) sets a dimension's filter (a value range for a
+    RangeDimension, a level table for a SetDimension, None for no filter) and updates the counts of the
+    other dimensions' charts incrementally.
+    '''
+
+    def __init__(self, index):
+        self.index = index
+        self.masks = np.zeros(index.n_rows, dtype=np.uint32)
+        self.total = index.n_rows # rows passing every filter
+        self._dimensions = {} # name -> dimension
+        self._filters = {} # name -> current filter value
+        self._bits = {} # name -> bit of the dimension in the masks
+        self._counts = {} # name -> bin counts, for dimensions with a chart
+
+    def add(self, name, dimension):
+        '''Add a dimension without a filter (replacing the dimension of that name, if any)'''
+        if name in self._dimensions:
+            self.remove(name)
+        free = [bit for bit in range(32) if 1 << bit not in self._bits.values()]
+        self._dimensions[name] = dimension
+        self._filters[name] = None
+        self._bits[name] = np.uint32(1 << free[0])
+        if dimension.n_bins is not None:
+            self._counts[name] = self._recount(name)
+
+    def remove(self, name):
+        self.filter(name, None)
+        for mapping in (self._dimensions, self._filters, self._bits, self._counts):
+            mapping.pop(name, None)
+
+    def __contains__(self, name):
+        return name in self._dimensions
+
+    def dimension(self, name):
+        return self._dimensions[name]
+
+    def _recount(self, name):
+        '''Bin counts of a chart from scratch: the rows that pass all filters but its own'''
+        dimension = self._dimensions[name]
+        passing = (self.masks & ~self._bits[name]) == 0
+        codes = dimension.group_codes[passing]
+        return np.bincount(codes[codes >= 0], minlength=dimension.n_bins)
+
+    def filter(self, name, value):
+        '''Set the filter of dimension `name`.  Returns False (and does nothing) if it is unchanged'''
+        old = self._filters[name]
+        if value is None and old is None or value is not None and old is not None and np.array_equal(value, old):
+            return False
+        leaving, entering = self._dimensions[name].changed_rows(old, value)
+        bit = self._bits[name]
+        if len(leaving):
+            before = self.masks[leaving]
+            self._count(leaving, before, -1, name)
+            self.masks[leaving] = before | bit
+        if len(entering):
+            after = self.masks[entering] & ~bit
+            self._count(entering, after, 1, name)
+            self.masks[entering] = after
+        self._filters[name] = value
+        return True
+
+    def _count(self, rows, masks, sign, changed):
+        '''Add (sign 1) or remove (sign -1) `rows` from the counts of every chart but the one of the changed
+        dimension; `masks` are the rows' bits with the changed dimension passing'''
+        for name, counts in self._counts.items():
+            if name == changed:
+                continue
+            counted = (masks & ~self._bits[name]) == 0
+            codes = self._dimensions[name].group_codes[rows[counted]]
+            counts += sign * np.bincount(codes[codes >= 0], minlength=len(counts))
+        self.total += sign * int(np.count_nonzero(masks == 0))
+
+    def counts(self, name):
+        '''Bin counts of dimension `name`'s chart (read-only)'''
+        return self._counts[name]
+
+    def filter_value(self, name):
+        return self._filters[name]
+
+    def positions(self):
+        '''Row positions passing every filter, in row order'''
+        return np.flatnonzero(self.masks == 0)
+
+    def summary(self, name, category):
+        '''The bar chart summary (as CountCube.summarize) of the cells dimension `name` of `category`'''
+        cube = self.index.cube
+        n_years = len(cube.levels['year'])
+        both = self._counts[name].reshape(-1, n_years, 2) # category value x year x (without, with measure)
+        return cube.summary_frame(category, both.sum(axis=2).T, both[:, :, 1].T, cube.levels['year'], cube.levels[category])
@@ -0,0 +1,160 @@
+# Pluggable, lazily loaded penguin data source.
+#
+# By default the apps show the palmerpenguins dataset.  Point PENGUIN_DATA at a .parquet, .arrow /
+# .feather (Arrow IPC) or .csv file to serve another penguin-shaped dataset instead.  Arrow IPC files
+# are memory-mapped, so numeric columns are used straight from the page cache without being read
+# into the worker's heap.  Anything that has to be parsed (CSV, Parquet) is written to a column-typed
+# Arrow IPC snapshot under PENGUIN_CACHE_DIR the first time, and later worker starts memory-map that
+# snapshot instead of parsing the source again.
+#
+# With PENGUIN_COMPACT=1 the frame is normalized to compact column types (common/compact_frame.py)
+# before it is snapshotted, so the snapshot itself holds the compact columns.  With
+# PENGUIN_SHARED_FRAME set, the frame is instead attached read-only from the columns a loader process
+# published to shared memory (common/shared_frame.py).
+#
+# pyarrow is optional: without it CSV sources are simply parsed on every start.  numpy, pandas and
+# pyarrow are only imported when the data is loaded, so the source (path, fingerprint) can be looked at
+# during a lazy startup without paying for them.
+import hashlib
+import importlib.util
+import os
+import threading
+from pathlib import Path
+
+HAVE_PYARROW = importlib.util.find_spec('pyarrow') is not None
+
+IPC_SUFFIXES = ('.arrow', '.feather', '.ipc')
+
+
+def default_cache_dir():
+    return Path(os.environ.get('PENGUIN_CACHE_DIR', Path.home() / '.cache' / 'penguin-shiny'))
+
+
+def palmerpenguins_csv():
+    '''Path of the CSV palmerpenguins.load_penguins() reads (located without importing the package)'''
+    return Path(importlib.util.find_spec('palmerpenguins').origin).parent / 'data' / 'penguins.csv'
+
+
+def file_fingerprint(path):
+    '''Cheap identity of a file's current contents: path, size and modification time'''
+    stat = os.stat(path)
+    return hashlib.sha1(f'{Path(path).resolve()}|{stat.st_size}|{stat.st_mtime_ns}'.encode()).hexdigest()[:16]
+
+
+def read_ipc(path):
+    '''Memory-map an Arrow IPC file into a DataFrame (numeric columns without nulls are zero-copy)'''
+    import numpy as np
+    import pyarrow as pa
+    with pa.memory_map(str(path), 'r') as source:
+        table = pa.ipc.open_file(source).read_all()
+    df = table.to_pandas(split_blocks=True)
+    for column in df.columns:
+        # Arrow nulls come back as None in string columns, pandas' own readers give NaN
+        if df[column].dtype == object and df[column].hasnans:
+            df[column] = df[column].fillna(np.nan)
+    return df
+
+
+def write_ipc(df, path):
+    '''Write df as an Arrow IPC file, atomically so concurrent workers never see a partial snapshot'''
+    import pyarrow as pa
+    table = pa.Table.from_pandas(df, preserve_index=False)
+    for i, column in enumerate(df.columns):
+        # Keep NaN as float values rather than Arrow nulls, so reading the column back is zero-copy
+        if df[column].dtype.kind == 'f':
+            table = table.set_column(i, column, pa.array(df[column].to_numpy(), from_pandas=False))
+    path = Path(path)
+    path.parent.mkdir(parents=True, exist_ok=True)
+    tmp_path = path.with_suffix(f'.{os.getpid()}.tmp')
+    with pa.OSFile(str(tmp_path), 'wb') as sink, pa.ipc.new_file(sink, table.schema) as writer:
+        writer.write_table(table)
+    os.replace(tmp_path, path)
+
+
+class DataSource:
+    '''A penguin dataset that is loaded on the first call to frame() and then kept for the process'''
+
+    def __init__(self, path=None, cache_dir=None, snapshot=True, compact=False, shared_dir=None):
+        self.path = Path(path) if path else palmerpenguins_csv()
+        self.cache_dir = Path(cache_dir) if cache_dir else default_cache_dir()
+        self.snapshot = snapshot and HAVE_PYARROW
+        self.compact = compact
+        self.shared_dir = shared_dir
+        self._frame = None
+        self._lock = threading.Lock()
+
+    @classmethod
+    def from_env(cls):
+        return cls(
+            path=os.environ.get('PENGUIN_DATA') or None,
+            snapshot=os.environ.get('PENGUIN_SNAPSHOT', '1') != '0',
+            compact=os.environ.get('PENGUIN_COMPACT', '0') != '0',
+            shared_dir=os.environ.get('PENGUIN_SHARED_FRAME') or None,
+        )
+
+    @property
+    def fingerprint(self):
+        return file_fingerprint(self.path)
+
+    @property
+    def snapshot_path(self):
+        variant = '-compact' if self.compact else ''
+        return self.cache_dir / f'{self.path.stem}-{self.fingerprint}{variant}.arrow'
+
+    def frame(self):
+        '''The dataset, loaded on first use'''
+        if self._frame is None:
+            with self._lock:
+                if self._frame is None:
+                    self._frame = self._load()
+        return self._frame
+
+    def _load(self):
+        if self.shared_dir:
+            from common.shared_frame import attach_frame
+            return attach_frame(self.shared_dir)
+
+        suffix = self.path.suffix.lower()
+        if suffix in IPC_SUFFIXES:
+            if not HAVE_PYARROW:
+                raise ImportError(f'pyarrow is required to read {self.path}')
+            return self._normalized(read_ipc(self.path))
+
+        if self.snapshot:
+            snapshot_path = self.snapshot_path
+            if snapshot_path.exists():
+                return read_ipc(snapshot_path)
+
+        df = self._normalized(self._parse(suffix))
+        if self.snapshot:
+            try:
+                write_ipc(df, snapshot_path)
+            except OSError: # read-only cache dir etc: serve the parsed frame, just without a snapshot
+                return df
+            return read_ipc(snapshot_path)
+        return df
+
+    def _normalized(self, df):
+        if not self.compact:
+            return df
+        from common.compact_frame import compact_penguins
+        return compact_penguins(df)
+
+    def _parse(self, suffix):
+        import pandas as pd
+        if suffix == '.parquet':
+            if not HAVE_PYARROW:
+                raise ImportError(f'pyarrow is required to read {self.path}')
+            import pyarrow.parquet as pq
+            return pq.read_table(str(self.path), memory_map=True).to_pandas()
+        if suffix == '.csv':
+            return pd.read_csv(self.path)
+        raise ValueError(f'Unsupported penguin data file type: {self.path}')
+
+
+# The dataset every app serves, chosen by PENGUIN_DATA (palmerpenguins when unset)
+penguin_source = DataSource.from_env()
+
+
+def load_penguins():
+    return penguin_source.frame()
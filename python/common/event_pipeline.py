@@ -0,0 +1,91 @@
+# Server-side throttling/debouncing of high-frequency widget events (hover, ...).
+#
+# Every plotly hover event arrives as its own websocket message.  Writing each one straight into a
+# reactive value re-renders every output that depends on it and sends the result back to the browser,
+# so fast mouse movement floods the event loop.  ThrottledEvents sits in between: it lets at most one
+# event per `throttle` seconds through as it arrives, keeps only the newest of the events that arrive
+# in between, and emits that one once the stream has been quiet for `debounce` seconds (trailing
+# edge), so the last hover always ends up displayed.  Counters record how many events were received, emitted, coalesced and dropped.
+import time
+
+from shiny import reactive
+
+
+class ThrottledEvents:
+    '''Rate-limited stream of events into the reactive value `self.value`.
+
+    Must be created inside a Shiny session (server function), since it owns a reactive effect that
+    emits the trailing event.  `key` maps an event to what makes it distinct: an event with the same
+    key as the last emitted one is dropped.
+    '''
+
+    def __init__(self, throttle=0.1, debounce=0.25, key=None, initial=None, clock=time.monotonic):
+        self.throttle = throttle
+        self.debounce = debounce
+        self.key = key or (lambda event: event)
+        self.clock = clock
+        self.value = reactive.value(initial)
+
+        self.received = 0
+        self.emitted = 0
+        self.coalesced = 0 # deferred events replaced by a newer one before they were emitted
+        self.dropped = 0 # events identical to the last emitted one
+
+        self._last_emit_time = float('-inf')
+        self._last_emit_key = None
+        self._last_push_time = float('-inf')
+        self._pending = None
+        self._has_pending = False
+        self._deferrals = 0
+        self._wakeup = reactive.value(0)
+
+        @reactive.effect
+        def _emit_trailing():
+            self._wakeup()
+            if not self._has_pending:
+                return
+            wait = self._last_push_time + self.debounce - self.clock()
+            if wait > 0:
+                reactive.invalidate_later(wait)
+                return
+            event, self._pending, self._has_pending = self._pending, None, False
+            self._emit(event)
+
+    def push(self, event):
+        '''Offer an event; it is emitted now, later (coalesced with newer events) or dropped'''
+        self.received += 1
+        now = self.clock()
+        self._last_push_time = now
+
+        if now - self._last_emit_time >= self.throttle:
+            if self._has_pending: # superseded by this one
+                self._pending, self._has_pending = None, False
+                self.coalesced += 1
+            self._emit(event)
+        elif self._has_pending:
+            # Newer event supersedes the deferred one, the trailing emit picks up the latest
+            self._pending = event
+            self.coalesced += 1
+        else:
+            self._pending, self._has_pending = event, True
+            self._deferrals += 1
+            self._wakeup.set(self._deferrals) # arm the trailing emit
+
+    def _emit(self, event):
+        key = self.key(event)
+        if self.emitted and key == self._last_emit_key:
+            self.dropped += 1
+            return
+        self._last_emit_time = self.clock()
+        self._last_emit_key = key
+        self.emitted += 1
+        self.value.set(event)
+
+    def stats(self):
+        return {
+            'received': self.received,
+            'emitted': self.emitted,
+            'coalesced': self.coalesced,
+            'dropped': self.dropped,
+            'pending': int(self._has_pending),
+        }
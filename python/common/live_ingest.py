@@ -0,0 +1,177 @@
+# Live append mode: new penguin observations streamed in from a watched directory.
+#
+# With PENGUIN_INGEST_DIR set, every app polls that directory for new .csv / .parquet files (drop them
+# in atomically: write under another name, e.g. a leading dot, then rename).  New files are read in
+# one batch, conformed to the frame's columns and dtypes and appended.  The derived structures are
+# updated from the batch instead of being rebuilt: the bitmap index, count cube, table pager, range
+# index and query backend get appended() copies, and values seen for the first time are added to the filter choice lists.  The
+# app's Deferred frame and structures are then swapped for the new ones in one step on the event loop,
+# and the data version is bumped.  Sessions follow the version through data_version(), so their calcs
+# re-run (the shared result cache is keyed by it) and the core app patches only the bars that changed.
+#
+# Ingested rows are not written back anywhere: the watched directory is the log, and a restarted
+# worker reads all of it again.
+import asyncio
+import logging
+from pathlib import Path
+
+from shiny import reactive
+
+from common.startup import FILTER_COLUMNS, MISSING_CHOICE
+
+logger = logging.getLogger(__name__)
+
+PATTERNS = ('*.csv', '*.parquet')
+FILTER_INPUTS = {column: f'{column}_filter' for column in FILTER_COLUMNS} # filter column -> checkbox group input
+
+
+def read_drop(path):
+    import pandas as pd
+    if path.suffix.lower() == '.parquet':
+        return pd.read_parquet(path)
+    return pd.read_csv(path)
+
+
+def conform(batch, df):
+    '''(df, batch) with batch's columns in df's order and dtypes.  Categorical columns get the union of
+    the categories (sorted), so df is recoded when the batch brings a new category'''
+    import pandas as pd
+    missing = [column for column in df.columns if column not in batch.columns]
+    if missing:
+        raise ValueError(f'missing columns {missing}')
+    batch = batch[list(df.columns)].reset_index(drop=True)
+    recoded = {}
+    dtypes = {}
+    for column in df.columns:
+        dtype = df[column].dtype
+        if isinstance(dtype, pd.CategoricalDtype):
+            new_values = set(batch[column].dropna()) - set(dtype.categories)
+            if new_values:
+                dtype = pd.CategoricalDtype(sorted(set(dtype.categories) | new_values))
+                recoded[column] = df[column].cat.set_categories(dtype.categories)
+        dtypes[column] = dtype
+    if recoded:
+        df = df.assign(**recoded)
+    return df, batch.astype(dtypes)
+
+
+class LiveIngest:
+    '''Appends the files dropped into `directory` to the frame held by the `frame` Deferred and keeps the
+    other Deferred structures (any of index/cube/pager/ranges/backend may be None) and `choices` in step with it'''
+
+    def __init__(self, directory, frame, index=None, cube=None, pager=None, ranges=None, backend=None, choices=None, interval=1.0):
+        self.directory = Path(directory)
+        self.frame = frame
+        self.index = index
+        self.cube = cube
+        self.pager = pager
+        self.ranges = ranges
+        self.backend = backend
+        self.choices = {column: list(values) for column, values in (choices or {}).items()}
+        self.interval = interval
+        self.version = 0
+        self.rows_ingested = 0
+        self._seen = set()
+        self._task = None
+
+    @classmethod
+    def from_env(cls, **structures):
+        '''A LiveIngest for PENGUIN_INGEST_DIR (polled every PENGUIN_INGEST_INTERVAL s), None if unset'''
+        import os
+        directory = os.environ.get('PENGUIN_INGEST_DIR')
+        if not directory:
+            return None
+        return cls(directory, interval=float(os.environ.get('PENGUIN_INGEST_INTERVAL', 1.0)), **structures)
+
+    def start(self):
+        '''Start polling on the running event loop, if not already running (called by every session)'''
+        if self._task is None or self._task.done():
+            self._task = asyncio.get_running_loop().create_task(self._run())
+
+    async def _run(self):
+        while True:
+            try:
+                update = await asyncio.to_thread(self.ingest_new_files)
+                if update is not None:
+                    self.apply(update)
+            except Exception:
+                logger.exception('Live ingest from %s failed', self.directory)
+            await asyncio.sleep(self.interval)
+
+    def new_files(self):
+        paths = [path for pattern in PATTERNS for path in self.directory.glob(pattern) if not path.name.startswith('.')]
+        return sorted((path for path in paths if path not in self._seen), key=lambda path: (path.stat().st_mtime_ns, path.name))
+
+    def ingest_new_files(self):
+        '''Read the new files and build the appended frame and structures (off the event loop); returns
+        the update for apply(), or None if there was nothing new'''
+        import pandas as pd
+        df = self.frame.get()
+        batches = []
+        for path in self.new_files():
+            self._seen.add(path)
+            try:
+                df, batch = conform(read_drop(path), df)
+            except (OSError, ValueError, TypeError) as e:
+                logger.warning('Skipping %s: %s', path, e)
+                continue
+            batches.append(batch)
+        if not batches:
+            return None
+
+        # a later file may have recoded categoricals of df: bring the whole batch to df's final dtypes
+        batch = pd.concat(batches, ignore_index=True).astype(df.dtypes.to_dict())
+        appended = pd.concat([df, batch], ignore_index=True)
+        update = {'frame': appended, 'batch_rows': len(batch)}
+        if self.index is not None:
+            update['index'] = self.index.get().appended(batch)
+        if self.cube is not None:
+            update['cube'] = self.cube.get().appended(batch)
+        if self.pager is not None:
+            update['pager'] = self.pager.get().appended(appended)
+        if self.ranges is not None:
+            update['ranges'] = self.ranges.get().appended(appended, update.get('pager'))
+        if self.backend is not None:
+            update['backend'] = self.backend.get().appended(batch, appended, update.get('index'), update.get('cube'), update.get('ranges'))
+        update['choices'] = self._grown_choices(batch)
+        return update
+
+    def _grown_choices(self, batch):
+        choices = {}
+        for column, values in self.choices.items():
+            known = set(values)
+            new_values = [value for value in batch[column].astype(object).where(batch[column].notna(), MISSING_CHOICE).unique() if value not in known]
+            choices[column] = values + new_values
+        return choices
+
+    def apply(self, update):
+        '''Swap in an update from ingest_new_files() (on the event loop, so no calc sees half of it)'''
+        for name in ('frame', 'index', 'cube', 'pager', 'ranges', 'backend'):
+            if name in update:
+                getattr(self, name).set(update[name])
+        self.choices = update['choices']
+        self.rows_ingested += update['batch_rows']
+        self.version += 1
+
+
+def data_version(ingest, interval=0.5):
+    '''The session's view of the ingest's data version: a reactive that changes when rows were appended
+    (a constant 0 without live ingest).  Call from the server function'''
+    if ingest is None:
+        return lambda: 0
+    ingest.start()
+
+    @reactive.poll(lambda: ingest.version, interval)
+    def version():
+        return ingest.version
+    return version
+
+
+def grown_choices(sent, current, selected):
+    '''(choices, selected) for a checkbox group whose choices grew from `sent` to `current`, or None if
+    they didn't.  New values are only checked if everything was checked before (an unfiltered view)'''
+    if len(current) == len(sent):
+        return None
+    if set(sent) <= set(selected):
+        selected = list(selected) + [value for value in current if value not in sent]
+    return current, list(selected)
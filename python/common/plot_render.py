@@ -0,0 +1,139 @@
+# Cached, off-event-loop rendering of the plotnine chart.
+#
+# Building a ggplot and rasterizing it with matplotlib takes hundreds of milliseconds.  Done inside
+# render.plot it runs on the event-loop thread and stalls every other session of the worker.
+# PlotRenderer keeps finished PNGs in an LRU cache keyed by (filter state, category, output size, pixel
+# ratio) and renders cache misses in a pool of pre-warmed worker processes (pyplot isn't thread-safe,
+# so processes rather than threads).  Each worker loads the dataset itself through the shared data
+# source, so only the small filter key crosses the process boundary, not the filtered rows (narrowed
+# range sliders, part of the key, are applied with a range index the worker builds on first use).
+import asyncio
+import atexit
+import io
+import multiprocessing
+import os
+import tempfile
+from concurrent.futures import ProcessPoolExecutor
+
+from common.result_cache import LRUCache
+
+PPI = 96 # CSS pixels per inch, as render.plot uses
+
+_worker = {} # per worker process: frame and bitmap index, see _init_worker
+
+
+def penguin_ggplot(df, category):
+    from plotnine import ggplot, aes, geom_bar
+    return (
+        ggplot(df, aes(x='year', fill=category)) 
+        + geom_bar()
+        )
+
+
+def render_png(df, category, width, height, pixelratio):
+    '''PNG bytes of the penguin chart for `df`, sized like render.plot would for a width x height px output'''
+    with io.BytesIO() as buf:
+        penguin_ggplot(df, category).save(
+            buf, format='png', units='in', width=width / PPI, height=height / PPI, dpi=PPI * pixelratio, verbose=False)
+        return buf.getvalue()
+
+
+def _init_worker():
+    from common.bitmap_index import BitmapIndex
+    from common.data_source import load_penguins
+    _worker['df'] = load_penguins()
+    _worker['index'] = BitmapIndex(_worker['df'])
+    # Pre-warm: the first render pays for the plotnine/matplotlib imports, font cache and so on
+    render_png(_worker['df'].head(10), 'species', 100, 100, 1)
+
+
+def _render_filtered(filter_state, category, width, height, pixelratio):
+    species, island, sex, _, *ranges = filter_state # see common/result_cache.py's filter_key
+    if ranges:
+        if 'ranges' not in _worker:
+            from common.range_index import RangeIndex
+            _worker['ranges'] = RangeIndex(_worker['df'])
+        positions = _worker['ranges'].positions({column: (lo, hi) for column, lo, hi in ranges[0]},
+                                                _worker['index'].packed(species=species, island=island, sex=sex))
+        df = _worker['df'].take(positions)
+    else:
+        df = _worker['index'].take(_worker['df'], species=species, island=island, sex=sex)
+    return render_png(df, category, width, height, pixelratio)
+
+
+def _render_rows(df, category, width, height, pixelratio):
+    return render_png(df, category, width, height, pixelratio)
+
+
+def _ready():
+    return os.getpid()
+
+
+class PlotRenderer:
+    '''Render cache in front of a process pool.  The pool is started by start(), or else on the first render.'''
+
+    def __init__(self, workers=2, cache_size=64):
+        self.workers = workers
+        self.cache = LRUCache(maxsize=cache_size)
+        self._executor = None
+        self._warming = []
+
+    @classmethod
+    def from_env(cls):
+        return cls(
+            workers=int(os.environ.get('PENGUIN_RENDER_WORKERS', 2)),
+            cache_size=int(os.environ.get('PENGUIN_RENDER_CACHE_SIZE', 64)),
+        )
+
+    @property
+    def executor(self):
+        if self._executor is None:
+            # spawn: forking a process that runs an event loop (and maybe threads) isn't safe
+            self._executor = ProcessPoolExecutor(
+                max_workers=self.workers,
+                mp_context=multiprocessing.get_context('spawn'),
+                initializer=_init_worker,
+            )
+            # start (and warm) every worker now, not on the first misses
+            self._warming = [self._executor.submit(_ready) for _ in range(self.workers)]
+            atexit.register(self._executor.shutdown, wait=False, cancel_futures=True)
+        return self._executor
+
+    def start(self):
+        '''Start the pool's workers, which load the data and warm up in the background; returns self'''
+        self.executor
+        return self
+
+    def wait_ready(self):
+        '''Block until every started worker has loaded the data and warmed up'''
+        for future in self._warming:
+            future.result()
+
+    async def render(self, filter_state, category, width, height, pixelratio, version=0, df=None):
+        '''ImgData for render.image(delete_file=True): the PNG comes from the cache, or is rendered in the
+        pool without blocking the event loop, and is handed over as a temp file (render.image reads a path).
+
+        `version` is the data version (live ingest).  If `df` is given, the worker plots those rows
+        instead of filtering the data it loaded itself, which lacks the live-ingested rows'''
+        key = (filter_state, category, int(width), int(height), float(pixelratio))
+        png = self.cache.get((version, key))
+        if png is None:
+            loop = asyncio.get_running_loop()
+            if df is None:
+                png = await loop.run_in_executor(self.executor, _render_filtered, *key)
+            else:
+                png = await loop.run_in_executor(self.executor, _render_rows, df, *key[1:])
+            self.cache.put((version, key), png)
+        fd, path = tempfile.mkstemp(suffix='.png')
+        with os.fdopen(fd, 'wb') as f:
+            f.write(png)
+        return {
+            'src': path,
+            'width': int(width),
+            'height': int(height),
+        }
+
+
+def start_renderer():
+    '''PlotRenderer.from_env() with its pool started, so the first plot doesn't wait for it'''
+    return PlotRenderer.from_env().start()
@@ -0,0 +1,103 @@
+# Smaller plotly widget messages (PENGUIN_PLOTLY_PAYLOAD=compact).
+#
+# A FigureWidget sends its whole figure to the browser when it is created, then only the properties
+# that change.  With the default settings almost all of the first message is plotly's default
+# template: ~7.5 kB of styling for every trace type plotly knows (3-D scenes, maps, colorscales ...),
+# sent again with every new figure, while the bars themselves take a few hundred bytes.  In compact mode:
+#
+#  - compact_figure() swaps the template for a copy trimmed to what the figure's traces read (the
+#    cartesian layout defaults and the defaults of its trace types), so the chart looks the same;
+#  - array() gives long numeric arrays (bar x/y, marker opacity, scatter points) as numpy arrays, which
+#    the plotly widget serializer sends as typed binary buffers instead of JSON lists of numbers.  It
+#    does so for floats of either width and for integers up to 32 bits; 64-bit integers stay lists, as
+#    JavaScript has no typed array for them.  Values are only narrowed where none changes: integers to
+#    the smallest type that holds them, floats to float32 if each round-trips exactly (bar counts,
+#    slider steps), otherwise they stay float64.  A buffer costs ~100 bytes of dtype/shape/path
+#    bookkeeping, so arrays shorter than BINARY_MIN_LENGTH stay JSON lists: the bars of the penguin
+#    chart (one per year) are all short, the saving is for bigger data;
+#  - customdata() drops the per-trace/per-bar customdata, which the apps never read back, and
+#    compact_figure() drops trace properties plotly express sets to their default values.
+#
+# The template can't be cached in the browser instead: the plotly widget only takes a figure with its
+# layout, and shinywidgets sends that layout twice when a figure is rendered (once more after setting
+# its margins), so every byte cut from the template is saved twice per new figure.
+#
+# The default (json) mode leaves the figures as they were.  track_widget_payloads() records the size of
+# every widget message a session is sent (with PENGUIN_METRICS=1), and
+# python/benchmarks/bench_payload.py compares the bytes sent per interaction in both modes.
+import functools
+import os
+
+PAYLOAD_MODES = ('json', 'compact')
+PAYLOAD_MODE = os.environ.get('PENGUIN_PLOTLY_PAYLOAD', 'json')
+if PAYLOAD_MODE not in PAYLOAD_MODES:
+    raise ValueError(f'Unknown PENGUIN_PLOTLY_PAYLOAD {PAYLOAD_MODE!r}, expected one of {list(PAYLOAD_MODES)}')
+COMPACT = PAYLOAD_MODE == 'compact'
+
+# Parts of the default template's layout that a chart on x/y axes uses (its trace types pick the data part)
+TEMPLATE_LAYOUT = ('autotypenumbers', 'colorway', 'font', 'hovermode', 'hoverlabel', 'paper_bgcolor', 'plot_bgcolor',
+                   'xaxis', 'yaxis', 'title')
+
+# Trace properties plotly express sets to the value plotly.js uses anyway (for bars on the x/y axes)
+DEFAULT_TRACE_PROPERTIES = {'xaxis': 'x', 'yaxis': 'y', 'orientation': 'v', 'showlegend': True, 'textposition': 'auto'}
+
+BINARY_MIN_LENGTH = 32 # shorter arrays are smaller as JSON than as base64 buffers
+INT_TYPES = ('int8', 'int16', 'int32')
+
+
+@functools.lru_cache(maxsize=None)
+def trimmed_template(trace_types, name=None):
+    '''The template `name` (the default template if None) with only the parts used by x/y charts of the
+    given trace types (a tuple, e.g. ('bar',))'''
+    import plotly.graph_objects as go
+    import plotly.io as pio
+    template = pio.templates[name or pio.templates.default].to_plotly_json()
+    return go.layout.Template(
+        layout={key: value for key, value in template.get('layout', {}).items() if key in TEMPLATE_LAYOUT},
+        data={key: value for key, value in template.get('data', {}).items() if key in trace_types},
+    )
+
+
+def bar_template(name=None):
+    '''trimmed_template() of bar charts'''
+    return trimmed_template(('bar',), name)
+
+
+def array(values):
+    '''`values` as a compact numeric array (compact mode, numeric values) or a list'''
+    import numpy as np
+    values = np.asarray(values)
+    if not COMPACT or values.ndim != 1 or values.dtype.kind not in 'iuf' or len(values) < BINARY_MIN_LENGTH:
+        return values.tolist()
+    if values.dtype.kind == 'f':
+        narrow = values.astype(np.float32)
+        return narrow if np.array_equal(narrow, values, equal_nan=True) else values
+    low, high = values.min(), values.max()
+    for dtype in INT_TYPES:
+        info = np.iinfo(dtype)
+        if info.min <= low and high <= info.max:
+            return values.astype(dtype)
+    return values # beyond int32: a JSON list, as plotly sends 64-bit integers
+
+
+def customdata(values):
+    '''Trace customdata, None (not sent) in compact mode'''
+    return None if COMPACT else values
+
+
+def compact_figure(fig, trace_types=None):
+    '''In compact mode, trims the figure's template to its trace types (those of its traces if None:
+    pass the types of traces added later), drops customdata and default-valued properties of its
+    traces and makes their x/y arrays compact (in place).  Returns the figure'''
+    if not COMPACT:
+        return fig
+    fig.layout.template = trimmed_template(tuple(sorted(trace_types or {trace.type for trace in fig.data})))
+    for trace in fig.data:
+        trace.customdata = None
+        for name, default in DEFAULT_TRACE_PROPERTIES.items():
+            if name in trace and trace[name] == default:
+                trace[name] = None
+        for axis in ('x', 'y'):
+            if trace[axis] is not None:
+                trace[axis] = array(trace[axis])
+    return fig
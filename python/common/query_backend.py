@@ -0,0 +1,264 @@
+# Query backends for the filter and summary stages of the apps.
+#
+# PENGUIN_BACKEND picks the engine behind filter_penguins / summarize_penguins / select_segments:
+#
+#   pandas (default)  the reference implementation: the bitmap index takes the filtered rows into a
+#                     frame and the count cube answers the summaries (common/bitmap_index.py,
+#                     common/count_cube.py).  Range filters on numeric columns go through the presorted
+#                     range index (common/range_index.py); the summary of a range-filtered result is
+#                     one bincount of its rows' cube cells.
+#   duckdb            the frame is loaded once into a table of an in-process DuckDB database (requires
+#                     `pip install duckdb`).  A summary is one filter + group + count query, run by
+#                     DuckDB's own thread pool.  filter() runs nothing: it returns QueryRows, the WHERE
+#                     clause of the filtered rows.  len() of it is a COUNT(*), and table_view fetches
+#                     only the window of rows it displays (ORDER BY ... LIMIT ... OFFSET).
+#
+# Both backends follow the same semantics (Series.isin() selections, groupby counts, the table
+# pager's sort order), and row positions of the frame stay the row labels of every result.
+# python/benchmarks/bench_query_backends.py --check is their equivalence suite: it fails when any
+# result differs from the pandas backend's.  Run it after changing a backend.
+#
+# A Polars backend is deliberately deferred, not half-done: DuckDB already covers the out-of-pandas
+# engine, and its lazy window fetch (QueryRows) is what the table pager needs.  A Polars backend would
+# be another class with this interface, registered in BACKENDS and checked by the same script.
+import importlib.util
+import os
+
+from common.bitmap_index import NA, value_key
+
+HAVE_DUCKDB = importlib.util.find_spec('duckdb') is not None
+
+ROW = '_row' # position of a row in the frame, the extra column of the DuckDB table
+
+
+class PandasBackend:
+    '''Filters with a BitmapIndex (and a RangeIndex) and summarizes with a CountCube (any may be None if unused)'''
+
+    name = 'pandas'
+
+    def __init__(self, frame, index=None, cube=None, range_index=None):
+        self.frame = frame
+        self.index = index
+        self.cube = cube
+        self.range_index = range_index
+
+    def _positions(self, ranges, selections):
+        return self.range_index.positions(ranges, self.index.packed(**selections))
+
+    def filter(self, ranges=None, **selections):
+        '''Frame of the rows that pass the selections (isin semantics) and the {column: (lo, hi)}
+        ranges (inclusive), keeping their row labels'''
+        if ranges:
+            return self.frame.take(self._positions(ranges, selections))
+        return self.index.take(self.frame, **selections)
+
+    def select_cells(self, rows, selection):
+        '''Rows of a filter() result inside the cells of a CellSelection (common/cell_selection.py)'''
+        return self.cube.select_lookup(rows, selection.category, selection.lookup_for(self.cube))
+
+    def summarize(self, category, ranges=None, **selections):
+        '''Counts per year and category value of the rows that pass the selections and ranges'''
+        if ranges:
+            positions = self._positions(ranges, selections)
+            return self.cube.summarize_rows(category, positions, self.frame[self.cube.measure].notna().to_numpy()[positions])
+        return self.cube.summarize(category, **selections)
+
+    def materialize(self, rows):
+        '''A filter() result as a frame'''
+        return rows
+
+    def column_values(self, rows, columns):
+        '''{column: float64 array, NaN for missing values} of numeric columns of a filter() result'''
+        return _frame_values(rows, columns)
+
+    def appended(self, batch, frame, index=None, cube=None, range_index=None):
+        '''The backend for `frame`, this backend's frame with `batch` appended (see common/live_ingest.py)'''
+        return PandasBackend(frame, index, cube, range_index)
+
+
+def _frame_values(df, columns):
+    import numpy as np
+    return {column: df[column].to_numpy(dtype=np.float64, na_value=np.nan) for column in columns}
+
+
+def _quoted(column):
+    return '"' + str(column).replace('"', '""') + '"'
+
+
+def _param(value):
+    return value.item() if hasattr(value, 'item') else value # numpy scalars
+
+
+def _value_test(column, value, params):
+    if value_key(value) is NA:
+        return f'{_quoted(column)} IS NULL'
+    params.append(_param(value))
+    return f'{_quoted(column)} = ?'
+
+
+def _selection_clause(column, values, params):
+    '''SQL test for "value is one of `values`" with isin semantics (missing matches a selected missing value)'''
+    keys = {value_key(value) for value in values}
+    present = [value for value in keys if value is not NA]
+    terms = []
+    if present:
+        terms.append(f'{_quoted(column)} IN ({", ".join("?" * len(present))})')
+        params.extend(_param(value) for value in present)
+    if NA in keys:
+        terms.append(f'{_quoted(column)} IS NULL')
+    return '(' + ' OR '.join(terms) + ')' if terms else 'FALSE'
+
+
+class QueryRows:
+    '''The rows of a DuckDBBackend table matching a WHERE clause, fetched only when asked for'''
+
+    def __init__(self, backend, where, params):
+        self.backend = backend
+        self.where = where
+        self.params = params
+        self._len = None
+
+    def __len__(self):
+        if self._len is None:
+            self._len = self.backend.fetchone(f'SELECT count(*) FROM {self.backend.table} WHERE {self.where}', self.params)[0]
+        return self._len
+
+    def window(self, offset, size, sort_column=None, descending=False):
+        '''Frame of `size` rows from `offset` on, in the table pager's order: by `sort_column` with missing
+        values last (ties in row order, reversed with the values when descending), else in row order'''
+        if not sort_column:
+            order = ROW
+        elif descending:
+            order = f'{_quoted(sort_column)} DESC NULLS LAST, CASE WHEN {_quoted(sort_column)} IS NULL THEN {ROW} ELSE -{ROW} END'
+        else:
+            order = f'{_quoted(sort_column)} ASC NULLS LAST, {ROW}'
+        return self.backend.fetch_rows(f'WHERE {self.where} ORDER BY {order} LIMIT {int(size)} OFFSET {int(offset)}', self.params)
+
+    def to_pandas(self):
+        return self.backend.fetch_rows(f'WHERE {self.where} ORDER BY {ROW}', self.params)
+
+    def chunks(self, vectors=1):
+        '''Frames of the rows in row order, `vectors` DuckDB vectors (of 2048 rows) at a time.  Streamed
+        from a cursor of their own, so only one chunk is in memory and the backend's other queries go
+        on meanwhile.  No ORDER BY: the table is inserted in row order, which its scans keep'''
+        cursor = self.backend.con.cursor()
+        try:
+            result = cursor.execute(f'SELECT * FROM {self.backend.table} WHERE {self.where}', self.params)
+            while True:
+                df = result.fetch_df_chunk(vectors)
+                if not len(df):
+                    return
+                yield self.backend.conform(df)
+        finally:
+            cursor.close()
+
+
+class DuckDBBackend:
+    '''Runs the queries on a copy of `frame` in an in-process DuckDB table'''
+
+    name = 'duckdb'
+
+    def __init__(self, frame, measure='body_mass_g', table='penguins'):
+        import duckdb
+        import numpy as np
+        self.con = duckdb.connect()
+        self.table = table
+        self.measure = measure
+        self.columns = list(frame.columns)
+        self.dtypes = frame.dtypes.to_dict()
+        self.n_rows = len(frame)
+        self.con.register('frame_source', frame.assign(**{ROW: np.arange(len(frame))}))
+        self.con.execute(f'CREATE TABLE {table} AS SELECT {self._select_list(frame)} FROM frame_source ORDER BY {ROW}')
+        self.con.unregister('frame_source')
+
+    def _select_list(self, frame):
+        # categoricals are stored as VARCHAR (not ENUM), so appended rows may bring new categories
+        import pandas as pd
+        columns = [f'CAST({_quoted(column)} AS VARCHAR) AS {_quoted(column)}' if isinstance(dtype, pd.CategoricalDtype) else _quoted(column)
+                   for column, dtype in frame.dtypes.items()]
+        return ', '.join(columns + [ROW])
+
+    def fetchone(self, sql, params):
+        return self.con.execute(sql, params).fetchone()
+
+    def fetch_rows(self, clauses, params):
+        '''Frame of the table rows selected by `clauses`, with the frame's dtypes and row labels'''
+        return self.conform(self.con.execute(f'SELECT * FROM {self.table} {clauses}', params).df())
+
+    def conform(self, df):
+        '''A frame of table rows with the frame's dtypes and row labels'''
+        import numpy as np
+        df = df.set_index(ROW)
+        df.index.name = None
+        for column in df.columns: # DuckDB gives None for NULL strings, the frame has NaN
+            if df[column].dtype == object and self.dtypes[column] == object:
+                df[column] = df[column].where(df[column].notna(), np.nan)
+        return df.astype(self.dtypes)
+
+    def _where(self, selections, ranges=None):
+        params = []
+        clauses = [f'{ROW} < {self.n_rows}'] # rows appended later are not part of this result
+        clauses += [_selection_clause(column, values, params) for column, values in selections.items()]
+        for column, (lo, hi) in (ranges or {}).items(): # bounds of a float32 (FLOAT) column bound as FLOAT, see common/range_index.py
+            sql_type = 'FLOAT' if self.dtypes[column] == 'float32' else 'DOUBLE'
+            clauses.append(f'{_quoted(column)} BETWEEN CAST(? AS {sql_type}) AND CAST(? AS {sql_type})')
+            params += [float(lo), float(hi)]
+        return ' AND '.join(clauses), params
+
+    def filter(self, ranges=None, **selections):
+        return QueryRows(self, *self._where(selections, ranges))
+
+    def select_cells(self, rows, selection):
+        params = list(rows.params)
+        tests = [f'({_value_test(selection.category, value, params)} AND {_value_test("year", year, params)})' for value, year in selection.cells()]
+        return QueryRows(self, f'{rows.where} AND (' + (' OR '.join(tests) or 'FALSE') + ')', params)
+
+    def summarize(self, category, ranges=None, **selections):
+        where, params = self._where(selections, ranges)
+        df = self.con.execute(f'''
+            SELECT "year", {_quoted(category)}, count({_quoted(self.measure)}) AS "count"
+            FROM {self.table}
+            WHERE {where} AND "year" IS NOT NULL AND {_quoted(category)} IS NOT NULL
+            GROUP BY ALL ORDER BY ALL''', params).df()
+        return df.astype({'year': self.dtypes['year'], category: self.dtypes[category], 'count': 'int64'})
+
+    def materialize(self, rows):
+        return rows.to_pandas()
+
+    def column_values(self, rows, columns):
+        '''Only the given columns are fetched (`rows` may also be a frame, e.g. rows selected elsewhere)'''
+        if not isinstance(rows, QueryRows):
+            return _frame_values(rows, columns)
+        df = self.con.execute(f'SELECT {", ".join(_quoted(column) for column in columns)} FROM {self.table} WHERE {rows.where} ORDER BY {ROW}', rows.params).df()
+        return _frame_values(df, columns)
+
+    def appended(self, batch, frame, index=None, cube=None, range_index=None):
+        '''Inserts `batch` into the table and returns a backend that includes its rows.  Runs on its own
+        cursor, so it can run in a worker thread while queries of the current backend go on'''
+        import numpy as np
+        backend = object.__new__(DuckDBBackend)
+        backend.__dict__.update(self.__dict__)
+        backend.dtypes = frame.dtypes.to_dict()
+        backend.n_rows = len(frame)
+        cursor = self.con.cursor()
+        try:
+            cursor.register('batch_source', batch.assign(**{ROW: np.arange(self.n_rows, len(frame))}))
+            cursor.execute(f'INSERT INTO {self.table} SELECT {self._select_list(batch)} FROM batch_source ORDER BY {ROW}')
+        finally:
+            cursor.close()
+        return backend
+
+
+BACKENDS = {'pandas': PandasBackend, 'duckdb': DuckDBBackend}
+
+
+def query_backend(frame, index=None, cube=None, range_index=None, name=None):
+    '''The backend named by PENGUIN_BACKEND (or `name`) over `frame`'''
+    name = name or os.environ.get('PENGUIN_BACKEND', 'pandas')
+    if name not in BACKENDS:
+        raise ValueError(f'Unknown PENGUIN_BACKEND {name!r}, expected one of {list(BACKENDS)}')
+    if name == 'duckdb':
+        if not HAVE_DUCKDB:
+            raise ImportError('duckdb is required for PENGUIN_BACKEND=duckdb')
+        return DuckDBBackend(frame)
+    return PandasBackend(frame, index, cube, range_index)
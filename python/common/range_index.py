@@ -0,0 +1,113 @@
+# Presorted indexes of the numeric columns behind the sidebar's range sliders.
+#
+# Each range column keeps its rows in ascending value order, built once at load: the rows with
+# lo <= value <= hi are then one contiguous slice of that order, found with two binary searches.  The
+# orders are the ones the table pager already precomputed for sorting (common/table_pager.py), so
+# nothing is sorted twice.
+#
+# The binary searches also give each range's row count before any row is touched, which decides how
+# the ranges are combined with the categorical filters (the bitmap index's packed bitset):
+#   - the narrowest range holds few rows: only its slice is visited.  The slice is put in row order and
+#     the other ranges and the categorical bits are tested on those rows alone, no pass over the frame.
+#   - every range holds a large part of the rows: scattering most of the rows from the sorted order
+#     costs more than one sequential comparison per column, so the columns are compared instead.
+#
+# A slider left at the column's full extent is no filter at all (see normalized_ranges), so rows with
+# a missing value only drop out once a range is narrowed.
+#
+# Values are compared in the column's own type: a compact frame's float32 column holds 45.1 as
+# 45.0999985, so a bound of 45.1 is rounded to float32 too (see value_type) or it would drop the rows
+# the table shows as 45.1.
+import numpy as np
+
+from common.startup import RANGE_COLUMNS
+
+NARROW_FRACTION = 1 / 16 # a range with at most this fraction of the rows is answered from its slice
+
+
+def value_type(dtype):
+    '''numpy type the values of a column of `dtype` are compared in: float32 stays float32, anything
+    else is compared as float64'''
+    return np.float32 if dtype == np.float32 else np.float64
+
+
+def normalized_ranges(ranges, bounds):
+    '''{column: (lo, hi)} of the ranges narrower than the column's (min, max) bounds, for the slider
+    values `ranges` (a (lo, hi) pair or None per column)'''
+    narrowed = {}
+    for column, value_range in (ranges or {}).items():
+        if value_range is None:
+            continue
+        lo, hi = float(value_range[0]), float(value_range[1])
+        low, high = bounds[column]
+        if lo > low or hi < high:
+            narrowed[column] = (lo, hi)
+    return narrowed
+
+
+class RangeIndex:
+    '''Ascending row order and sorted values of each range column of a frame'''
+
+    def __init__(self, df, pager=None, columns=RANGE_COLUMNS):
+        self.n_rows = len(df)
+        self.columns = [column for column in columns if column in df.columns]
+        self.values = {} # in row order, for the comparisons of wide ranges
+        self.orders = {} # rows with a value, in ascending value order
+        self.sorted_values = {}
+        self.types = {} # value_type of each column
+        for column in self.columns:
+            self.types[column] = value_type(df[column].dtype)
+            values = df[column].to_numpy(dtype=self.types[column], na_value=np.nan)
+            if pager is not None: # reuse the pager's order: missing values last, ties in row order
+                order, n_valid = pager.sort_orders[column]
+            else:
+                order, n_valid = np.argsort(values, kind='stable'), int(np.count_nonzero(~np.isnan(values)))
+            self.values[column] = values
+            self.orders[column] = order[:n_valid]
+            self.sorted_values[column] = values[self.orders[column]]
+
+    def bounds(self, column, lo, hi):
+        '''(lo, hi) in the column's value type'''
+        return self.types[column](lo), self.types[column](hi)
+
+    def span(self, column, lo, hi):
+        '''(start, stop) of the rows with lo <= value <= hi in the column's sorted order'''
+        lo, hi = self.bounds(column, lo, hi)
+        values = self.sorted_values[column]
+        return int(np.searchsorted(values, lo, side='left')), int(np.searchsorted(values, hi, side='right'))
+
+    def rows(self, column, lo, hi):
+        '''Row positions (in value order) with lo <= value <= hi'''
+        start, stop = self.span(column, lo, hi)
+        return self.orders[column][start:stop]
+
+    def positions(self, ranges, packed=None):
+        '''Sorted row positions inside every (lo, hi) range of `ranges` ({column: (lo, hi)}) and, if
+        given, set in `packed` (a packed row bitset, as BitmapIndex.packed() of the categorical filters)'''
+        ranges = {column: self.bounds(column, lo, hi) for column, (lo, hi) in (ranges or {}).items()}
+        if not ranges:
+            mask = np.ones(self.n_rows, dtype=bool) if packed is None else np.unpackbits(packed, count=self.n_rows).view(bool)
+            return np.flatnonzero(mask)
+        spans = sorted((stop - start, column, start, stop) for column, (start, stop) in
+                       ((column, self.span(column, lo, hi)) for column, (lo, hi) in ranges.items()))
+        size, narrowest, start, stop = spans[0]
+        if size <= self.n_rows * NARROW_FRACTION:
+            rows = np.sort(self.orders[narrowest][start:stop])
+            for column, (lo, hi) in ranges.items():
+                if column != narrowest:
+                    values = self.values[column][rows]
+                    rows = rows[(values >= lo) & (values <= hi)]
+            if packed is not None:
+                rows = rows[(packed[rows >> 3] >> (7 - (rows & 7)).astype(np.uint8)) & 1 == 1]
+            return rows
+        mask = np.ones(self.n_rows, dtype=bool) if packed is None else np.unpackbits(packed, count=self.n_rows).view(bool)
+        for column, (lo, hi) in ranges.items():
+            values = self.values[column]
+            mask &= values >= lo
+            mask &= values <= hi
+        return np.flatnonzero(mask)
+
+    def appended(self, df, pager=None):
+        '''A new index for `df`, the index's frame with rows appended (with the appended pager's merged
+        orders, nothing is sorted again)'''
+        return RangeIndex(df, pager, self.columns)
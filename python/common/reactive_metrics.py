@@ -0,0 +1,277 @@
+# Opt-in timing of the apps' reactive calcs, effects and render functions.
+#
+# With PENGUIN_METRICS=1, functions decorated with @timed record their wall time, call count and output
+# size, per session and in total, into fixed-bucket histograms.  They are served on /metrics (Prometheus
+# text, or ?format=json), and carry per-session data, so they must not be reachable from outside:
+#
+#  - with PENGUIN_METRICS_PORT set, on a listener of their own at PENGUIN_METRICS_HOST (127.0.0.1 by
+#    default):PENGUIN_METRICS_PORT, started by with_metrics_route() in a thread of the worker.  The app's
+#    port doesn't serve them at all, so a reverse proxy in front of it can't expose them.  This is the
+#    setup to use in production (with several workers per host, only the first to bind the port serves);
+#  - otherwise with_metrics_route() puts the Shiny App behind a small Starlette app with a /metrics route
+#    next to it.  Behind a reverse proxy (nginx, Connect, shinyapps.io) every request comes from
+#    127.0.0.1, so a local client address proves nothing: requests with proxy forwarding headers are
+#    refused, and setting PENGUIN_METRICS_TOKEN requires `Authorization: Bearer <token>` on every request
+#    (on the separate listener as well).  Don't route /metrics through the proxy either way.
+#
+# With metrics off, timed() returns the function untouched and with_metrics_route() returns the App
+# itself, so nothing is added to the reactive graph.
+#
+# Decorator placement: under @reactive.calc / @reactive.effect (times the function body), over
+# @render.* (times the whole render, including the renderer's serialization of the value, and sizes
+# the message that is sent to the browser).  track_widget_payloads(session) also sizes the widget
+# messages (plotly figures and their updates) a session is sent.
+import functools
+import hmac
+import inspect
+import json
+import os
+import threading
+import time
+
+METRICS_ENABLED = os.environ.get('PENGUIN_METRICS', '') not in ('', '0', 'false', 'False')
+METRICS_HOST = os.environ.get('PENGUIN_METRICS_HOST', '127.0.0.1')
+METRICS_PORT = int(os.environ.get('PENGUIN_METRICS_PORT', 0)) # 0: /metrics on the app's own port
+METRICS_TOKEN = os.environ.get('PENGUIN_METRICS_TOKEN', '')
+
+TIME_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10) # seconds
+SIZE_BUCKETS = tuple(256 * 4 ** i for i in range(10)) # bytes, 256B .. 64MB
+
+TOTAL = 'all' # session label of the process-wide series
+
+
+class Histogram:
+    '''Cumulative-bucket histogram (Prometheus style) with a count and a sum'''
+
+    def __init__(self, bounds):
+        self.bounds = bounds
+        self.buckets = [0] * (len(bounds) + 1) # the last bucket is +Inf
+        self.count = 0
+        self.sum = 0
+
+    def observe(self, value):
+        i = 0
+        while i < len(self.bounds) and value > self.bounds[i]:
+            i += 1
+        self.buckets[i] += 1
+        self.count += 1
+        self.sum += value
+
+    def cumulative(self):
+        '''(upper bound, observations <= bound) pairs, ending with +Inf'''
+        total = 0
+        for bound, n in zip(self.bounds + (float('inf'),), self.buckets):
+            total += n
+            yield bound, total
+
+    def to_dict(self):
+        return {
+            'count': self.count,
+            'sum': self.sum,
+            'buckets': {('+Inf' if bound == float('inf') else bound): n for bound, n in self.cumulative()},
+        }
+
+
+def output_size(value):
+    '''Approximate size in bytes of a calc's or renderer's result'''
+    if value is None:
+        return 0
+    if isinstance(value, (str, bytes)):
+        return len(value)
+    if hasattr(value, 'memory_usage'): # pandas DataFrame / Series
+        usage = value.memory_usage(index=True)
+        return int(usage.sum() if hasattr(usage, 'sum') else usage)
+    if hasattr(value, 'nbytes'): # numpy arrays
+        return int(value.nbytes)
+    try:
+        return len(json.dumps(value, default=str))
+    except (TypeError, ValueError):
+        return len(str(value))
+
+
+def _session_id():
+    from shiny.session import get_current_session
+    session = get_current_session()
+    return getattr(session, 'id', None)
+
+
+class ReactiveMetrics:
+    '''Time and size histograms per (reactive name, session), plus the totals over all sessions'''
+
+    def __init__(self, time_buckets=TIME_BUCKETS, size_buckets=SIZE_BUCKETS):
+        self.time_buckets = time_buckets
+        self.size_buckets = size_buckets
+        self._series = {} # (name, session label) -> (time histogram, size histogram)
+        self._sessions = set()
+        self._lock = threading.Lock()
+
+    def record(self, name, seconds, size, session_id=None, session=None):
+        '''One observation; `seconds` is None for things that only have a size (messages)'''
+        labels = [TOTAL] if session_id is None else [TOTAL, session_id]
+        with self._lock:
+            for label in labels:
+                if (name, label) not in self._series:
+                    self._series[(name, label)] = (Histogram(self.time_buckets), Histogram(self.size_buckets))
+                times, sizes = self._series[(name, label)]
+                if seconds is not None:
+                    times.observe(seconds)
+                sizes.observe(size)
+        if session_id is not None and session_id not in self._sessions:
+            self._track_session(session_id, session)
+
+    def _track_session(self, session_id, session=None):
+        '''Drop a session's own series when it ends (its observations stay in the totals)'''
+        from shiny.session import get_current_session
+        self._sessions.add(session_id)
+        (session or get_current_session()).on_ended(lambda: self.end_session(session_id))
+
+    def end_session(self, session_id):
+        with self._lock:
+            self._sessions.discard(session_id)
+            for key in [key for key in self._series if key[1] == session_id]:
+                del self._series[key]
+
+    def clear(self):
+        with self._lock:
+            self._series.clear()
+
+    def timed(self, fn=None, name=None):
+        '''Decorator recording each call of a calc/effect function or of a renderer'''
+        if fn is None:
+            return lambda fn: self.timed(fn, name)
+        if not METRICS_ENABLED:
+            return fn
+        if hasattr(fn, 'render') and hasattr(fn, 'output_id'): # a shiny Renderer: wrap its render() step
+            self._wrap_renderer(fn, name or fn.__name__)
+            return fn
+
+        name = name or fn.__name__
+        if inspect.iscoroutinefunction(fn):
+            @functools.wraps(fn)
+            async def timed_fn(*args, **kwargs):
+                start = time.perf_counter()
+                value = await fn(*args, **kwargs)
+                self.record(name, time.perf_counter() - start, output_size(value), _session_id())
+                return value
+        else:
+            @functools.wraps(fn)
+            def timed_fn(*args, **kwargs):
+                start = time.perf_counter()
+                value = fn(*args, **kwargs)
+                self.record(name, time.perf_counter() - start, output_size(value), _session_id())
+                return value
+        return timed_fn
+
+    def _wrap_renderer(self, renderer, name):
+        render = renderer.render
+
+        @functools.wraps(render)
+        async def timed_render():
+            start = time.perf_counter()
+            value = await render()
+            self.record(name, time.perf_counter() - start, output_size(value), _session_id())
+            return value
+
+        renderer.render = timed_render
+
+    def snapshot(self):
+        '''{name: {session: {'seconds': histogram dict, 'bytes': histogram dict}}}'''
+        with self._lock:
+            out = {}
+            for (name, label), (times, sizes) in sorted(self._series.items()):
+                out.setdefault(name, {})[label] = {'seconds': times.to_dict(), 'bytes': sizes.to_dict()}
+            return out
+
+    def prometheus(self):
+        '''The histograms in the Prometheus text exposition format'''
+        lines = []
+        with self._lock:
+            series = sorted(self._series.items())
+            for metric, unit, index in (('penguin_reactive_seconds', 'Wall time', 0), ('penguin_reactive_bytes', 'Output size', 1)):
+                lines.append(f'# HELP {metric} {unit} of each reactive calc, effect and render function')
+                lines.append(f'# TYPE {metric} histogram')
+                for (name, label), histograms in series:
+                    histogram = histograms[index]
+                    if not histogram.count: # size-only series (widget messages) have no times
+                        continue
+                    labels = f'name="{name}",session="{label}"'
+                    for bound, n in histogram.cumulative():
+                        le = '+Inf' if bound == float('inf') else repr(bound)
+                        lines.append(f'{metric}_bucket{{{labels},le="{le}"}} {n}')
+                    lines.append(f'{metric}_sum{{{labels}}} {histogram.sum}')
+                    lines.append(f'{metric}_count{{{labels}}} {histogram.count}')
+        return '\n'.join(lines) + '\n'
+
+
+reactive_metrics = ReactiveMetrics()
+timed = reactive_metrics.timed
+
+
+WIDGET_MESSAGES = ('shinywidgets_comm_open', 'shinywidgets_comm_msg', 'shinywidgets_comm_close')
+
+
+def track_widget_payloads(session):
+    '''Record the size of every widget message sent to `session` (figure creation and updates, as
+    "widget:<message type>", sizes only).  Does nothing with metrics off'''
+    if not METRICS_ENABLED:
+        return
+    send = session.send_custom_message
+
+    async def send_custom_message(type, message):
+        if type in WIDGET_MESSAGES:
+            size = len(message) if isinstance(message, str) else output_size(message) # shinywidgets sends JSON text
+            reactive_metrics.record(f'widget:{type}', None, size, session.id, session)
+        await send(type, message)
+
+    session.send_custom_message = send_custom_message
+
+
+LOCAL_CLIENTS = ('127.0.0.1', '::1', 'localhost')
+FORWARDING_HEADERS = ('forwarded', 'x-forwarded-for', 'x-forwarded-host', 'x-real-ip') # set by reverse proxies
+
+
+def allowed(request, token=METRICS_TOKEN):
+    '''Whether `request` may read the metrics: the bearer token when one is configured, and a local
+    client that didn't come through a proxy'''
+    if token and not hmac.compare_digest(request.headers.get('authorization', ''), f'Bearer {token}'):
+        return False
+    if request.client is None or request.client.host not in LOCAL_CLIENTS:
+        return False
+    return not any(header in request.headers for header in FORWARDING_HEADERS)
+
+
+async def metrics_endpoint(request):
+    from starlette.responses import JSONResponse, PlainTextResponse
+    if not allowed(request):
+        return PlainTextResponse('Forbidden', status_code=403)
+    if request.query_params.get('format') == 'json':
+        return JSONResponse(reactive_metrics.snapshot())
+    return PlainTextResponse(reactive_metrics.prometheus(), media_type='text/plain; version=0.0.4')
+
+
+def serve_metrics(host=METRICS_HOST, port=METRICS_PORT, path='/metrics'):
+    '''Serve the metrics on a listener of their own at host:port, in a daemon thread; returns the thread'''
+    import uvicorn
+    from starlette.applications import Starlette
+    from starlette.routing import Route
+    server = uvicorn.Server(uvicorn.Config(Starlette(routes=[Route(path, metrics_endpoint)]), host=host, port=port,
+                                           lifespan='off', log_level='warning'))
+    thread = threading.Thread(target=server.run, name='metrics', daemon=True) # no signal handlers off the main thread
+    thread.start()
+    return thread
+
+
+def with_metrics_route(app, path='/metrics'):
+    '''`app` with a metrics route next to it (or `app` itself, the metrics on their own listener with
+    PENGUIN_METRICS_PORT), or `app` itself when metrics are off'''
+    if not METRICS_ENABLED:
+        return app
+    if METRICS_PORT:
+        serve_metrics(path=path)
+        return app
+    from starlette.applications import Starlette
+    from starlette.routing import Mount, Route
+    return Starlette(
+        routes=[Route(path, metrics_endpoint), Mount('/', app=app)],
+        lifespan=app.starlette_app.router.lifespan_context, # the Shiny App's startup/shutdown hooks
+    )
@@ -0,0 +1,142 @@
+# Process-wide LRU cache for per-filter results (filtered frames, summaries, ...).
+#
+# The reactive calcs of a Shiny session only cache for that session.  Many sessions ask for the same
+# filter combinations, so results are also kept here, keyed by the normalized filter state, where
+# every session (and every app variant running in the process) can reuse them.  Cached values are
+# shared between sessions and must be treated as read-only.
+#
+# Besides the entry count, the cache is bounded by the bytes of the frames it holds (the filtered rows
+# are a copy of part of the dataset frame; PENGUIN_CACHE_BYTES, 64 MB by default): least recently used
+# entries are evicted until both limits hold, and a frame larger than the whole budget isn't cached.
+# Other values (row counts, QueryRows of the duckdb backend) are small and only count as entries.
+#
+# A warm cache (common/warm_cache.py, precomputed views of every filter state) can be attached behind
+# it: a key that isn't cached yet is looked up there before it is computed.
+import os
+import threading
+from collections import OrderedDict
+
+
+def filter_key(species, island, sex, category=None, ranges=None):
+    '''Normalized, hashable filter state: the order the boxes were checked in doesn't matter.  Narrowed
+    range sliders ({column: (lo, hi)}, see common/range_index.py) add a fifth element, so the keys of
+    states without them (those the warm cache has) are unchanged'''
+    from common.bitmap_index import value_key # imported here: bitmap_index pulls in pandas (lazy startup)
+    def normalized(values):
+        return tuple(sorted({value_key(value) for value in values}, key=repr))
+    key = (normalized(species), normalized(island), normalized(sex), category)
+    if ranges:
+        key += (tuple(sorted((column, float(lo), float(hi)) for column, (lo, hi) in ranges.items())),)
+    return key
+
+
+def value_bytes(value):
+    '''Memory held by a cached value: the buffers of a frame or series, 0 for anything else.  Not deep:
+    the strings of object columns are shared with the dataset frame, a copy only adds its pointers'''
+    memory_usage = getattr(value, 'memory_usage', None)
+    if memory_usage is None:
+        return 0
+    usage = memory_usage(index=True, deep=False)
+    return int(usage.sum() if hasattr(usage, 'sum') else usage)
+
+
+class LRUCache:
+    '''Thread-safe mapping with at most `maxsize` entries holding at most `maxbytes` bytes of frames
+    (None: no limit), evicting the least recently used ones'''
+
+    def __init__(self, maxsize=256, maxbytes=None):
+        self.maxsize = maxsize
+        self.maxbytes = maxbytes
+        self.nbytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.warm_hits = 0
+        self.warm = None
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def attach(self, warm):
+        '''Look up keys missing from the cache in `warm` (anything with lookup(key) -> value or None) before
+        computing them'''
+        self.warm = warm
+
+    def _from_warm(self, key):
+        '''Value of `key` in the attached warm cache (then also cached here), or None'''
+        if self.warm is None:
+            return None
+        value = self.warm.lookup(key)
+        if value is not None:
+            with self._lock:
+                self.warm_hits += 1
+            self.put(key, value)
+        return value
+
+    def __len__(self):
+        return len(self._entries)
+
+    def get(self, key, default=None):
+        '''Cached value for `key` (counted as a hit), or `default` (counted as a miss)'''
+        with self._lock:
+            if key in self._entries:
+                self.hits += 1
+                self._entries.move_to_end(key)
+                return self._entries[key][0]
+            self.misses += 1
+        value = self._from_warm(key)
+        return default if value is None else value
+
+    def get_or_compute(self, key, compute):
+        '''Cached value for `key`, calling compute() and caching its result on a miss'''
+        with self._lock:
+            if key in self._entries:
+                self.hits += 1
+                self._entries.move_to_end(key)
+                return self._entries[key][0]
+            self.misses += 1
+
+        value = self._from_warm(key)
+        if value is not None:
+            return value
+        # Computed outside the lock so a slow miss doesn't block hits in other sessions.  Two sessions
+        # missing on the same key at once will both compute it, which is harmless.
+        value = compute()
+        self.put(key, value)
+        return value
+
+    def put(self, key, value):
+        size = value_bytes(value)
+        with self._lock:
+            if key in self._entries:
+                self.nbytes -= self._entries.pop(key)[1]
+            if self.maxbytes is not None and size > self.maxbytes:
+                return # would evict everything else and still not fit
+            self._entries[key] = (value, size)
+            self.nbytes += size
+            while len(self._entries) > self.maxsize or (self.maxbytes is not None and self.nbytes > self.maxbytes):
+                self.nbytes -= self._entries.popitem(last=False)[1][1]
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self.nbytes = 0
+            self.hits = self.misses = self.warm_hits = 0
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                'size': len(self._entries),
+                'maxsize': self.maxsize,
+                'bytes': self.nbytes,
+                'maxbytes': self.maxbytes,
+                'hits': self.hits,
+                'misses': self.misses,
+                'warm_hits': self.warm_hits, # misses served by the attached warm cache
+                'hit_rate': self.hits / lookups if lookups else 0.0,
+            }
+
+
+# One cache per worker process, shared by all sessions.  Size it with PENGUIN_CACHE_SIZE (entries) and
+# PENGUIN_CACHE_BYTES (bytes of cached frames).
+shared_cache = LRUCache(maxsize=int(os.environ.get('PENGUIN_CACHE_SIZE', 256)),
+                        maxbytes=int(os.environ.get('PENGUIN_CACHE_BYTES', 64 * 2**20)))
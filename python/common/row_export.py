@@ -0,0 +1,128 @@
+# Streaming download of the filtered rows as CSV or Parquet.
+#
+# The rows the table shows (a frame, or the QueryRows of the duckdb backend) are written out in chunks
+# of PENGUIN_EXPORT_CHUNK_ROWS rows: each chunk is encoded (CSV text, or one Parquet row group) and
+# sent before the next is read, so the worker holds one chunk whatever the size of the selection, and
+# the first bytes go out as soon as the first chunk is encoded.  QueryRows stream their chunks from
+# DuckDB (see QueryRows.chunks), a frame is sliced.
+#
+# Chunks are read and encoded in a worker thread, one at a time, so a large download doesn't hold up
+# the event loop (and the other sessions of the worker) while it runs.
+#
+# Parquet requires pyarrow; without it only CSV is offered.  row_export_ui() imports neither pandas
+# nor pyarrow, so the UI can be built at app import, before the data is loaded.
+import asyncio
+import importlib.util
+import os
+
+from shiny import ui
+
+HAVE_PYARROW = importlib.util.find_spec('pyarrow') is not None
+
+EXPORT_CHUNK_ROWS = int(os.environ.get('PENGUIN_EXPORT_CHUNK_ROWS', 16384)) # rounded to 2048-row vectors for duckdb
+EXPORT_FORMATS = {'csv': 'text/csv', **({'parquet': 'application/vnd.apache.parquet'} if HAVE_PYARROW else {})}
+
+
+def row_export_ui(id, label='Download rows'):
+    '''Format choice ({id}_format) and the download button of the render.download output `id`'''
+    return ui.div(
+        ui.input_radio_buttons(f'{id}_format', None, choices={file_format: file_format.upper() for file_format in EXPORT_FORMATS}, inline=True),
+        ui.download_button(id, label, class_='btn-sm'),
+        class_='d-flex gap-3 align-items-center',
+    )
+
+
+def export_filename(file_format, name='penguins'):
+    return f'{name}.{file_format}'
+
+
+def row_chunks(rows, chunk_rows=EXPORT_CHUNK_ROWS):
+    '''Frames of at most chunk_rows rows of `rows` (a frame or QueryRows), in row order.  At least one,
+    empty for an empty selection, so the file still gets its columns'''
+    if hasattr(rows, 'chunks'): # lazy query result (common/query_backend.py)
+        empty = True
+        for df in rows.chunks(max(1, chunk_rows // 2048)):
+            empty = False
+            yield df
+        if empty:
+            yield rows.window(0, 0)
+        return
+    for start in range(0, max(len(rows), 1), chunk_rows):
+        yield rows.iloc[start:start + chunk_rows]
+
+
+def csv_chunks(frames):
+    '''CSV text of the frames, the header with the first one'''
+    header = True
+    for df in frames:
+        narrow = [column for column, dtype in df.dtypes.items() if dtype == 'float32']
+        if narrow: # as the table shows them: 39.1, not 39.099998
+            df = df.astype({column: str for column in narrow}).astype({column: float for column in narrow})
+        yield df.to_csv(index=False, header=header)
+        header = False
+
+
+class _Drain:
+    '''Write-only file that hands out what was written since the last drain()'''
+
+    closed = False
+
+    def __init__(self):
+        self.parts = []
+        self.position = 0
+
+    def write(self, data):
+        self.parts.append(bytes(data))
+        self.position += len(data)
+        return len(data)
+
+    def tell(self):
+        return self.position
+
+    def flush(self):
+        pass
+
+    def close(self):
+        self.closed = True
+
+    def drain(self):
+        data = b''.join(self.parts)
+        self.parts = []
+        return data
+
+
+def parquet_chunks(frames):
+    '''Parquet file of the frames, one row group per frame, in pieces as the row groups are written'''
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+    sink = _Drain()
+    writer = schema = None
+    for df in frames:
+        if writer is None:
+            schema = pa.Schema.from_pandas(df, preserve_index=False)
+            # a column without any value in the first chunk is typed as strings, not nulls
+            schema = pa.schema([field.with_type(pa.string()) if pa.types.is_null(field.type) else field for field in schema])
+            writer = pq.ParquetWriter(sink, schema)
+        writer.write_table(pa.Table.from_pandas(df, schema=schema, preserve_index=False))
+        yield sink.drain()
+    if writer is not None:
+        writer.close()
+        yield sink.drain()
+
+
+ENCODERS = {'csv': csv_chunks, 'parquet': parquet_chunks}
+
+
+def export_chunks(rows, file_format, chunk_rows=EXPORT_CHUNK_ROWS):
+    '''The file of `rows` in `file_format` ('csv' or 'parquet'), in pieces of about chunk_rows rows'''
+    if file_format not in EXPORT_FORMATS:
+        raise ValueError(f'Unknown export format {file_format!r}, expected one of {list(EXPORT_FORMATS)}')
+    return ENCODERS[file_format](row_chunks(rows, chunk_rows))
+
+
+async def stream_export(rows, file_format, chunk_rows=EXPORT_CHUNK_ROWS):
+    '''export_chunks() for a render.download handler, each piece read and encoded in a worker thread'''
+    pieces = export_chunks(rows, file_format, chunk_rows)
+    while (piece := await asyncio.to_thread(next, pieces, None)) is not None:
+        if piece:
+            yield piece
@@ -0,0 +1,73 @@
+# Scatter plot of the filtered rows whose payload is bounded by the plot's pixels, not the row count.
+#
+# Up to PENGUIN_SCATTER_POINTS rows inside the visible axis ranges are drawn as they are, with an SVG
+# go.Scatter.  Past that, the rows are reduced on the server: the plot area is cut into square cells
+# of PENGUIN_SCATTER_CELL pixels and each cell that holds any rows becomes one WebGL (go.Scattergl)
+# marker at the cell's center, colored by its row count.  A 600 x 400 px plot with 4 px cells never
+# gets more than 150 x 100 markers, whether the selection has a thousand rows or ten million.
+#
+# The plot area is the output less SCATTER_MARGIN.  The figure pins those margins (no autoexpand) and
+# keeps its colorbar inside the right one, so the grid's cells are the size the markers are drawn at.
+#
+# The binning follows the axis ranges: zooming in re-runs it over the new ranges only (see the
+# scatter_plot widget of the core app), so the detail comes back as the user zooms, down to the raw
+# points once few enough rows are in view.
+import os
+
+import numpy as np
+
+SCATTER_POINTS = int(os.environ.get('PENGUIN_SCATTER_POINTS', 5000)) # most rows drawn as raw points
+SCATTER_CELL = int(os.environ.get('PENGUIN_SCATTER_CELL', 4)) # px, side of a density cell
+SCATTER_MARGIN = dict(l=60, r=100, t=10, b=50) # px, fixed margins of the scatter figure; r holds the colorbar
+COLORBAR_THICKNESS = 15 # px
+
+
+def plot_area(width, height, margin=SCATTER_MARGIN):
+    '''(width, height) px of the plot area of a width x height px figure with the given fixed margins'''
+    return max(1, int(width) - margin['l'] - margin['r']), max(1, int(height) - margin['t'] - margin['b'])
+
+
+def extent(values):
+    '''(min, max) of the finite values, widened to a non-empty range; (0, 1) if there are none'''
+    finite = values[np.isfinite(values)]
+    if not len(finite):
+        return 0.0, 1.0
+    low, high = float(finite.min()), float(finite.max())
+    return (low - 0.5, high + 0.5) if low == high else (low, high)
+
+
+class ScatterView:
+    '''What the scatter plot shows of the points (x, y) in the given axis ranges (None: the data's
+    extent) on a plot area (see plot_area) of width x height px.
+
+    mode is 'points' (x, y are the rows' values) or 'density' (x, y are the centers of the occupied
+    cells, counts their row counts and cell_px the side of a cell on screen, at least `cell` px).
+    n_rows counts the rows in view.
+    '''
+
+    def __init__(self, x, y, x_range=None, y_range=None, width=600, height=400, max_points=SCATTER_POINTS, cell=SCATTER_CELL):
+        x = np.asarray(x, dtype=np.float64)
+        y = np.asarray(y, dtype=np.float64)
+        self.x_range = tuple(x_range) if x_range is not None else extent(x)
+        self.y_range = tuple(y_range) if y_range is not None else extent(y)
+        (x0, x1), (y0, y1) = self.x_range, self.y_range
+        inside = (x >= x0) & (x <= x1) & (y >= y0) & (y <= y1) # also drops rows with a missing value
+        x, y = x[inside], y[inside]
+        self.n_rows = len(x)
+        self.counts = None
+        if self.n_rows <= max_points:
+            self.mode = 'points'
+            self.x, self.y = x, y
+            return
+
+        self.mode = 'density'
+        n_x, n_y = max(1, int(width) // cell), max(1, int(height) // cell)
+        columns = np.minimum(((x - x0) * (n_x / (x1 - x0))).astype(np.int64), n_x - 1) # x == x1 goes in the last cell
+        rows = np.minimum(((y - y0) * (n_y / (y1 - y0))).astype(np.int64), n_y - 1)
+        counts = np.bincount(rows * n_x + columns, minlength=n_x * n_y)
+        occupied = np.flatnonzero(counts)
+        self.x = x0 + (occupied % n_x + 0.5) * ((x1 - x0) / n_x)
+        self.y = y0 + (occupied // n_x + 0.5) * ((y1 - y0) / n_y)
+        self.counts = counts[occupied]
+        self.cell = cell
+        self.cell_px = min(int(width) / n_x, int(height) / n_y) # the cells fill the area: a little over `cell`
@@ -0,0 +1,137 @@
+# Penguin frame shared by all worker processes of a deployment.
+#
+# Each uvicorn worker normally loads its own copy of df_penguins, so memory grows with the number of
+# workers.  In shared mode one loader process publishes the columns once into a single flat file in
+# shared memory (/dev/shm when available): numeric columns as their raw arrays, string columns as
+# categorical codes plus a category list in the JSON manifest.  Workers attach to it with a read-only
+# mmap and build the frame on top of the mapped buffers without copying them, so every worker shares
+# the same physical pages.  The arrays are read-only: anything that tried to modify the frame in place
+# would fail instead of silently copying.
+#
+# Workers attach when PENGUIN_SHARED_FRAME names the publish directory (see common/data_source.py).
+# Usage (from the repo root):
+#   python python/common/shared_frame.py publish [--dir DIR]
+#   python python/common/shared_frame.py serve python/plotly/core/app.py --workers 4 [--port 8000]
+# `serve` publishes the frame, starts uvicorn with that many workers attached to it, and removes the
+# published files when it exits.
+import argparse
+import json
+import mmap
+import os
+import sys
+from pathlib import Path
+
+ALIGNMENT = 64 # bytes, start of every column in the data file
+MANIFEST = 'manifest.json'
+DATA_FILE = 'frame.bin'
+
+
+def default_shared_dir():
+    if Path('/dev/shm').is_dir():
+        return Path('/dev/shm') / 'penguin-shiny'
+    from common.data_source import default_cache_dir
+    return default_cache_dir() / 'shared'
+
+
+def _column_layout(df):
+    '''(column, kind, array to store, categories) for every column of df'''
+    import pandas as pd
+    for column in df.columns:
+        ser = df[column]
+        if ser.dtype.kind in 'biuf':
+            yield column, 'numeric', ser.to_numpy(), None
+        else: # strings (object or categorical): codes into a category list, missing values coded -1
+            categorical = ser.astype('category') if not isinstance(ser.dtype, pd.CategoricalDtype) else ser
+            yield column, 'categorical', categorical.cat.codes.to_numpy(), list(categorical.cat.categories)
+
+
+def publish_frame(df, directory=None):
+    '''Write df's columns to `directory` for attach_frame(); returns the directory'''
+    directory = Path(directory or default_shared_dir())
+    directory.mkdir(parents=True, exist_ok=True)
+    columns = []
+    offset = 0
+    tmp_data = directory / f'{DATA_FILE}.{os.getpid()}.tmp'
+    with open(tmp_data, 'wb') as f:
+        for column, kind, array, categories in _column_layout(df):
+            padding = -offset % ALIGNMENT
+            f.write(b'\0' * padding)
+            offset += padding
+            data = array.tobytes()
+            f.write(data)
+            columns.append({'name': column, 'kind': kind, 'dtype': array.dtype.str, 'offset': offset, 'categories': categories})
+            offset += len(data)
+    # Replace the data file first and the manifest last: workers that attached before keep their
+    # mapping of the old file, workers attaching now see a consistent pair
+    os.replace(tmp_data, directory / DATA_FILE)
+    tmp_manifest = directory / f'{MANIFEST}.{os.getpid()}.tmp'
+    tmp_manifest.write_text(json.dumps({'rows': len(df), 'columns': columns}))
+    os.replace(tmp_manifest, directory / MANIFEST)
+    return directory
+
+
+def attach_frame(directory=None):
+    '''Read-only DataFrame over the columns published in `directory`, sharing their pages'''
+    import numpy as np
+    import pandas as pd
+    directory = Path(directory or default_shared_dir())
+    try:
+        manifest = json.loads((directory / MANIFEST).read_text())
+    except FileNotFoundError:
+        raise FileNotFoundError(f'No penguin frame published in {directory}; run `python python/common/shared_frame.py publish --dir {directory}`') from None
+    with open(directory / DATA_FILE, 'rb') as f:
+        buffer = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) if manifest['rows'] else b''
+
+    n_rows = manifest['rows']
+    columns = {}
+    for column in manifest['columns']:
+        array = np.frombuffer(buffer, dtype=np.dtype(column['dtype']), count=n_rows, offset=column['offset'] if n_rows else 0)
+        if column['kind'] == 'categorical':
+            columns[column['name']] = pd.Categorical.from_codes(array, categories=pd.Index(column['categories'], dtype=object), validate=False)
+        else:
+            columns[column['name']] = array
+    return pd.DataFrame(columns, copy=False)
+
+
+def load_for_publish():
+    '''The dataset as configured by the environment, loaded (not attached) by the loader process'''
+    from common.data_source import DataSource
+    source = DataSource.from_env()
+    source.shared_dir = None
+    return source.frame()
+
+
+def serve(app_path, workers, host, port, directory):
+    import uvicorn
+    directory = publish_frame(load_for_publish(), directory)
+    os.environ['PENGUIN_SHARED_FRAME'] = str(directory) # inherited by the worker processes
+    app_path = Path(app_path).resolve()
+    try:
+        uvicorn.run(f'{app_path.stem}:app', app_dir=str(app_path.parent), host=host, port=port, workers=workers)
+    finally:
+        for name in (DATA_FILE, MANIFEST):
+            (directory / name).unlink(missing_ok=True)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Publish the penguin frame to shared memory for several workers')
+    subparsers = parser.add_subparsers(dest='command', required=True)
+    publish_parser = subparsers.add_parser('publish', help='load the dataset (PENGUIN_DATA etc.) and publish it')
+    publish_parser.add_argument('--dir', help=f'publish directory (default {default_shared_dir()})')
+    serve_parser = subparsers.add_parser('serve', help='publish, then run an app with several workers attached')
+    serve_parser.add_argument('app', help='path of an app.py')
+    serve_parser.add_argument('--workers', type=int, default=4)
+    serve_parser.add_argument('--host', default='127.0.0.1')
+    serve_parser.add_argument('--port', type=int, default=8000)
+    serve_parser.add_argument('--dir', help=f'publish directory (default {default_shared_dir()})')
+    args = parser.parse_args()
+
+    if args.command == 'publish':
+        print(publish_frame(load_for_publish(), args.dir))
+    else:
+        serve(args.app, args.workers, args.host, args.port, args.dir)
+
+
+if __name__ == '__main__':
+    sys.path.append(str(Path(__file__).resolve().parents[1])) # python/ folder, for the `common` package
+    main()
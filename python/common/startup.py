@@ -0,0 +1,118 @@
+# Fast worker startup.
+#
+# Building the UI only needs the filter choice lists, the range slider bounds and the column names of
+# the dataset, not the dataset itself.  dataset_metadata() keeps those in a small JSON file next to the Arrow snapshot,
+# keyed by the source file's fingerprint, so after the first start the UI is built without loading
+# the data (or importing numpy/pandas/pyarrow).
+#
+# The module-level data structures of the apps (frame, bitmap index, count cube, table pager) are
+# declared as Deferred objects.  Normally they are built at import, as before.  With
+# PENGUIN_LAZY_STARTUP=1 they are built on first use instead, i.e. by the first session, so a worker
+# only imports shiny and the widget libraries before it starts accepting connections.
+#
+# python/benchmarks/bench_startup.py reports where import time goes and checks it against a budget.
+import importlib
+import json
+import os
+import threading
+
+LAZY_STARTUP = os.environ.get('PENGUIN_LAZY_STARTUP', '') not in ('', '0', 'false', 'False')
+
+FILTER_COLUMNS = ('species', 'island', 'sex')
+RANGE_COLUMNS = ('body_mass_g', 'bill_length_mm', 'bill_depth_mm', 'flipper_length_mm') # range sliders, see common/range_index.py
+MISSING_CHOICE = 'nan' # what a checkbox for a missing value sends back (str(NaN), as Shiny labels it)
+
+
+class Deferred:
+    '''A module-level object built by factory(*args) on first use (at construction unless lazy).
+
+    `factory` can be a callable or a 'module:attribute' string, which is imported only when the
+    object is built.  Deferred arguments are resolved first.  Attribute access goes to the built
+    object; get() returns the object itself and set() replaces it.
+    '''
+
+    def __init__(self, factory, *args, lazy=None):
+        self._factory = factory
+        self._args = args
+        self._value = None
+        self._built = False
+        self._lock = threading.Lock()
+        if not (LAZY_STARTUP if lazy is None else lazy):
+            self.get()
+
+    def get(self):
+        if not self._built:
+            with self._lock:
+                if not self._built:
+                    factory = self._factory
+                    if isinstance(factory, str):
+                        module, _, name = factory.partition(':')
+                        factory = getattr(importlib.import_module(module), name)
+                    self._value = factory(*[arg.get() if isinstance(arg, Deferred) else arg for arg in self._args])
+                    self._built = True
+        return self._value
+
+    def set(self, value):
+        '''Replace the object (live ingest swaps in the frame and structures with new rows appended)'''
+        with self._lock:
+            self._value = value
+            self._built = True
+
+    def __getattr__(self, name):
+        return getattr(self.get(), name)
+
+
+def filter_choice_labels(column, values):
+    '''Checkbox choices of a filter column: sex values are capitalized, the missing value shown as is'''
+    if column == 'sex':
+        return {value:(value if value==MISSING_CHOICE else value.capitalize()) for value in values}
+    return list(values)
+
+
+def _choice(value):
+    return MISSING_CHOICE if value != value or value is None else value # NaN != NaN
+
+
+def _bound(value):
+    return float(str(value)) # as the table shows it: a float32 32.1 is 32.1, not 32.099998474121094
+
+
+def compute_metadata(df, filter_columns=FILTER_COLUMNS, range_columns=RANGE_COLUMNS):
+    '''Column names, per filter column its distinct values in order of first appearance and per range
+    column (of those in df with any values) its [min, max]'''
+    return {
+        'columns': [str(column) for column in df.columns],
+        'choices': {column: [_choice(value) for value in df[column].unique()] for column in filter_columns},
+        'ranges': {column: [_bound(df[column].min()), _bound(df[column].max())] for column in range_columns
+                   if column in df.columns and df[column].notna().any()},
+    }
+
+
+def metadata_path(source):
+    variant = '-compact' if source.compact else '' # the compact frame's column types differ
+    return source.cache_dir / f'{source.path.stem}-{source.fingerprint}{variant}.meta.json'
+
+
+def dataset_metadata(source=None):
+    '''Metadata (see compute_metadata) of the served dataset, from the cached file when it is current'''
+    from common import data_source
+    source = source or data_source.penguin_source
+    path = metadata_path(source)
+    try:
+        with open(path) as f:
+            metadata = json.load(f)
+        if 'ranges' in metadata: # else written before the range sliders: recompute
+            return metadata
+    except (OSError, ValueError):
+        pass
+
+    metadata = compute_metadata(source.frame())
+    try:
+        path.parent.mkdir(parents=True, exist_ok=True)
+        tmp_path = path.with_suffix(f'.{os.getpid()}.tmp')
+        with open(tmp_path, 'w') as f:
+            json.dump(metadata, f)
+        os.replace(tmp_path, path)
+    except OSError: # read-only cache dir: recompute on every start
+        pass
+    return metadata
@@ -0,0 +1,99 @@
+# Synthetic, penguin-shaped data at production scale.
+#
+# Palmer Penguins only has 344 rows.  generate_penguins() draws any number of rows from a profile of
+# the real dataset: the joint (species, island, year) frequencies, the sex split and NaN rate per
+# species, per-species normal distributions for the measurements (rounded like the originals) and
+# the rate of rows whose measurements are all missing.  write_penguins() streams chunks to disk so
+# 10^8 rows never have to fit in memory at once.
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+
+MEASUREMENTS = {'bill_length_mm': 1, 'bill_depth_mm': 1, 'flipper_length_mm': 0, 'body_mass_g': 0} # column: decimals
+
+
+def penguin_profile(df=None):
+    '''Distributions generate_penguins() samples from, estimated from `df` (palmerpenguins by default)'''
+    if df is None:
+        import palmerpenguins
+        df = palmerpenguins.load_penguins()
+    groups = df.groupby(['species', 'island', 'year']).size()
+    measured = df[list(MEASUREMENTS)].notna().all(axis=1)
+    return {
+        'groups': list(groups.index),
+        'group_p': (groups / groups.sum()).to_numpy(),
+        'measurement_na_rate': 1 - measured.mean(),
+        'sex': {
+            species: df.loc[(df['species'] == species) & measured, 'sex'].value_counts(normalize=True, dropna=False)
+            for species in df['species'].unique()
+        },
+        'measurements': {
+            species: (df_species[list(MEASUREMENTS)].mean(), df_species[list(MEASUREMENTS)].std())
+            for species, df_species in df.groupby('species')
+        },
+    }
+
+
+def generate_penguins(n_rows, seed=0, profile=None):
+    '''DataFrame of n_rows synthetic penguins with the columns and dtypes of palmerpenguins'''
+    profile = profile or penguin_profile()
+    rng = np.random.default_rng(seed)
+
+    group_codes = rng.choice(len(profile['groups']), size=n_rows, p=profile['group_p'])
+    species, island, year = (np.array(values, dtype=object)[group_codes] for values in zip(*profile['groups']))
+    df = pd.DataFrame({'species': species, 'island': island})
+
+    for column in MEASUREMENTS:
+        df[column] = np.nan
+    sex = np.empty(n_rows, dtype=object)
+    for name, (mean, std) in profile['measurements'].items():
+        rows = np.flatnonzero(species == name)
+        for column, decimals in MEASUREMENTS.items():
+            df.loc[rows, column] = rng.normal(mean[column], std[column], size=len(rows)).round(decimals)
+        sex_p = profile['sex'][name]
+        sex[rows] = np.array(sex_p.index, dtype=object)[rng.choice(len(sex_p), size=len(rows), p=sex_p.to_numpy())]
+    df['sex'] = sex
+
+    # Rows without measurements have no recorded sex either, as in the original data
+    unmeasured = rng.random(n_rows) < profile['measurement_na_rate']
+    df.loc[unmeasured, list(MEASUREMENTS) + ['sex']] = np.nan
+    df['year'] = year.astype(np.int64)
+    return df
+
+
+def iter_penguin_chunks(n_rows, chunk_rows=1_000_000, seed=0):
+    '''generate_penguins(n_rows) in chunks of at most chunk_rows rows'''
+    profile = penguin_profile()
+    for i, start in enumerate(range(0, n_rows, chunk_rows)):
+        yield generate_penguins(min(chunk_rows, n_rows - start), seed=seed + i, profile=profile)
+
+
+def write_penguins(path, n_rows, chunk_rows=1_000_000, seed=0):
+    '''Stream n_rows synthetic penguins to a .arrow/.feather/.ipc, .parquet or .csv file'''
+    path = Path(path)
+    suffix = path.suffix.lower()
+    chunks = iter_penguin_chunks(n_rows, chunk_rows, seed)
+
+    if suffix == '.csv':
+        for i, chunk in enumerate(chunks):
+            chunk.to_csv(path, mode='w' if i == 0 else 'a', header=(i == 0), index=False)
+        return path
+
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+    writer = None
+    schema = None
+    try:
+        for chunk in chunks:
+            # Floats keep NaN as values (not nulls), strings use nulls, like data_source.write_ipc
+            arrays = [pa.array(chunk[column].to_numpy(), from_pandas=chunk[column].dtype == object) for column in chunk.columns]
+            if writer is None:
+                schema = pa.schema([(column, array.type if array.type != pa.null() else pa.string()) for column, array in zip(chunk.columns, arrays)])
+                schema = schema.with_metadata(pa.Schema.from_pandas(chunk, preserve_index=False).metadata)
+                writer = pq.ParquetWriter(str(path), schema) if suffix == '.parquet' else pa.ipc.new_file(str(path), schema)
+            writer.write_table(pa.Table.from_arrays(arrays, schema=schema))
+    finally:
+        if writer is not None:
+            writer.close()
+    return path
@@ -0,0 +1,141 @@
+# Virtualized, server-side paginated table.
+#
+# render.table sends every filtered row as HTML.  TablePager instead sends only the window of rows
+# that is visible in the scroll box (plus a little overscan): a spacer div keeps the scroll height of
+# the full result, and a small script reports the first visible row back to the server as the user
+# scrolls, which re-renders just the new window.  Sorting uses per-column orderings precomputed once
+# over the full frame, so sorting a filtered result is a single pass instead of a sort.
+#
+# table_pager_ui() only needs the column names, so the table's UI can be built (at app import) before
+# the data, numpy or pandas are loaded.
+from shiny import ui
+
+ROW_HEIGHT = 28 # px
+HEIGHT = 300 # px, of the scroll viewport
+
+
+def table_pager_ui(id, columns, row_height=ROW_HEIGHT, height=HEIGHT):
+    '''Sort controls for `columns`, the scroll viewport holding output `id` of a TablePager and the script
+    reporting the scroll position'''
+    return ui.TagList(
+        ui.div(
+            ui.input_select(f'{id}_sort', 'Sort by', choices={'': '(none)', **{column: column for column in columns}}, width='200px'),
+            ui.input_checkbox(f'{id}_descending', 'Descending'),
+            class_='d-flex gap-3 align-items-end',
+        ),
+        ui.tags.style(f'''
+            #{id}_viewport th, #{id}_viewport td {{ height: {row_height}px; padding: 0 .5rem; white-space: nowrap; vertical-align: middle; }}
+        '''),
+        ui.div(
+            ui.output_ui(id),
+            id=f'{id}_viewport',
+            style=f'height:{height}px; overflow-y: scroll; position: relative',
+        ),
+        ui.tags.script(f'''
+            $(function() {{
+                var viewport = document.getElementById("{id}_viewport");
+                var timer = null;
+                viewport.addEventListener("scroll", function() {{
+                    clearTimeout(timer);
+                    timer = setTimeout(function() {{
+                        Shiny.setInputValue("{id}_offset", Math.floor(viewport.scrollTop / {row_height}));
+                    }}, 50);
+                }});
+            }});
+        '''),
+    )
+
+
+class TablePager:
+    '''Renders windows of row subsets of `df`.
+
+    The subsets passed to render() must be row selections of `df` that keep its index labels (boolean
+    filters / take), and `df` must have a default RangeIndex so labels double as row positions.
+    '''
+
+    def __init__(self, df, window_size=40, row_height=ROW_HEIGHT, height=HEIGHT):
+        self.df = df
+        self.window_size = window_size
+        self.row_height = row_height
+        self.height = height
+        self.sort_orders = {column: self._build_order(df[column]) for column in df.columns}
+
+    @staticmethod
+    def _build_order(ser):
+        '''Ascending row order of a column (missing values last) and the number of non-missing rows'''
+        import numpy as np
+        import pandas as pd
+        codes, uniques = pd.factorize(ser, sort=True)
+        codes = np.where(codes < 0, len(uniques), codes)
+        return np.argsort(codes, kind='stable'), int((codes < len(uniques)).sum())
+
+    def appended(self, df):
+        '''A new pager for `df`, the pager's frame with rows appended.  The new rows are sorted on their
+        own and merged into each column's existing order instead of sorting the whole column again'''
+        import numpy as np
+        import pandas as pd
+        pager = object.__new__(TablePager)
+        pager.df = df
+        pager.window_size = self.window_size
+        pager.row_height = self.row_height
+        pager.height = self.height
+        n_old = len(self.df)
+        new_positions = np.arange(n_old, len(df))
+        pager.sort_orders = {}
+        for column, (order, n_valid) in self.sort_orders.items():
+            ser = df[column]
+            if isinstance(ser.dtype, pd.CategoricalDtype) and ser.cat.categories.is_monotonic_increasing:
+                values = ser.cat.codes.to_numpy() # sorted categories: codes compare like the values
+            else:
+                values = ser.to_numpy()
+            missing = ser.isna().to_numpy()[n_old:]
+            batch_valid = new_positions[~missing]
+            batch_valid = batch_valid[np.argsort(values[batch_valid], kind='stable')]
+            # side='right': new rows go after equal old rows, as in a stable sort of the whole column
+            insert_at = np.searchsorted(values[order[:n_valid]], values[batch_valid], side='right')
+            merged = np.insert(order[:n_valid], insert_at, batch_valid)
+            pager.sort_orders[column] = (np.concatenate([merged, order[n_valid:], new_positions[missing]]), n_valid + len(batch_valid))
+        return pager
+
+    def sorted_positions(self, df_subset, sort_column, descending=False):
+        '''Row positions of df_subset in display order'''
+        import numpy as np
+        positions = df_subset.index.to_numpy()
+        if not sort_column:
+            return positions
+        order, n_valid = self.sort_orders[sort_column]
+        if descending: # reverse the non-missing part only, missing values stay last
+            order = np.concatenate([order[n_valid-1::-1] if n_valid else order[:0], order[n_valid:]])
+        in_subset = np.zeros(len(self.df), dtype=bool)
+        in_subset[positions] = True
+        return order[in_subset[order]]
+
+    def ui(self, id):
+        '''Sort controls, the scroll viewport holding output `id` and the script reporting the scroll position'''
+        return table_pager_ui(id, self.df.columns, self.row_height, self.height)
+
+    def window(self, df_subset, offset, sort_column=None, descending=False):
+        '''The rows of df_subset shown from row `offset` on.  df_subset can also be a QueryRows, which sorts
+        and fetches the window itself'''
+        if hasattr(df_subset, 'window'): # lazy query result (common/query_backend.py)
+            return df_subset.window(offset, self.window_size, sort_column, descending)
+        if sort_column:
+            return self.df.take(self.sorted_positions(df_subset, sort_column, descending)[offset:offset+self.window_size])
+        return df_subset.iloc[offset:offset+self.window_size]
+
+    def render(self, df_subset, sort_column=None, descending=False, offset=0):
+        '''HTML for the window of df_subset starting at row `offset`, inside a spacer with the full height'''
+        n_rows = len(df_subset)
+        offset = max(0, min(int(offset), n_rows - self.window_size))
+        df_window = self.window(df_subset, offset, sort_column, descending)
+        # float32 columns (compact frames) are shown with their shortest repr, the way float64 ones are
+        narrow = [column for column, dtype in df_window.dtypes.items() if dtype == 'float32']
+        if narrow:
+            df_window = df_window.astype({column: str for column in narrow}).astype({column: float for column in narrow})
+
+        table = df_window.to_html(index=False, classes='table shiny-table w-auto', border=0)
+        return ui.div(
+            ui.div(ui.HTML(table), style=f'position: absolute; top: {offset*self.row_height}px'),
+            # one extra row for the header
+            style=f'position: relative; height: {(n_rows+1)*self.row_height}px',
+        )
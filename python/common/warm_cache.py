@@ -0,0 +1,197 @@
+# Precomputed views of every filter state, persisted next to the data snapshot.
+#
+# The sidebar filters only have a few values each, so the filter space is small enough to enumerate:
+# every subset of the species, island and sex choices (8 x 8 x 8 states for palmerpenguins).  The
+# offline build step computes, for each state, the row count and the summary (counts per year and
+# category value) for every category, and writes them to one JSON file in PENGUIN_CACHE_DIR named after
+# the dataset's fingerprint, like the Arrow snapshot.  A changed dataset has another fingerprint, so a
+# stale file is simply not found.
+#
+# Workers load the file at startup (on first use with PENGUIN_LAZY_STARTUP=1) and attach it to the
+# process-wide result cache (common/result_cache.py), which looks there before computing a summary or
+# row count: the first interactions of new sessions are served without touching the data.  Summaries
+# are turned back into frames (with the dtypes the app's own summaries have) only when asked for.
+# Only the dataset as loaded is covered; rows appended by live ingest bump the dataset version, and
+# those keys are computed as usual.
+#
+# Usage (from the repo root):
+#   python python/common/warm_cache.py build [--check]
+import argparse
+import itertools
+import json
+import os
+import sys
+from pathlib import Path
+
+FORMAT_VERSION = 1
+MAX_STATES = 100_000 # filter states beyond which building takes too long to be worth it
+
+
+def warm_cache_path(source):
+    variant = '-compact' if source.compact else ''
+    return source.cache_dir / f'{source.path.stem}-{source.fingerprint}{variant}.warm.json'
+
+
+def subsets(values):
+    return [list(subset) for n in range(len(values) + 1) for subset in itertools.combinations(values, n)]
+
+
+def filter_states(choices, filter_columns):
+    '''Every combination of checked boxes of the filters, as the (species, island, sex) input values'''
+    return itertools.product(*(subsets(choices[column]) for column in filter_columns))
+
+
+def _dtype_spec(dtype):
+    import pandas as pd
+    if isinstance(dtype, pd.CategoricalDtype):
+        return {'categories': dtype.categories.tolist(), 'ordered': bool(dtype.ordered)}
+    return str(dtype)
+
+
+def _dtype(spec):
+    import pandas as pd
+    if isinstance(spec, dict):
+        return pd.CategoricalDtype(spec['categories'], ordered=spec['ordered'])
+    return pd.api.types.pandas_dtype(spec)
+
+
+def _column(values, dtype):
+    import numpy as np
+    import pandas as pd
+    if isinstance(dtype, np.dtype): # a plain numpy array is the quickest to build a frame from
+        return np.array(values, dtype=dtype)
+    return pd.array(values, dtype=dtype)
+
+
+def build_views(df):
+    '''The warm cache contents for df: row count and per-category summaries of every filter state'''
+    from common.bitmap_index import BitmapIndex
+    from common.count_cube import CountCube
+    from common.startup import FILTER_COLUMNS, compute_metadata
+    choices = compute_metadata(df)['choices']
+    n_states = 1
+    for column in FILTER_COLUMNS:
+        n_states *= 2 ** len(choices[column])
+    if n_states > MAX_STATES:
+        raise ValueError(f'{n_states:,} filter states, more than the {MAX_STATES:,} a warm cache is built for')
+
+    index, cube = BitmapIndex(df), CountCube(df)
+    states = []
+    for selected in filter_states(choices, FILTER_COLUMNS):
+        selections = dict(zip(FILTER_COLUMNS, selected))
+        summaries = {}
+        for category in FILTER_COLUMNS:
+            summary = cube.summarize(category, **selections)
+            summaries[category] = [summary[column].tolist() for column in ('year', category, 'count')]
+        states.append({'filters': list(selected), 'count': len(index.positions(**selections)), 'summaries': summaries})
+    return {
+        'version': FORMAT_VERSION,
+        'dtypes': {column: _dtype_spec(df[column].dtype) for column in ['year', *FILTER_COLUMNS]},
+        'states': states,
+    }
+
+
+def build(source=None):
+    '''Compute the views of the served dataset and write them to its warm cache file; returns the path'''
+    from common import data_source
+    source = source or data_source.penguin_source
+    views = build_views(source.frame())
+    views['fingerprint'] = source.fingerprint
+    path = warm_cache_path(source)
+    path.parent.mkdir(parents=True, exist_ok=True)
+    tmp_path = path.with_suffix(f'.{os.getpid()}.tmp')
+    with open(tmp_path, 'w') as f:
+        json.dump(views, f, separators=(',', ':'))
+    os.replace(tmp_path, path)
+    return path
+
+
+class WarmCache:
+    '''Read-only mapping of result cache keys to the precomputed views (empty without a built file)'''
+
+    def __init__(self, views=None):
+        self._entries = {}
+        self._dtypes = {}
+        if views:
+            from common.result_cache import filter_key
+            self._dtypes = {column: _dtype(spec) for column, spec in views['dtypes'].items()}
+            for state in views['states']:
+                key = filter_key(*state['filters']) # (species, island, sex), the FILTER_COLUMNS order
+                self._entries[('count', 0, key)] = state['count']
+                for category, columns in state['summaries'].items():
+                    self._entries[('summarized', 0, key, category)] = (category, columns)
+
+    def __len__(self):
+        return len(self._entries)
+
+    def lookup(self, key):
+        '''The precomputed result for a result cache key, or None'''
+        entry = self._entries.get(key)
+        if entry is None:
+            return None
+        if key[0] == 'count':
+            return entry
+        import numpy as np
+        import pandas as pd
+        category, (years, values, counts) = entry
+        return pd.DataFrame({
+            'year': _column(years, self._dtypes['year']),
+            category: _column(values, self._dtypes[category]),
+            'count': np.array(counts, dtype=np.int64),
+        })
+
+
+def load_warm_cache(source=None):
+    '''The warm cache of the served dataset, empty if it wasn't built (or PENGUIN_WARM_CACHE=0)'''
+    from common import data_source
+    source = source or data_source.penguin_source
+    if os.environ.get('PENGUIN_WARM_CACHE', '1') == '0':
+        return WarmCache()
+    try:
+        with open(warm_cache_path(source)) as f:
+            views = json.load(f)
+    except (OSError, ValueError):
+        return WarmCache()
+    if views.get('version') != FORMAT_VERSION or views.get('fingerprint') != source.fingerprint:
+        return WarmCache()
+    return WarmCache(views)
+
+
+def check(source=None):
+    '''Number of warm cache entries checked against the summaries and counts computed from the data'''
+    import pandas as pd
+    from common import data_source
+    from common.bitmap_index import BitmapIndex
+    from common.count_cube import CountCube
+    source = source or data_source.penguin_source
+    warm_cache = load_warm_cache(source)
+    df = source.frame()
+    index, cube = BitmapIndex(df), CountCube(df)
+    checked = 0
+    for key in list(warm_cache._entries):
+        species, island, sex = key[2][:3]
+        selections = {'species': list(species), 'island': list(island), 'sex': list(sex)}
+        if key[0] == 'count':
+            assert warm_cache.lookup(key) == len(index.take(df, **selections)), key
+        else:
+            pd.testing.assert_frame_equal(warm_cache.lookup(key), cube.summarize(key[3], **selections))
+        checked += 1
+    return checked
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Precompute the views of every filter state of the served dataset')
+    subparsers = parser.add_subparsers(dest='command', required=True)
+    build_parser = subparsers.add_parser('build', help='build the warm cache of the dataset (PENGUIN_DATA etc.)')
+    build_parser.add_argument('--check', action='store_true', help='then check every entry against a fresh computation')
+    args = parser.parse_args()
+
+    path = build()
+    print(path)
+    if args.check:
+        print(f'{check()} entries identical to the computed results')
+
+
+if __name__ == '__main__':
+    sys.path.append(str(Path(__file__).resolve().parents[1])) # python/ folder, for the `common` package
+    main()
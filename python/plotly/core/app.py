@@ -1,20 +1,79 @@
 # Load data and compute static values
 from shiny import App, reactive, render, ui
 from shinywidgets import output_widget, render_widget, render_plotly
-from plotnine import ggplot, aes, geom_bar
 from htmltools import div
-import plotly.graph_objects as go
-import pandas as pd
-import palmerpenguins
-import numpy as np
+import plotly.graph_objects as go # plotly loads its graph object classes on first use
+import sys
+from pathlib import Path
+sys.path.append(str(Path(__file__).resolve().parents[2])) # python/ folder, for the shared `common` package
+from common.event_pipeline import ThrottledEvents
+from common.plotly_payload import array, compact_figure, customdata
+from common.reactive_metrics import timed, track_widget_payloads, with_metrics_route
+from common.result_cache import filter_key, shared_cache
+from common.live_ingest import FILTER_INPUTS, LiveIngest, data_version, grown_choices
+from common.startup import Deferred, dataset_metadata, filter_choice_labels
+from common.row_export import EXPORT_FORMATS, export_filename, row_export_ui, stream_export
+from common.table_pager import table_pager_ui
 import itertools
+import os
 #from plotly.callbacks import Points, InputDeviceState
 #points, state = Points(), InputDeviceState()
 
 
-df_penguins = palmerpenguins.load_penguins()
+# Built at import, or by the first session with PENGUIN_LAZY_STARTUP=1 (see common/startup.py)
+df_penguins = Deferred('common.data_source:load_penguins') # palmerpenguins unless PENGUIN_DATA points at another dataset
+penguin_index = Deferred('common.bitmap_index:BitmapIndex', df_penguins) # one bitset per species/island/sex/year value, built once at load
+penguin_cube = Deferred('common.count_cube:CountCube', df_penguins) # counts per year/species/island/sex cell, df_summarized slices and sums it
+table_pager = Deferred('common.table_pager:TablePager', df_penguins) # precomputed sort orders for the paginated table_view
+range_index = Deferred('common.range_index:RangeIndex', df_penguins, table_pager) # the pager's sort orders of the range slider columns
+penguin_backend = Deferred('common.query_backend:query_backend', df_penguins, penguin_index, penguin_cube, range_index) # PENGUIN_BACKEND: pandas (indexes + cube) or duckdb
+warm_cache = Deferred('common.warm_cache:load_warm_cache') # summaries and row counts of every filter state, see common/warm_cache.py
+shared_cache.attach(warm_cache) # looked up before a result is computed
+penguin_metadata = dataset_metadata() # filter choices and column names, from a cached file when possible
+penguin_choices = penguin_metadata['choices']
+penguin_ranges = penguin_metadata['ranges'] # [min, max] of each range slider column
+live_ingest = LiveIngest.from_env( # appends files dropped into PENGUIN_INGEST_DIR, None when unset
+    frame=df_penguins, index=penguin_index, cube=penguin_cube, pager=table_pager, ranges=range_index, backend=penguin_backend, choices=penguin_choices)
 
 dict_category = {'species':'Species','island':'Island','sex':'Gender'}
+dict_range = {'body_mass_g':'Body Mass (g)','bill_length_mm':'Bill Length (mm)','bill_depth_mm':'Bill Depth (mm)','flipper_length_mm':'Flipper Length (mm)'}
+
+# Hover events: at most one per HOVER_THROTTLE seconds gets through, the last one HOVER_DEBOUNCE seconds after the mouse stops
+HOVER_THROTTLE = float(os.environ.get('PENGUIN_HOVER_THROTTLE', 0.1))
+HOVER_DEBOUNCE = float(os.environ.get('PENGUIN_HOVER_DEBOUNCE', 0.25))
+# Range slider drags likewise: re-filter at most once per RANGE_THROTTLE seconds, and RANGE_DEBOUNCE seconds after the slider stops
+RANGE_THROTTLE = float(os.environ.get('PENGUIN_RANGE_THROTTLE', 0.5))
+RANGE_DEBOUNCE = float(os.environ.get('PENGUIN_RANGE_DEBOUNCE', 0.3))
+
+# Linked histograms under the bar chart: brushing one filters the other charts and the table (see common/crossfilter.py)
+HISTOGRAM_COLUMNS = ('body_mass_g', 'flipper_length_mm', 'bill_length_mm')
+# Scatter of the filtered rows, reduced to density cells past PENGUIN_SCATTER_POINTS rows in view (see common/scatter_view.py)
+SCATTER_X, SCATTER_Y = 'bill_length_mm', 'bill_depth_mm'
+
+# Bodies of the reactive stages, at module level so they can also run without a session (benchmarks)
+def filter_penguins(species, island, sex, ranges=None):
+    '''Rows of df_penguins that pass the sidebar filters (a lazy QueryRows with the duckdb backend);
+    `ranges` are the narrowed range sliders, {column: (lo, hi)}'''
+    return penguin_backend.filter(ranges, species=species, island=island, sex=sex)
+
+def select_segments(df, selection):
+    '''Rows of df inside the chart segments selected on the visual (all of df if none are selected)'''
+    if selection:
+        #Only run this if chart segments have been clicked or selected.  One lookup of each row's precomputed
+        #(category, year) cell in the selection's table of cells, however many segments are selected
+        df = penguin_backend.select_cells(df, selection)
+    return df
+
+def summarize_penguins(category, species, island, sex, ranges=None):
+    '''Penguin counts per year and category value for the sidebar filters'''
+    return penguin_backend.summarize(category, ranges, species=species, island=island, sex=sex)
+
+def bar_traces(df_plot, category):
+    '''x axis labels and the y values of each stacked bar segment of the summarized frame'''
+    bar_columns = list(df_plot['year'].unique()) # x axis column labels
+    bar_segments = list(df_plot[category].unique()) # bar segment category labels
+    return bar_columns, {segment: list(df_plot[df_plot[category]==segment]['count'].values) for segment in bar_segments}
+
 
 def filter_shelf():
     return ui.card(
@@ -26,25 +85,34 @@ def filter_shelf():
         ui.input_checkbox_group(
             'sex_filter', 
             label='Gender', 
-            choices={value:(value.capitalize() if (type(value)==str) else value) for value in df_penguins['sex'].unique()},
-            selected=list(df_penguins['sex'].unique()),
+            choices=filter_choice_labels('sex', penguin_choices['sex']),
+            selected=penguin_choices['sex'],
         ),
 
         # Species Filter
         ui.input_checkbox_group(
             'species_filter', 
             label='Species', 
-            choices=list(df_penguins['species'].unique()),
-            selected=list(df_penguins['species'].unique()),
+            choices=penguin_choices['species'],
+            selected=penguin_choices['species'],
         ),
 
         # Island Filter
         ui.input_checkbox_group(
             'island_filter', 
             label='Island', 
-            choices=list(df_penguins['island'].unique()),
-            selected=list(df_penguins['island'].unique()),
+            choices=penguin_choices['island'],
+            selected=penguin_choices['island'],
         ),
+
+        # Range Filters
+        *[ui.input_slider(
+            f'{column}_range',
+            label=dict_range.get(column, column),
+            min=low,
+            max=high,
+            value=(low, high),
+        ) for column, (low, high) in penguin_ranges.items()],
     )
 
 
@@ -81,6 +149,8 @@ app_ui = ui.page_fluid(
             output_widget('penguin_plot'),
             ui.span("on_hover Data: "),
             ui.output_text_verbatim('hover_info_output'),
+            ui.span("on_hover Events: "),
+            ui.output_text_verbatim('hover_event_stats'),
             ui.span("on_click Data: "),
             ui.output_text_verbatim('click_info_output'),
             ui.span("on_selection Data: "),
@@ -89,88 +159,105 @@ app_ui = ui.page_fluid(
             ui.tags.script('''
                             console.log("Initializing!"); 
                             //Shiny.setInputValue("plot_clicked","not_clicked"); 
-                            $(document).on("click", function(e){
-                                Shiny.onInputChange("ctrlPressed", e.ctrlKey);
+                            // All modifier keys in one input, for box/lasso selections (plotly sends the
+                            // device state with clicks only).  Sent on mousedown so it arrives before the
+                            // selection it belongs to, and Shiny only sends it when the state changed
+                            $(document).on("mousedown", function(e){
+                                Shiny.setInputValue("modifier_state", {ctrl: e.ctrlKey, shift: e.shiftKey, alt: e.altKey, meta: e.metaKey});
                             })
                            '''),
             ui.span("Control Key Pressed:"),
             ui.output_text_verbatim("results"),
         ),
+        ui.card( # Linked histograms
+            ui.card_header('Drag across a histogram to filter the other charts and the table'),
+            ui.layout_columns(*[output_widget(f'histogram_{column}') for column in HISTOGRAM_COLUMNS]),
+        ),
+        ui.card( # Scatter of the filtered rows
+            ui.card_header(dict_range[SCATTER_X] + ' vs ' + dict_range[SCATTER_Y] + ' (zoom in for detail, double-click to reset)'),
+            output_widget('scatter_plot'),
+            ui.output_text('scatter_info'),
+        ),
         ui.card( # Table
-            ui.card_header(ui.output_text('total_rows')),
+            ui.card_header(ui.output_text('total_rows'), row_export_ui('download_rows'), class_='d-flex justify-content-between align-items-center'),
             ui.column(
                 12, #width
-                ui.output_table('table_view'),
-                style="height:300px; overflow-y: scroll"
+                table_pager_ui('table_view', penguin_metadata['columns']), # only the visible window of rows is sent, more are fetched on scroll
             )
         )
     ),
 )
 
 def server (input, output, session):
-    
-    selection_filter=reactive.value({})
+    track_widget_payloads(session) # sizes of the figure messages, with PENGUIN_METRICS=1
+
+    cell_selection=reactive.value(None) # CellSelection of the clicked / lasso-selected bar segments, see reset_cell_selection
     click_filter=reactive.value({})
-    click_opacity=reactive.value({})
-    hover_info=reactive.value({})
+    # Hover events are throttled/debounced before they reach hover_info (and the outputs reading it)
+    hover_events=ThrottledEvents(
+        throttle=HOVER_THROTTLE,
+        debounce=HOVER_DEBOUNCE,
+        key=lambda points: (points.trace_name, tuple(points.point_inds)),
+        initial={},
+    )
+    hover_info=hover_events.value
     penguin_plot_clicked=reactive.value(False)
 
+    def ctrlPressed(state=None):
+        '''Whether ctrl was held: from the InputDeviceState plotly sends with a click, from the
+        modifier_state input for selections (and clicks that came without one)'''
+        if state is not None and state.ctrl is not None:
+            return state.ctrl
+        with reactive.isolate():
+            return 'modifier_state' in input and input.modifier_state()['ctrl']
+
     def setHoverValues(trace, points, selector):
         if not points.point_inds:
             return
-        hover_info.set(points)
-
-    def highlightBars(figWidget):
-        opacity_dict=click_opacity.get()
-        
-        # First look through all points in all tractes to see if at least one point was selected
-        any_points_clicked = False
-        if opacity_dict: # initial load will be empty
-            any_points_clicked = True in [1 in trace for trace in opacity_dict.values()]
-        # if no points were selected, reset opacity to 1 for all points
-        if any_points_clicked:
-            for trace,opacity_array in zip(figWidget.data,opacity_dict.values()):
-                trace.marker.opacity=opacity_array
+        hover_events.push(points)
+
+    def highlightBars(figWidget, columns=None):
+        # Selected segments fully opaque and the others faded, all opaque when nothing is selected.  The
+        # traces share their x values (bar_traces), so one opacity matrix covers them all.  `columns` are
+        # those x values when they are being set in the caller's batch_update (the traces still hold the old ones)
+        selection = cell_selection.get()
+        if columns is None and figWidget.data:
+            columns = figWidget.data[0].x
+        opacity = selection.opacity([trace.name for trace in figWidget.data], columns) if selection and figWidget.data else None
+        with figWidget.batch_update(): # one restyle message for all traces
+            for i, trace in enumerate(figWidget.data):
+                trace.marker.opacity = 1 if opacity is None else array(opacity[i])
+
+    def selectPoints(points, state=None):
+        '''Called once per trace for every click or selection: replaces the trace's selected segments, or
+        adds to them while ctrl is held'''
+        selection = cell_selection.get()
+        if selection is None:
+            return
+        if ctrlPressed(state):
+            selection = selection.union_row(points.trace_name, points.xs)
         else:
-            for trace in figWidget.data:
-                trace.marker.opacity=1
-
+            selection = selection.replace_row(points.trace_name, points.xs)
+        cell_selection.set(selection)
 
-    def setClickedValues(trace, points, selector):
-        inds = np.array(points.point_inds)
-        opacity_dict=click_opacity.get().copy()
-        opacity_array = np.full(len(trace.x), .2, dtype=float) # create 1d array of opacity values for elements in this trace
-        if inds.size: # if any were selected in the trace, set their opacity to 1
-            opacity_array[inds] = 1
-            #trace.marker.opacity = opacity_array        
-
-        opacity_dict[trace.name]=opacity_array
-        click_opacity.set(opacity_dict)
+    def setClickedValues(trace, points, state):
+        selectPoints(points, state)
         if not points.point_inds:
             return
     
         click_filter.set({'year':points.xs,input.category():points.trace_name})
     
     def unSelectValues(trace, points):
-        inds = points.point_inds
-        print("Deselected!!!!")
+        cell_selection.set(cell_selection.get().clear())
 
     def setSelectedValues(trace, points, selector):
-        # Pull existing values of trace filters.  We will replace them with new values
-        action_filters=selection_filter.get()
-        action_filters=action_filters.copy() # Establish a new location in memory so that it acts like an immutable object
+        selectPoints(points)
 
-        # This function is called once for every trace (For each possible value of the selected category)
-        if not points.point_inds:
-            if (points.trace_name+'year' in action_filters)&(not input.ctrlPressed()):
-                action_filters.pop(points.trace_name+'year') # If nothing was selected and Ctrl wasn't pressed, remove it's filter
-        else:
-            if ((points.trace_name+'year' in action_filters.keys())&input.ctrlPressed()):
-                action_filters[points.trace_name+'year'] = [[points.trace_name], list(set(action_filters[points.trace_name+'year'][1]+points.xs))]
-            else:
-                action_filters[points.trace_name+'year'] = [[points.trace_name], points.xs]
-        
-        selection_filter.set(action_filters) # Update reactive value with new trace filter
+    @reactive.effect
+    def reset_cell_selection():
+        '''A new, empty selection over the cube's grid of the chosen category'''
+        from common.cell_selection import CellSelection # loaded with the data by now
+        cell_selection.set(CellSelection.for_cube(penguin_cube.get(), input.category()))
 
     @reactive.calc
     def category():
@@ -183,47 +270,158 @@ def server (input, output, session):
         return "Number of Palmer Penguins by Year, colored by "+category()
 
 
+    dataset_version = data_version(live_ingest) # bumped when live ingest appended rows (always 0 otherwise)
+
+    # Slider moves are throttled/debounced before they reach the filters, so a drag doesn't re-filter on every step
+    range_events=ThrottledEvents(
+        throttle=RANGE_THROTTLE,
+        debounce=RANGE_DEBOUNCE,
+        key=lambda ranges: tuple(sorted(ranges.items())),
+        initial={},
+    )
+    slider_ranges=range_events.value # {column: (lo, hi)} of the narrowed sliders
+
+    @reactive.effect
+    @reactive.event(*[input[f'{column}_range'] for column in penguin_ranges], ignore_init=True) # the page load's values are the initial {}
+    def push_slider_ranges():
+        from common.range_index import normalized_ranges # loaded with the data by now
+        range_events.push(normalized_ranges({column: input[f'{column}_range']() for column in penguin_ranges}, penguin_ranges))
+
+    @reactive.calc
+    def filter_state():
+        '''Normalized sidebar selections, the key into the process-wide result cache'''
+        return filter_key(input.species_filter(), input.island_filter(), input.sex_filter(), ranges=slider_ranges.get())
+
+    if live_ingest is not None:
+        sent_choices = dict(penguin_choices) # the choices this session's filter checkboxes show
+
+        @reactive.effect
+        def update_filter_choices():
+            '''Add values that live ingest saw for the first time to the filter checkboxes'''
+            dataset_version()
+            for column, input_id in FILTER_INPUTS.items():
+                with reactive.isolate():
+                    update = grown_choices(sent_choices[column], live_ingest.choices[column], input[input_id]())
+                if update:
+                    choices, selected = update
+                    ui.update_checkbox_group(input_id, choices=filter_choice_labels(column, choices), selected=selected)
+                    sent_choices[column] = choices
+
     @reactive.calc
+    @timed
     def df_filtered_stage1():
         '''This function caches the filtered datframe based on selections in the view'''
-        return df_penguins[
-            (df_penguins['species'].isin(input.species_filter())) &
-            (df_penguins['island'].isin(input.island_filter())) &
-            (df_penguins['sex'].isin(input.sex_filter()))]
+        return shared_cache.get_or_compute(('filtered', dataset_version(), filter_state()), lambda: filter_penguins(
+            input.species_filter(),
+            input.island_filter(),
+            input.sex_filter(),
+            slider_ranges.get()))
+
+    @reactive.calc
+    def row_count():
+        '''Rows passing the sidebar filters (precomputed for every filter state by the warm cache)'''
+        return shared_cache.get_or_compute(('count', dataset_version(), filter_state()), lambda: len(df_filtered_stage1()))
+
+    histogram_brushes = {column: reactive.value(None) for column in HISTOGRAM_COLUMNS} # (lo, hi) value range brushed on each histogram
+    session_crossfilter = {} # the session's Crossfilter, replaced when the dataset changes
+
+    def brushed():
+        return any(brush.get() is not None for brush in histogram_brushes.values())
+
+    @reactive.calc
+    def crossfilter_index():
+        '''Sorted indexes of the linked chart dimensions, built once per dataset and shared by all sessions'''
+        from common.crossfilter import CrossfilterIndex # loaded with the data by now
+        return shared_cache.get_or_compute(('crossfilter', dataset_version()), lambda: CrossfilterIndex(
+            df_penguins.get(), penguin_cube.get(), HISTOGRAM_COLUMNS, list(penguin_ranges),
+            orders={column: order for column, (order, _) in table_pager.sort_orders.items()}))
+
+    @reactive.calc
+    @timed
+    def crossfilter():
+        '''The session's Crossfilter with the current sidebar filters, bar chart cells and histogram brushes.
+        Only the filters that changed since the last run are applied, each one incrementally'''
+        from common.crossfilter import Crossfilter
+        index = crossfilter_index()
+        cf = session_crossfilter.get('current')
+        if cf is None or cf.index is not index:
+            cf = session_crossfilter['current'] = Crossfilter(index)
+            for name, dimension in [*index.filters.items(), *index.histograms.items()]:
+                cf.add(name, dimension)
+            for column, dimension in index.ranges.items():
+                cf.add(f'range:{column}', dimension)
+        for column, input_id in FILTER_INPUTS.items():
+            cf.filter(column, index.cube.level_mask(column, input[input_id]()))
+        category = input.category()
+        if 'cells' not in cf or cf.dimension('cells') is not index.cells(category):
+            cf.add('cells', index.cells(category))
+        selection = cell_selection.get()
+        cf.filter('cells', selection.lookup_for(index.cube) if selection and selection.category == category else None)
+        ranges = slider_ranges.get()
+        for column, dimension in index.ranges.items():
+            cf.filter(f'range:{column}', dimension.closed(ranges.get(column)))
+        for column, brush in histogram_brushes.items():
+            cf.filter(column, brush.get())
+        return cf
 
     @reactive.calc
+    @timed
     def df_filtered_stage2():
-        df_filtered_st2 = df_filtered_stage1() 
         # Add additional filters on dataset from segments selected on the visual
-        action_filters=selection_filter.get()
-        if action_filters:
-            #Only run this if chart segments have been selected using the selection tool
-            result = [
-                (df_filtered_st2['species'].isin(action_filters[key][0]))&  # Species Segment Filter
-                (df_filtered_st2['year'].isin(action_filters[key][1]))  # Year Segment Filter
-                for key in action_filters.keys() # for ALL traces that registered selections
-            ]
-            ser_segment_filter = pd.DataFrame(result).any()
-            df_filtered_st2 = df_filtered_st2[ser_segment_filter]
-
-        return df_filtered_st2 
+        if brushed(): # every filter at once from the crossfilter's row masks
+            return df_penguins.get().iloc[crossfilter().positions()]
+        return select_segments(df_filtered_stage1(), cell_selection.get())
     
     @reactive.calc
+    @timed
     def df_summarized():
-        return df_filtered_stage1().groupby(['year',input.category()], as_index=False).count().rename({'body_mass_g':"count"},axis=1)[['year',input.category(),'count']]
-
+        if brushed(): # the bar chart's counts are kept up to date by the crossfilter
+            return crossfilter().summary('cells', input.category())
+        return shared_cache.get_or_compute(('summarized', dataset_version(), filter_state(), input.category()), lambda: summarize_penguins(
+            input.category(),
+            input.species_filter(),
+            input.island_filter(),
+            input.sex_filter(),
+            slider_ranges.get()))
+
+    @timed
     @render_widget
     def penguin_plot():
-        df_plot = df_summarized()
-        bar_columns = list(df_plot['year'].unique()) # x axis column labels
-        bar_segments = list(df_plot[input.category()].unique()) # bar segment category labels
-        data = [go.Bar(name=segment, x=bar_columns,y=list(df_plot[df_plot[input.category()]==segment]['count'].values), customdata=[input.category()]) for segment in bar_segments]
-        fig = go.Figure(data)
+        '''Creates the session's one FigureWidget.  The effects below patch its traces in place, so only
+        the changed trace properties (not a whole new figure) go over the websocket on each update'''
+        fig = go.Figure()
         fig.update_layout(barmode="stack")
         fig.layout.xaxis.fixedrange = True
         fig.layout.yaxis.fixedrange = True
-        figWidget = go.FigureWidget(fig)
+        figWidget = go.FigureWidget(compact_figure(fig)) # PENGUIN_PLOTLY_PAYLOAD=compact: trimmed template
+
+        #figureWidget.layout.on_change(figureChanged, figureWidget)
+
+        return figWidget
+
+    @reactive.effect
+    @timed
+    def update_penguin_plot_traces():
+        figWidget = penguin_plot.widget
+        bar_columns, bar_values = bar_traces(df_summarized(), input.category())
+        bar_segments = list(bar_values)
+
+        if [trace.name for trace in figWidget.data] == bar_segments:
+            # Same trace set: patch x/y in place (plotly only sends the properties whose values changed),
+            # and the highlight with them: the bars of a selection move when a year comes or goes
+            with figWidget.batch_update():
+                for trace in figWidget.data:
+                    trace.x = array(bar_columns)
+                    trace.y = array(bar_values[trace.name])
+                    trace.customdata = customdata([input.category()])
+                with reactive.isolate():
+                    highlightBars(figWidget, bar_columns)
+            return
 
+        # The trace set changed (filter removed/added a segment or the category switched): swap the traces
+        with figWidget.batch_update():
+            figWidget.data = []
+            figWidget.add_traces([go.Bar(name=segment, x=array(bar_columns), y=array(bar_values[segment]), customdata=customdata([input.category()])) for segment in bar_segments])
 
         for trace in figWidget.data:
             trace.on_hover(setHoverValues)
@@ -231,36 +429,180 @@ def server (input, output, session):
             trace.on_selection(setSelectedValues) 
             trace.on_deselect(unSelectValues)
 
-        highlightBars(figWidget)
-        
-        #figureWidget.layout.on_change(figureChanged, figureWidget)
+        with reactive.isolate(): # new traces start fully opaque, re-apply the current highlight
+            highlightBars(figWidget)
+
+    @reactive.effect
+    @timed
+    def update_penguin_plot_opacity():
+        '''Clicks only change marker.opacity, so they never touch the trace data'''
+        highlightBars(penguin_plot.widget)
+
+    def histogram_widget(column):
+        brush = histogram_brushes[column]
+
+        def set_brush(trace, points, selector):
+            if points.point_inds:
+                brush.set(crossfilter_index().histograms[column].bin_range(min(points.point_inds), max(points.point_inds)))
+
+        def clear_brush(trace, points):
+            brush.set(None)
+
+        @render_widget
+        def histogram():
+            '''One bar per bin, created once per dataset; update_histogram patches its heights'''
+            dimension = crossfilter_index().histograms[column]
+            edges = dimension.edges
+            fig = go.Figure(go.Bar(x=array((edges[:-1] + edges[1:]) / 2), width=array(edges[1:] - edges[:-1]), name=column))
+            fig.update_layout(dragmode='select', selectdirection='h', bargap=0, title=column, showlegend=False, height=250)
+            fig.layout.yaxis.fixedrange = True
+            figWidget = go.FigureWidget(compact_figure(fig))
+            figWidget.data[0].on_selection(set_brush)
+            figWidget.data[0].on_deselect(clear_brush)
+            return figWidget
+
+        return timed(histogram, name=f'histogram_{column}')
+
+    histograms = {column: output(id=f'histogram_{column}')(histogram_widget(column)) for column in HISTOGRAM_COLUMNS}
+
+    def histogram_updater(column):
+        @reactive.effect
+        @timed(name=f'update_histogram_{column}')
+        def update_histogram():
+            '''Bin heights from the crossfilter's incrementally kept counts, the brushed bins opaque'''
+            figWidget = histograms[column].widget
+            cf = crossfilter()
+            brush = histogram_brushes[column].get()
+            edges = cf.index.histograms[column].edges
+            centers = (edges[:-1] + edges[1:]) / 2
+            with figWidget.batch_update():
+                trace = figWidget.data[0]
+                trace.y = array(cf.counts(column))
+                trace.marker.opacity = 1 if brush is None else array(((centers >= brush[0]) & (centers < brush[1])) * 0.7 + 0.3)
+
+    for column in HISTOGRAM_COLUMNS:
+        histogram_updater(column)
+
+    scatter_viewport = reactive.value((None, None)) # (x range, y range) zoomed into on scatter_plot, None: the data's extent
+    scatter_updating = [False] # the server is setting scatter_plot's axis ranges, not the user
+
+    def setScatterViewport(viewport):
+        if not scatter_updating[0] and viewport != scatter_viewport.get():
+            scatter_viewport.set(viewport)
+
+    def zoomScatter(layout, x_range, y_range):
+        setScatterViewport((tuple(x_range) if x_range else None, tuple(y_range) if y_range else None))
+
+    def autoscaleScatter(layout, x_autorange, y_autorange):
+        x_range, y_range = scatter_viewport.get()
+        setScatterViewport((None if x_autorange is True else x_range, None if y_autorange is True else y_range))
+
+    @timed
+    @render_widget
+    def scatter_plot():
+        '''Creates the session's scatter FigureWidget; update_scatter_plot fills in the view'''
+        from common.scatter_view import SCATTER_MARGIN
+        fig = go.Figure()
+        fig.update_layout(xaxis_title=dict_range[SCATTER_X], yaxis_title=dict_range[SCATTER_Y], showlegend=False,
+                          margin=dict(SCATTER_MARGIN, autoexpand=False)) # the plot area the density grid is sized for
+        return go.FigureWidget(compact_figure(fig, trace_types=('scatter', 'scattergl'))) # see update_scatter_plot
+
+    @reactive.effect
+    def watch_scatter_zoom():
+        '''Zooming (a change of the axis ranges) asks for a new view.  Registered on the rendered widget,
+        as rendering replaces the figure's layout object (and the callbacks on it)'''
+        layout = scatter_plot.widget.layout
+        layout.on_change(zoomScatter, 'xaxis.range', 'yaxis.range')
+        layout.on_change(autoscaleScatter, 'xaxis.autorange', 'yaxis.autorange')
 
+    @reactive.calc
+    @timed
+    def scatter_view():
+        '''Points or density cells of the filtered rows in the zoomed-in ranges, at most one per cell of the plot's pixels'''
+        from common.scatter_view import ScatterView, plot_area # loaded with the data by now
+        values = penguin_backend.column_values(df_filtered_stage2(), [SCATTER_X, SCATTER_Y])
+        x_range, y_range = scatter_viewport.get()
+        width = input['.clientdata_output_scatter_plot_width']() if '.clientdata_output_scatter_plot_width' in input else 600
+        height = input['.clientdata_output_scatter_plot_height']() if '.clientdata_output_scatter_plot_height' in input else 400
+        return ScatterView(values[SCATTER_X], values[SCATTER_Y], x_range, y_range, *plot_area(width, height))
+
+    @reactive.effect
+    @timed
+    def update_scatter_plot():
+        '''Raw points in an SVG trace, density cells in a WebGL one (the trace is swapped when the mode
+        changes), with the axes pinned to the view's ranges so the cells line up with them'''
+        import numpy as np
+        from common.scatter_view import COLORBAR_THICKNESS
+        figWidget = scatter_plot.widget
+        view = scatter_view()
+        scatter_updating[0] = True
+        try:
+            with figWidget.batch_update():
+                trace_type = 'scatter' if view.mode == 'points' else 'scattergl'
+                if not figWidget.data or figWidget.data[0].type != trace_type:
+                    figWidget.data = []
+                    if view.mode == 'points':
+                        figWidget.add_trace(go.Scatter(mode='markers', marker=dict(size=5, opacity=0.6)))
+                    else:
+                        figWidget.add_trace(go.Scattergl(mode='markers', hovertemplate='%{customdata} rows<extra></extra>', marker=dict(
+                            symbol='square', colorscale='Viridis', showscale=True, colorbar=dict(
+                                title='rows', tickprefix='10^', x=1, xanchor='left', xpad=10, thickness=COLORBAR_THICKNESS)))) # in the right margin
+                trace = figWidget.data[0]
+                trace.x = array(view.x)
+                trace.y = array(view.y)
+                if view.mode == 'density':
+                    trace.customdata = array(view.counts)
+                    trace.marker.color = array(np.log10(view.counts))
+                    trace.marker.size = view.cell_px # the cells tile the plot area
+                figWidget.layout.xaxis.update(range=view.x_range, autorange=False)
+                figWidget.layout.yaxis.update(range=view.y_range, autorange=False)
+        finally:
+            scatter_updating[0] = False
+
+    @render.text
+    def scatter_info():
+        view = scatter_view()
+        drawn = 'points' if view.mode == 'points' else f'{view.cell} px density cells'
+        return f'{view.n_rows:,} rows in view, drawn as {len(view.x):,} {drawn}'
 
-        return figWidget
-    
     @render.text
     def hover_info_output():
         return hover_info.get()
 
+    @render.text
+    def hover_event_stats():
+        hover_info.get() # refresh whenever an event gets through
+        return hover_events.stats()
+
     @render.text
     def click_info_output():
         return click_filter.get()
 
     @render.text
     def selection_info_output():
-        return selection_filter.get()
+        return cell_selection.get().cells() if cell_selection.get() else []
 
     @render.text
     def total_rows():
-        return "Total Rows: "+str(df_filtered_stage2().shape[0])
+        return "Total Rows: "+str(len(df_filtered_stage2()) if cell_selection.get() or brushed() else row_count())
+
+    @render.download(filename=lambda: export_filename(input.download_rows_format()), media_type=lambda: EXPORT_FORMATS[input.download_rows_format()])
+    def download_rows():
+        '''Streams the rows the table shows, in chunks (see common/row_export.py)'''
+        return stream_export(df_filtered_stage2(), input.download_rows_format())
 
-    @render.table
+    @timed
+    @render.ui
     def table_view():
-        return df_filtered_stage2()
+        return table_pager.render(
+            df_filtered_stage2(),
+            sort_column=input.table_view_sort(),
+            descending=input.table_view_descending(),
+            offset=input.table_view_offset() if 'table_view_offset' in input else 0)
     
     @render.text
     def results():
-        return input.ctrlPressed()
+        return input.modifier_state()['ctrl']
 
-app = App(app_ui, server)
+app = with_metrics_route(App(app_ui, server)) # /metrics when PENGUIN_METRICS=1, see common/reactive_metrics.py
 
@@ -0,0 +1,158 @@
+# Static export of the express app for read-only viewers.
+#
+# Renders the app's penguin_plot figure, chart title and row count for every filter state (every subset
+# of the species, island and sex checkboxes) and every category into a directory that any plain file
+# server can serve: no Python process and no Shiny session per viewer.  The bundle is
+#
+#   index.html       the sidebar filters and category radio buttons, the chart and the row count; a
+#                    small script switches views on the client
+#   plotly.min.js    the plotly.js bundled with the plotly package, so the page needs no CDN
+#   views/*.json     one figure (without its template) + row count per view, fetched when first shown
+#
+# A view file is named after the checked boxes (one bitmask per filter, bit i for the i-th choice) and
+# the category, e.g. views/7-7-3-species.json.  The template is shared by all figures and embedded in
+# index.html once.  The table of the live app is not exported.
+#
+# Usage (from the repo root; PENGUIN_DATA etc. select the dataset as for the app):
+#   python python/plotly/express/static_export.py build/penguins-static
+#   python -m http.server --directory build/penguins-static
+import argparse
+import html
+import json
+import shutil
+import sys
+from pathlib import Path
+from string import Template
+
+sys.path.append(str(Path(__file__).resolve().parents[2])) # python/ folder, for the shared `common` package
+from app import dict_category, filter_penguins, penguin_choices, penguin_figure, summarize_penguins
+from common.plotly_payload import DEFAULT_TRACE_PROPERTIES, bar_template
+from common.startup import FILTER_COLUMNS, filter_choice_labels
+from common.warm_cache import filter_states
+
+FILTER_LABELS = {'sex': 'Gender', 'species': 'Species', 'island': 'Island'} # sidebar order and labels, as in the app
+
+PAGE = Template('''<!DOCTYPE html>
+<html lang="en">
+<head>
+<meta charset="utf-8">
+<title>Palmer Penguins Analysis</title>
+<script src="plotly.min.js"></script>
+<style>
+body { font-family: system-ui, sans-serif; margin: 1rem 2rem; color: #212529; }
+main { display: flex; gap: 1.5rem; align-items: flex-start; }
+aside { flex: 0 0 14rem; }
+fieldset { border: 1px solid #dee2e6; border-radius: .375rem; margin-bottom: 1rem; }
+label { display: block; }
+section { flex: 1; border: 1px solid #dee2e6; border-radius: .375rem; padding: .5rem 1rem; }
+#penguin_plot { height: 450px; }
+</style>
+</head>
+<body>
+<h1>Palmer Penguins Analysis</h1>
+<main>
+<aside>
+$filters
+</aside>
+<section>
+<h5 id="chart_title"></h5>
+<div id="penguin_plot"></div>
+<h5 id="total_rows"></h5>
+</section>
+</main>
+<script id="bundle" type="application/json">$bundle</script>
+<script>
+const bundle = JSON.parse(document.getElementById('bundle').textContent);
+const views = {}; // view file name -> promise of its contents
+
+function viewName() {
+  const masks = bundle.filters.map(column =>
+    [...document.querySelectorAll(`input[name="$${column}_filter"]`)].reduce((mask, box, i) => box.checked ? mask | (1 << i) : mask, 0));
+  const category = document.querySelector('input[name="category"]:checked').value;
+  return [masks.join('-') + '-' + category, category];
+}
+
+async function show() {
+  const [name, category] = viewName();
+  views[name] = views[name] || fetch(`views/$${name}.json`).then(response => response.json());
+  const view = await views[name];
+  if (viewName()[0] !== name) return; // changed again while loading
+  document.getElementById('chart_title').textContent = bundle.titles[category];
+  document.getElementById('total_rows').textContent = 'Total Rows: ' + view.rows;
+  Plotly.react('penguin_plot', view.figure.data, Object.assign({}, view.figure.layout, {template: bundle.template}), {responsive: true});
+}
+
+document.querySelectorAll('aside input').forEach(input => input.addEventListener('change', show));
+show();
+</script>
+</body>
+</html>
+''')
+
+
+def view_name(masks, category):
+    return '-'.join(str(mask) for mask in masks) + f'-{category}'
+
+
+def checkbox_group(name, label, choices, input_type='checkbox', checked=None):
+    '''Fieldset of inputs like the app's checkbox group / radio buttons; `choices` is a list or {value: label}'''
+    choices = choices if isinstance(choices, dict) else {value: value for value in choices}
+    boxes = [f'<label><input type="{input_type}" name="{name}" value="{html.escape(str(value))}"'
+             f'{" checked" if checked is None or value == checked else ""}> {html.escape(str(text))}</label>'
+             for value, text in choices.items()]
+    return f'<fieldset><legend>{html.escape(label)}</legend>\n' + '\n'.join(boxes) + '\n</fieldset>'
+
+
+def view(selected, category):
+    '''Figure (without its template) and row count of one filter state and category'''
+    species, island, sex = selected
+    figure = penguin_figure(summarize_penguins(category, species, island, sex), category).to_plotly_json()
+    figure['layout'].pop('template', None)
+    for trace in figure['data']:
+        trace.pop('customdata', None) # only read by the live app's event handlers
+        for name, default in DEFAULT_TRACE_PROPERTIES.items():
+            if trace.get(name) == default:
+                del trace[name]
+    return {'figure': figure, 'rows': len(filter_penguins(species, island, sex))}
+
+
+def export(out_dir):
+    '''Write the static bundle into out_dir; returns the number of views'''
+    from plotly.io.json import to_json_plotly
+    import plotly
+    out_dir = Path(out_dir)
+    (out_dir / 'views').mkdir(parents=True, exist_ok=True)
+    shutil.copyfile(Path(plotly.__file__).parent / 'package_data' / 'plotly.min.js', out_dir / 'plotly.min.js')
+
+    n_views = 0
+    for selected in filter_states(penguin_choices, FILTER_COLUMNS):
+        masks = [sum(1 << i for i, value in enumerate(penguin_choices[column]) if value in values)
+                 for column, values in zip(FILTER_COLUMNS, selected)]
+        for category in dict_category:
+            (out_dir / 'views' / f'{view_name(masks, category)}.json').write_text(to_json_plotly(view(selected, category)))
+            n_views += 1
+
+    filters = [checkbox_group(f'{column}_filter', label, filter_choice_labels(column, penguin_choices[column]))
+               for column, label in FILTER_LABELS.items()]
+    filters.append(checkbox_group('category', 'View Penguins by:', dict_category, input_type='radio', checked='species'))
+    bundle = {
+        'filters': list(FILTER_COLUMNS),
+        'titles': {category: 'Number of Palmer Penguins by Year, colored by ' + label for category, label in dict_category.items()},
+        'template': bar_template().to_plotly_json(),
+    }
+    page = PAGE.substitute(filters='\n'.join(filters), bundle=json.dumps(bundle).replace('</', '<\\/'))
+    (out_dir / 'index.html').write_text(page)
+    return n_views
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Export every view of the express app as a static site')
+    parser.add_argument('out_dir', help='directory to write the bundle to')
+    args = parser.parse_args()
+    n_views = export(args.out_dir)
+    size = sum(path.stat().st_size for path in Path(args.out_dir).rglob('*') if path.is_file())
+    print(f'{n_views} views written to {args.out_dir} ({size / 1e6:.1f} MB)')
+
+
+if __name__ == '__main__':
+    main()
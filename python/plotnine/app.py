@@ -5,13 +5,46 @@
 
 # Load data and compute static values
 from shiny import App, reactive, render, ui
-from plotnine import ggplot, aes, geom_bar
-import palmerpenguins
+import sys
+from pathlib import Path
+sys.path.append(str(Path(__file__).resolve().parents[1])) # python/ folder, for the shared `common` package
+from common.event_pipeline import ThrottledEvents
+from common.reactive_metrics import timed, with_metrics_route
+from common.result_cache import filter_key, shared_cache
+from common.live_ingest import FILTER_INPUTS, LiveIngest, data_version, grown_choices
+from common.startup import Deferred, dataset_metadata, filter_choice_labels
+from common.row_export import EXPORT_FORMATS, export_filename, row_export_ui, stream_export
+from common.table_pager import table_pager_ui
+import os
+
+
+# Built at import, or by the first session with PENGUIN_LAZY_STARTUP=1 (see common/startup.py)
+df_penguins = Deferred('common.data_source:load_penguins') # palmerpenguins unless PENGUIN_DATA points at another dataset
+penguin_index = Deferred('common.bitmap_index:BitmapIndex', df_penguins) # one bitset per species/island/sex/year value, built once at load
+table_pager = Deferred('common.table_pager:TablePager', df_penguins) # precomputed sort orders for the paginated table_view
+range_index = Deferred('common.range_index:RangeIndex', df_penguins, table_pager) # the pager's sort orders of the range slider columns
+penguin_backend = Deferred('common.query_backend:query_backend', df_penguins, penguin_index, None, range_index) # PENGUIN_BACKEND: pandas (bitmap and range indexes) or duckdb
+warm_cache = Deferred('common.warm_cache:load_warm_cache') # summaries and row counts of every filter state, see common/warm_cache.py
+shared_cache.attach(warm_cache) # looked up before a result is computed
+penguin_metadata = dataset_metadata() # filter choices and column names, from a cached file when possible
+penguin_choices = penguin_metadata['choices']
+penguin_ranges = penguin_metadata['ranges'] # [min, max] of each range slider column
+live_ingest = LiveIngest.from_env( # appends files dropped into PENGUIN_INGEST_DIR, None when unset
+    frame=df_penguins, index=penguin_index, pager=table_pager, ranges=range_index, backend=penguin_backend, choices=penguin_choices)
+plot_renderer = Deferred('common.plot_render:start_renderer') # PNG cache + render processes, shared by all sessions, started (and warmed) with the data
 
+dict_category = {'species':'Species','island':'Island','sex':'Gender'}
+dict_range = {'body_mass_g':'Body Mass (g)','bill_length_mm':'Bill Length (mm)','bill_depth_mm':'Bill Depth (mm)','flipper_length_mm':'Flipper Length (mm)'}
 
-df_penguins = palmerpenguins.load_penguins()
+# Range slider drags: re-filter at most once per RANGE_THROTTLE seconds, and RANGE_DEBOUNCE seconds after the slider stops
+RANGE_THROTTLE = float(os.environ.get('PENGUIN_RANGE_THROTTLE', 0.5))
+RANGE_DEBOUNCE = float(os.environ.get('PENGUIN_RANGE_DEBOUNCE', 0.3))
 
-dict_category = {'species':'Species','island':'Island','sex':'Gender'}
+# Bodies of the reactive stages, at module level so they can also run without a session (benchmarks)
+def filter_penguins(species, island, sex, ranges=None):
+    '''Rows of df_penguins that pass the sidebar filters (a lazy QueryRows with the duckdb backend);
+    `ranges` are the narrowed range sliders, {column: (lo, hi)}'''
+    return penguin_backend.filter(ranges, species=species, island=island, sex=sex)
 
 def filter_shelf():
     return ui.card(
@@ -23,25 +56,34 @@ def filter_shelf():
         ui.input_checkbox_group(
             'sex_filter', 
             label='Gender', 
-            choices={value:(value.capitalize() if (type(value)==str) else value) for value in df_penguins['sex'].unique()},
-            selected=list(df_penguins['sex'].unique()),
+            choices=filter_choice_labels('sex', penguin_choices['sex']),
+            selected=penguin_choices['sex'],
         ),
 
         # Species Filter
         ui.input_checkbox_group(
             'species_filter', 
             label='Species', 
-            choices=list(df_penguins['species'].unique()),
-            selected=list(df_penguins['species'].unique()),
+            choices=penguin_choices['species'],
+            selected=penguin_choices['species'],
         ),
 
         # Island Filter
         ui.input_checkbox_group(
             'island_filter', 
             label='Island', 
-            choices=list(df_penguins['island'].unique()),
-            selected=list(df_penguins['island'].unique()),
+            choices=penguin_choices['island'],
+            selected=penguin_choices['island'],
         ),
+
+        # Range Filters
+        *[ui.input_slider(
+            f'{column}_range',
+            label=dict_range.get(column, column),
+            min=low,
+            max=high,
+            value=(low, high),
+        ) for column, (low, high) in penguin_ranges.items()],
     )
 
 def parameter_shelf():
@@ -73,14 +115,13 @@ app_ui = ui.page_fluid(
         # Main Panel
         ui.card( # Plot
             ui.card_header(ui.output_text('chart_title')),
-            ui.output_plot('penguin_plot'),
+            ui.output_image('penguin_plot', width='100%', height='400px'),
         ),
         ui.card( # Table
-            ui.card_header(ui.output_text('total_rows')),
+            ui.card_header(ui.output_text('total_rows'), row_export_ui('download_rows'), class_='d-flex justify-content-between align-items-center'),
             ui.column(
                 12, #width
-                ui.output_table('table_view'),
-                style="height:300px; overflow-y: scroll"
+                table_pager_ui('table_view', penguin_metadata['columns']), # only the visible window of rows is sent, more are fetched on scroll
             )
         )
     ),
@@ -99,28 +140,88 @@ def server (input, output, session):
         
         return "Number of Palmer Penguins by Year, colored by "+category()
     
+    dataset_version = data_version(live_ingest) # bumped when live ingest appended rows (always 0 otherwise)
+
+    # Slider moves are throttled/debounced before they reach the filters, so a drag doesn't re-filter on every step
+    range_events=ThrottledEvents(
+        throttle=RANGE_THROTTLE,
+        debounce=RANGE_DEBOUNCE,
+        key=lambda ranges: tuple(sorted(ranges.items())),
+        initial={},
+    )
+    slider_ranges=range_events.value # {column: (lo, hi)} of the narrowed sliders
+
+    @reactive.effect
+    @reactive.event(*[input[f'{column}_range'] for column in penguin_ranges], ignore_init=True) # the page load's values are the initial {}
+    def push_slider_ranges():
+        from common.range_index import normalized_ranges # loaded with the data by now
+        range_events.push(normalized_ranges({column: input[f'{column}_range']() for column in penguin_ranges}, penguin_ranges))
+
     @reactive.calc
+    def filter_state():
+        '''Normalized sidebar selections, the key into the process-wide result cache'''
+        return filter_key(input.species_filter(), input.island_filter(), input.sex_filter(), ranges=slider_ranges.get())
+
+    if live_ingest is not None:
+        sent_choices = dict(penguin_choices) # the choices this session's filter checkboxes show
+
+        @reactive.effect
+        def update_filter_choices():
+            '''Add values that live ingest saw for the first time to the filter checkboxes'''
+            dataset_version()
+            for column, input_id in FILTER_INPUTS.items():
+                with reactive.isolate():
+                    update = grown_choices(sent_choices[column], live_ingest.choices[column], input[input_id]())
+                if update:
+                    choices, selected = update
+                    ui.update_checkbox_group(input_id, choices=filter_choice_labels(column, choices), selected=selected)
+                    sent_choices[column] = choices
+
+    @reactive.calc
+    @timed
     def df_filtered():
         '''This function caches the filtered datframe based on selections in the view'''
-        return df_penguins[
-            (df_penguins['species'].isin(input.species_filter())) &
-            (df_penguins['island'].isin(input.island_filter())) &
-            (df_penguins['sex'].isin(input.sex_filter()))]
-
-    @render.plot
-    def penguin_plot():
-        return (
-            ggplot(df_filtered(), aes(x='year', fill=input.category())) 
-            + geom_bar()
-            )
+        return shared_cache.get_or_compute(('filtered', dataset_version(), filter_state()), lambda: filter_penguins(
+            input.species_filter(),
+            input.island_filter(),
+            input.sex_filter(),
+            slider_ranges.get()))
+
+    @reactive.calc
+    def row_count():
+        '''Rows passing the sidebar filters (precomputed for every filter state by the warm cache)'''
+        return shared_cache.get_or_compute(('count', dataset_version(), filter_state()), lambda: len(df_filtered()))
+
+    @timed
+    @render.image(delete_file=True)
+    async def penguin_plot():
+        '''Rendered off the event loop (and cached across sessions), so a slow render doesn't stall other users'''
+        return await plot_renderer.render(
+            filter_state(),
+            input.category(),
+            input['.clientdata_output_penguin_plot_width'](),
+            input['.clientdata_output_penguin_plot_height'](),
+            input['.clientdata_pixelratio'](),
+            version=dataset_version(),
+            df=penguin_backend.materialize(df_filtered()) if live_ingest is not None else None) # the render workers only load the base data
 
     @render.text
     def total_rows():
-        return "Total Rows: "+str(df_filtered().shape[0])
+        return "Total Rows: "+str(row_count())
+
+    @render.download(filename=lambda: export_filename(input.download_rows_format()), media_type=lambda: EXPORT_FORMATS[input.download_rows_format()])
+    def download_rows():
+        '''Streams the rows the table shows, in chunks (see common/row_export.py)'''
+        return stream_export(df_filtered(), input.download_rows_format())
 
-    @render.table
+    @timed
+    @render.ui
     def table_view():
-        return df_filtered()
+        return table_pager.render(
+            df_filtered(),
+            sort_column=input.table_view_sort(),
+            descending=input.table_view_descending(),
+            offset=input.table_view_offset() if 'table_view_offset' in input else 0)
 
-app = App(app_ui, server)
+app = with_metrics_route(App(app_ui, server)) # /metrics when PENGUIN_METRICS=1, see common/reactive_metrics.py
 